@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+'''Benchmark comparing the line by line parsing of names.dmp (utils.read_line
+and a Python sort) with the chunked C parser path of ncbi_tax.read_dmp_file.
+Each variant runs in a fresh process to measure its peak memory (max RSS).'''
+
+import argparse
+import os
+import sys
+import time
+import random
+import string
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+HEADER = ['tax_id', 'name_txt', 'unique name', 'name class']
+CLASSES = ['scientific name', 'synonym', 'authority', 'type material', 'includes']
+
+def write_names_dmp(file_name:str, rows:int, seed:int = 1) -> None:
+    '''Writes a synthetic names.dmp file with the given number of rows.'''
+    rng = random.Random(seed)
+    with open(file_name, 'w', encoding='utf-8') as w:
+        for i in range(rows):
+            genus = rng.choice(string.ascii_letters) + ''.join(rng.choices(string.ascii_lowercase, k=8))
+            species = ''.join(rng.choices(string.ascii_lowercase, k=9))
+            name = f'{genus} {species}'
+            if i % 7 == 0:
+                name += f' strain {rng.randint(1, 99999)}'
+            if i % 50 == 0:
+                name = f'"{name}"'
+            w.write(f'{i+1}\t|\t{name}\t|\t\t|\t{rng.choice(CLASSES)}\t|\n')
+
+def parse_legacy(file_name:str) -> int:
+    import pandas as pd
+    import utils
+    with open(file_name, encoding='utf=8') as t:
+        taxa = t.readlines()
+    for i, value in enumerate(taxa):
+        taxa[i] = utils.read_line(taxa[i])
+    taxa.sort(key = lambda row: row[1].lower())
+    return len(pd.DataFrame(taxa, columns=HEADER))
+
+def parse_vectorized(file_name:str) -> int:
+    import ncbi_tax
+    taxa = ncbi_tax.read_dmp_file(file_name, HEADER)
+    keys = taxa['name_txt'].str.lower().tolist()
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    del keys
+    return len(taxa.take(order).reset_index(drop=True))
+
+def run(variant:str, file_name:str, queue) -> None:
+    func = parse_legacy if variant == 'legacy' else parse_vectorized
+    start = time.perf_counter()
+    rows = func(file_name)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    queue.put((variant, rows, elapsed, peak))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark names.dmp parsing.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of rows of the synthetic names.dmp file. Default is 1000000.')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        file_name = os.path.join(folder, 'names.dmp')
+        write_names_dmp(file_name, args.rows)
+        print(f'variant\trows\ttime(s)\tpeak_rss(MB)')
+        for variant in ['legacy', 'vectorized']:
+            queue = ctx.Queue()
+            process = ctx.Process(target=run, args=(variant, file_name, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print(f'{result[0]}\t{result[1]}\t{result[2]:.2f}\t{result[3]:.0f}')
+
+if __name__ == "__main__":
+    main()
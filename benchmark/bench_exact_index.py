@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''Benchmark comparing the exact-match lookups of a dictionary of all names
+(built at every start, as done before) with the ExactIndex persisted in the
+taxa store. Reports the build time and size of the index, and for each
+variant the load time, the memory it adds and the lookups per second.
+Each variant runs in a fresh process.'''
+
+import argparse
+import os
+import sys
+import time
+import random
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ncbi_tax
+import taxa_store
+import utils
+from bench_dmp_parsing import HEADER, write_names_dmp
+
+def run(variant:str, folder:str, queries:list, queue) -> None:
+    store = taxa_store.TaxaStore(folder)
+    before = utils.get_rss()
+    start = time.perf_counter()
+    if variant == 'dict':
+        index = dict(zip(store.names().values, range(len(store))))
+    else:
+        index = store.exact_index()
+    load = time.perf_counter() - start
+    memory = utils.get_rss() - before
+
+    start = time.perf_counter()
+    rows = [index.get(name) for name in queries]
+    rate = len(queries) / (time.perf_counter() - start)
+    queue.put((variant, load, memory, rate, rows))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark exact name lookups.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of rows of the synthetic names.dmp file. Default is 1000000.')
+    parser.add_argument('--queries', type=int, default=200000,
+                        help='Number of names looked up, half of them not in the store. Default is 200000.')
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as folder:
+        file_name = os.path.join(folder, 'names.dmp')
+        write_names_dmp(file_name, args.rows)
+        taxa = ncbi_tax.read_dmp_file(file_name, HEADER)
+        taxa = taxa.iloc[taxa['name_txt'].str.lower().argsort(kind='stable')].reset_index(drop=True)
+        taxa_store.write_store(folder, taxa)
+
+        names = taxa['name_txt'].tolist()
+        start = time.perf_counter()
+        taxa_store.build_exact_index(names)
+        build = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(taxa_store.store_path(folder), f'exact_{key}.npy'))
+                   for key in ['hashes', 'rows'])
+        print(f'exact index: build {build:.2f} s, size {size/1024**2:.1f} MB\n')
+
+        rng = random.Random(1)
+        queries = [rng.choice(names) if i % 2 else rng.choice(names)+' x' for i in range(args.queries)]
+
+        print(f'variant\tload(s)\tmemory(MB)\tlookups/s')
+        results = {}
+        for variant in ['dict', 'exact_index']:
+            queue = ctx.Queue()
+            process = ctx.Process(target=run, args=(variant, folder, queries, queue))
+            process.start()
+            variant, load, memory, rate, results[variant] = queue.get()
+            process.join()
+            print(f'{variant}\t{load:.2f}\t{memory:.0f}\t{rate:.0f}')
+        print(f'\nequal results: {results["dict"] == results["exact_index"]}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+'''Benchmark of the fuzzy search of short names (genus names), for which
+every species and strain name of the genus contains the query and is a
+candidate, comparing TaxonomySearcher.search_approximate with the
+exhaustive scoring of all candidates against all query variants (as done
+before candidates were pruned by their length). Checks that both give the
+same results and reports names per second and candidates scored.
+
+    python benchmark/bench_length_pruning.py --species 100000 --species_per_genus 200
+'''
+
+import argparse
+import os
+import sys
+import time
+import random
+import tempfile
+import contextlib
+import numpy as np
+from rapidfuzz import fuzz, process
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import synthetic_dump
+import search_name
+import ncbi_tax
+import profiling
+
+def exhaustive_search_approximate(self, query, subset, word, matches=None):
+    '''search_approximate scoring every candidate against every variant.'''
+    profile = self.profile
+    lap = time.perf_counter()
+    matching_indices = self.find_matches(subset, word) if matches is None else matches
+    upper_names = self.get_upper(subset)
+    start = subset.index.start
+
+    candidates = matching_indices.tolist()
+    if query.viral:
+        candidates = [idx for idx in candidates if any(v in upper_names[idx-start]
+            for v in ['VIRAL', 'VIRUS', 'VIRIDAE', 'PHAGE', 'BACTERIOPHAGE'])]
+    lap = profile.lap('scan', lap)
+    if len(candidates) == 0:
+        return
+
+    variants = query.get_variants(word)
+    present = [i for i, v in enumerate(variants) if v is not None]
+    scores = np.zeros((len(variants), len(candidates)))
+    scores[present] = process.cdist([variants[i] for i in present],
+                                    [upper_names[idx-start] for idx in candidates],
+                                    scorer=fuzz.ratio, score_cutoff=self.limit,
+                                    dtype=np.float64)
+    profile.count('candidates_scored', len(candidates) * len(present))
+    profile.lap('score', lap)
+
+    for i in range(len(variants)):
+        best = int(np.argmax(scores[i]))
+        if scores[i][best] > self.limit:
+            best_candidate = candidates[best]
+            if self.taxa_df.dup[best_candidate] == 0:
+                query.update(self.taxa_df.row(best_candidate), float(scores[i][best]))
+            else:
+                homonyms = [self.taxa_df.tax_id[i] for i in self.taxa_df.homonyms(best_candidate)]
+                query.comment = 'HOMONYM - multiple entries found: {}'.format(', '.join([str(tid) for tid in homonyms]))
+            break
+
+def short_queries(nodes:list, names:list, count:int, seed:int) -> list:
+    '''Returns (name, mode) pairs: misspelled genus names (relaxed) and genus
+    names with species, clone and accession suffixes shaved down to the
+    genus (lenient).'''
+    rng = random.Random(seed)
+    genus_ids = {tax_id for tax_id, _, rank in nodes if rank == 'genus'}
+    genera = sorted({name for tax_id, name, _, name_class in names
+                     if tax_id in genus_ids and name_class == 'scientific name' and 'virus' not in name})
+    queries = []
+    for i in range(count):
+        genus = rng.choice(genera)
+        if i % 2 == 0:
+            queries.append((synthetic_dump.misspell(rng, genus), 'relaxed'))
+        else:
+            queries.append((f'{genus}_sp._clone_{rng.randint(1, 99)}_{synthetic_dump.accession(rng)}', 'lenient'))
+    return queries
+
+def run(searcher, queries:list) -> tuple:
+    '''Searches queries, returns the results, names per second, the
+    number of candidate scorings per name and the milliseconds per name
+    spent on scanning and on scoring candidates.'''
+    search_name.TaxonomySearcher.profile = profiling.SearchProfile()
+    start = time.perf_counter()
+    results = [search_name.process_name((name, mode, searcher))[1][:9] for name, mode in queries]
+    rate = len(queries) / (time.perf_counter() - start)
+    profile = search_name.TaxonomySearcher.profile.summary()['per_query']
+    search_name.TaxonomySearcher.profile = None
+    return results, rate, profile['candidates_scored'], profile['scan_ms'], profile['score_ms']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the fuzzy search of short names.')
+    parser.add_argument('--species', type=int, default=100000,
+                        help='Number of species of the synthetic taxonomy. Default is 100000.')
+    parser.add_argument('--species_per_genus', type=int, default=200,
+                        help='Average number of species per genus, i.e. of candidates of \
+                            a genus name. Default is 200.')
+    parser.add_argument('--queries', type=int, default=500, help='Number of query names. Default is 500.')
+    parser.add_argument('--score', type=float, default=95, help='Minimal matching score. Default is 95.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random generator. Default is 1.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        nodes, names = synthetic_dump.generate_taxonomy(args.species, args.seed,
+                                                         species_per_genus=args.species_per_genus)
+        synthetic_dump.write_dump(folder, nodes, names, seed=args.seed)
+        with contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8')):
+            taxa_df, list_index = ncbi_tax.get_taxa(folder)
+        search_name.TaxonomySearcher.initialize(taxa_df, list_index, taxa_df.exact_index(), args.score)
+        searcher = search_name.TaxonomySearcher('ncbi')
+        queries = short_queries(nodes, names, args.queries, args.seed)
+
+        # Warm up the cached subsets and upper case names
+        run(searcher, queries)
+        pruned, *pruned_stats = run(searcher, queries)
+        search_approximate = search_name.TaxonomySearcher.search_approximate
+        search_name.TaxonomySearcher.search_approximate = exhaustive_search_approximate
+        try:
+            exhaustive, *exhaustive_stats = run(searcher, queries)
+        finally:
+            search_name.TaxonomySearcher.search_approximate = search_approximate
+
+    assert pruned == exhaustive, 'length pruning changed the results'
+    found = sum(result[1] is not None for result in pruned)
+    print(f'{len(queries)} short names, {found} found, identical results')
+    for variant, (rate, scored, scan, score) in [('exhaustive', exhaustive_stats), ('pruned', pruned_stats)]:
+        print(f'{variant}\t{rate:.0f} names/s\t{scored:.0f} scorings/name\t'
+              f'scan {scan:.3f} ms/name\tscore {score:.3f} ms/name')
+    print(f'speedup\t{pruned_stats[0]/exhaustive_stats[0]:.2f}x names/s\t'
+          f'{exhaustive_stats[3]/max(pruned_stats[3], 1e-9):.1f}x scoring')
+
+if __name__ == "__main__":
+    main()
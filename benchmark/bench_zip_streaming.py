@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+'''Benchmark comparing reading names.dmp after extracting taxdmp.zip to disk
+(shutil.unpack_archive, as done before) with streaming the member straight
+out of the archive via ncbi_tax.open_dump_member. Reports the wall-clock
+time and the bytes written to disk by each variant.'''
+
+import argparse
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ncbi_tax
+from bench_dmp_parsing import HEADER, write_names_dmp
+
+def folder_size(folder:str) -> int:
+    '''Returns the total size in bytes of all files below folder.'''
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(folder) for name in names)
+
+def read_extracted(folder:str) -> tuple:
+    start = time.perf_counter()
+    shutil.unpack_archive(filename=os.path.join(folder, 'taxdmp.zip'),
+                          extract_dir=os.path.join(folder, 'taxdmp'))
+    taxa = ncbi_tax.read_dmp_file(os.path.join(folder, 'taxdmp', 'names.dmp'), HEADER)
+    elapsed = time.perf_counter() - start
+    written = folder_size(os.path.join(folder, 'taxdmp'))
+    shutil.rmtree(os.path.join(folder, 'taxdmp'))
+    return len(taxa), elapsed, written
+
+def read_streamed(folder:str) -> tuple:
+    start = time.perf_counter()
+    with ncbi_tax.open_dump_member(folder, 'names.dmp') as dmp:
+        taxa = ncbi_tax.read_dmp_file(dmp, HEADER)
+    return len(taxa), time.perf_counter() - start, 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reading names.dmp from taxdmp.zip.')
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of rows of the synthetic names.dmp file. Default is 1000000.')
+    parser.add_argument('--extra_mb', type=int, default=200,
+                        help='Size in MB of an additional member that is never read \
+                            (the real dump ships several). Default is 200.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        names_file = os.path.join(folder, 'names.dmp')
+        write_names_dmp(names_file, args.rows)
+        with zipfile.ZipFile(os.path.join(folder, 'taxdmp.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.write(names_file, 'names.dmp')
+            archive.writestr('images.dmp', os.urandom(1024*1024) * args.extra_mb)
+        os.remove(names_file)
+
+        print(f'variant\trows\ttime(s)\twritten(MB)')
+        for variant, func in [('extracted', read_extracted), ('streamed', read_streamed)]:
+            rows, elapsed, written = func(folder)
+            print(f'{variant}\t{rows}\t{elapsed:.2f}\t{written/1024**2:.0f}')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+'''Benchmark runner measuring the whole pipeline on a synthetic taxonomy
+(see synthetic_dump.py): database build, startup, names per second of the
+strict, relaxed and lenient search for each number of cores, and lineage
+throughput of LineageResolver and search_nodes. The results are written
+as JSON together with the git commit, so that two commits can be compared
+with --compare.
+
+    python benchmark/run_benchmarks.py --species 100000 --output new.json --compare old.json
+'''
+
+import argparse
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import synthetic_dump
+
+# Results where a larger value is better (all others are times)
+RATES = ('names_per_s', 'tax_ids_per_s')
+
+def quiet():
+    '''Context manager hiding the progress output of the pipeline.'''
+    return contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8'))
+
+def git_commit() -> str | None:
+    '''Returns the current git commit of the repository, None if unknown.'''
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_db(folder:str, queue) -> None:
+    import ncbi_tax
+    with quiet():
+        start = time.perf_counter()
+        ncbi_tax.get_taxa(folder)
+        taxa = time.perf_counter() - start
+        start = time.perf_counter()
+        ncbi_tax.get_node_arrays(folder)
+        nodes = time.perf_counter() - start
+    queue.put({'build_taxa_s': taxa, 'build_nodes_s': nodes})
+
+def startup(folder:str, score:float, queue) -> None:
+    start = time.perf_counter()
+    import search_name
+    import ncbi_tax
+    with quiet():
+        taxa_df, list_index = ncbi_tax.get_taxa(folder)
+        search_name.TaxonomySearcher.initialize(taxa_df, list_index, taxa_df.exact_index(), score)
+        searcher = search_name.TaxonomySearcher('ncbi')
+        search_name.process_name(('Homo sapiens', 'strict', searcher))
+    queue.put({'startup_s': time.perf_counter() - start})
+
+def run_fresh(target, *args) -> dict:
+    '''Runs target(*args, queue) in a fresh process, returns its result.'''
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def search(folder:str, queries:list, mode:str, cores:int, score:float) -> tuple:
+    '''Searches queries as the command line interface does: exact search
+    first, the names not found in mode with a pool of cores workers.
+    Returns names per second and the number of names found.'''
+
+    import search_name
+    import ncbi_tax
+    with quiet():
+        taxa_df, list_index = ncbi_tax.get_taxa(folder)
+    search_name.TaxonomySearcher.initialize(taxa_df, list_index, taxa_df.exact_index(), score)
+    searcher = search_name.TaxonomySearcher('ncbi')
+
+    start = time.perf_counter()
+    results = [search_name.process_name((name, 'strict', searcher)) for name in queries]
+    failed = [result[1][0] for result in results if result[0] is None]
+    found = len(queries) - len(failed)
+    if mode != 'strict' and failed:
+        ctx = multiprocessing.get_context()
+        with ctx.Pool(cores, initializer=search_name.init_worker, initargs=(folder, score)) as pool:
+            groups = search_name.group_names(failed) if mode == 'lenient' else ([name] for name in failed)
+            found += sum(result[0] is not None for results, _ in
+                         pool.imap(search_name.process_group, ((group, mode) for group in groups))
+                         for result in results)
+    return len(queries) / (time.perf_counter() - start), found
+
+def lineages(folder:str, tax_ids:list, sample:int) -> dict:
+    '''Measures the lineages per second of LineageResolver (all tax_ids)
+    and of search_nodes (the first sample tax_ids).'''
+
+    import ncbi_tax
+    import get_lineage
+    ranks = [get_lineage.REDUCED_RANKS, get_lineage.MINIMAL_RANKS]
+    results = {}
+    with quiet():
+        nodes = ncbi_tax.get_node_arrays(folder)
+        for mode in ['full', 'minimal']:
+            resolver = get_lineage.LineageResolver(nodes, ranks)
+            start = time.perf_counter()
+            resolver.resolve(tax_ids, mode)
+            results[f'lineage_resolver_{mode}_tax_ids_per_s'] = len(tax_ids) / (time.perf_counter() - start)
+
+        nodes_df = ncbi_tax.get_nodes(folder)
+        start = time.perf_counter()
+        for tax_id in tax_ids[:sample]:
+            get_lineage.search_nodes(tax_id, nodes_df, ranks, 'full')
+        results['lineage_search_nodes_full_tax_ids_per_s'] = sample / (time.perf_counter() - start)
+    return results
+
+def compare(results:dict, previous:dict):
+    '''Prints the ratio of each result to the one of a previous run
+    (above 1 means faster now).'''
+
+    print(f'\nComparison with {previous.get("commit")}:')
+    for key, value in results['results'].items():
+        old = previous['results'].get(key)
+        if not old or not value or key.endswith('_found'):
+            continue
+        speedup = value / old if key.endswith(RATES) else old / value
+        print(f'{key}\t{old:.4g}\t{value:.4g}\t{speedup:.2f}x')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline on a synthetic taxonomy.')
+    parser.add_argument('--species', type=int, default=100000,
+                        help='Number of species of the synthetic taxonomy. Default is 100000.')
+    parser.add_argument('--queries', type=int, default=2000,
+                        help='Number of query names per search mode. Default is 2000.')
+    parser.add_argument('--cores', type=int, nargs='+', default=[1, 2],
+                        help='Numbers of cores to measure relaxed and lenient search with. Default is 1 2.')
+    parser.add_argument('--score', type=float, default=95, help='Minimal matching score. Default is 95.')
+    parser.add_argument('--lineage_sample', type=int, default=2000,
+                        help='Number of tax IDs resolved with search_nodes. Default is 2000.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random generator. Default is 1.')
+    parser.add_argument('--output', type=str, default='benchmark_results.json',
+                        help='JSON file to write the results to. Default is benchmark_results.json.')
+    parser.add_argument('--compare', type=str, default=None,
+                        help='JSON file of a previous run to compare the results with.')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        nodes, names = synthetic_dump.generate_taxonomy(args.species, args.seed)
+        synthetic_dump.write_dump(folder, nodes, names, seed=args.seed)
+        queries = synthetic_dump.query_names(names, args.queries, args.seed)
+
+        results.update(run_fresh(build_db, folder))
+        results.update(run_fresh(startup, folder, args.score))
+
+        for mode in ['strict', 'relaxed', 'lenient']:
+            for cores in ([1] if mode == 'strict' else args.cores):
+                rate, found = search(folder, queries, mode, cores, args.score)
+                results[f'{mode}_{cores}_cores_names_per_s'] = rate
+                results[f'{mode}_{cores}_cores_found'] = found
+                print(f'{mode} search with {cores} cores: {rate:.0f} names/s, {found} found', flush=True)
+
+        tax_ids = [node[0] for node in nodes]
+        random.Random(args.seed).shuffle(tax_ids)
+        results.update(lineages(folder, tax_ids, args.lineage_sample))
+
+    output = {'commit': git_commit(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+              'params': vars(args), 'nodes': len(nodes), 'names': len(names), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as w:
+        json.dump(output, w, indent=2)
+
+    print()
+    for key, value in results.items():
+        print(f'{key}\t{value:.4g}')
+    print(f'\nResults were written into {args.output}.')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as t:
+            compare(output, json.load(t))
+
+if __name__ == "__main__":
+    main()
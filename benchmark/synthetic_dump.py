@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+'''Generator of a synthetic NCBI taxonomy dump (taxdmp.zip with names.dmp,
+nodes.dmp, merged.dmp and delnodes.dmp) and of noisy query names, used by
+run_benchmarks.py to measure the pipeline without a real download.
+
+The taxonomy is a random tree with the ranks of the NCBI taxonomy (plus
+"clade" nodes, some lineages are made deep), a virus branch, homonymous
+genera, synonyms, authorities and environmental ("uncultured") names.
+Query names mimic real inputs: exact names, case/underscore/quote
+variants, misspellings, accession and clone suffixes (e.g.
+345_uncultured_eukaryote_SLV_3GJ1_11_KT072099), viral strain names and
+names not in the taxonomy. All output is reproducible from the seed.'''
+
+import argparse
+import os
+import random
+import string
+import zipfile
+
+# Ranks from the top of the tree to the leaves. Each level holds more
+# nodes than the one above; "clade" levels are only inserted into some
+# lineages (see DEEP_CLADES).
+RANKS = ['superkingdom', 'kingdom', 'phylum', 'subphylum', 'class', 'subclass',
+         'order', 'suborder', 'superfamily', 'family', 'subfamily', 'tribe',
+         'genus', 'species', 'strain']
+SUFFIXES = {'phylum': 'ota', 'subphylum': 'otina', 'class': 'ia', 'subclass': 'idae',
+            'order': 'ales', 'suborder': 'ineae', 'superfamily': 'oidea', 'family': 'aceae',
+            'subfamily': 'oideae', 'tribe': 'eae', 'kingdom': 'a'}
+SYLLABLES = ['ba', 'cil', 'lus', 'my', 'co', 'bac', 'te', 'ri', 'um', 'strep', 'to',
+             'pseu', 'do', 'mo', 'nas', 'a', 'can', 'tho', 'tre', 'ma', 'rhi', 'zo',
+             'phy', 'lo', 'ae', 'gas', 'ter', 'chla', 'my', 'dia', 'ne', 'ur', 'on',
+             'sal', 'mo', 'el', 'la', 'xan', 'thi', 'fu', 'sa', 'ri', 'or', 'us']
+VIRUS_WORDS = ['virus', 'phage', 'satellite virus', 'associated virus']
+# Number of consecutive "clade" nodes inserted above a deep lineage
+DEEP_CLADES = 12
+
+def latin_word(rng:random.Random, syllables:int = 3) -> str:
+    '''Returns a random pseudo-Latin word in lower case.'''
+    return ''.join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+def accession(rng:random.Random) -> str:
+    '''Returns a random GenBank-like accession number.'''
+    return ''.join(rng.choices(string.ascii_uppercase, k=2)) + str(rng.randint(100000, 999999))
+
+def generate_taxonomy(species:int, seed:int = 1, homonyms:float = 0.01,
+                      deep:float = 0.05, viral:float = 0.1, species_per_genus:int = 4) -> tuple:
+    '''
+    Function to generate a synthetic taxonomy tree.
+
+    Parameters
+    ----------
+    species : int
+        Number of species; the other levels are scaled accordingly (in
+        total about 1.8 times as many nodes as species).
+    seed : int
+        Seed of the random generator.
+    homonyms : float
+        Fraction of genera sharing their name with another genus.
+    deep : float
+        Fraction of families placed below a chain of DEEP_CLADES clades.
+    viral : float
+        Fraction of species placed in the virus branch.
+    species_per_genus : int
+        Average number of species per genus.
+
+    Returns
+    ----------
+    nodes : list
+        (tax_id, parent_tax_id, rank) of every node, root first.
+    names : list
+        (tax_id, name, unique name, name class) of every name.
+    '''
+
+    rng = random.Random(seed)
+    nodes = [(1, 1, 'no rank')]
+    names = [(1, 'root', '', 'scientific name')]
+    next_id = [2]
+
+    def add(parent:int, rank:str, name:str) -> int:
+        tax_id = next_id[0]
+        next_id[0] += 1
+        nodes.append((tax_id, parent, rank))
+        names.append((tax_id, name, '', 'scientific name'))
+        return tax_id
+
+    cellular = add(1, 'no rank', 'cellular organisms')
+    viruses = add(1, 'superkingdom', 'Viruses')
+
+    # Level sizes grow geometrically from 3 superkingdoms to the genera
+    genera = max(3, species // species_per_genus)
+    levels = RANKS.index('genus')
+    sizes = [max(1, round(3 * (genera / 3) ** (i / levels))) for i in range(levels + 1)]
+
+    parents = [cellular]
+    genus_names = []
+    for rank, size in zip(RANKS[:levels + 1], sizes):
+        level = []
+        for i in range(size):
+            parent = parents[i % len(parents)] if i < len(parents) else rng.choice(parents)
+            if rank == 'family' and rng.random() < deep:
+                for _ in range(DEEP_CLADES):
+                    parent = add(parent, 'clade', latin_word(rng).capitalize() + 'ida')
+            if rank == 'genus':
+                if genus_names and rng.random() < homonyms:
+                    name = rng.choice(genus_names)
+                else:
+                    name = latin_word(rng).capitalize()
+                genus_names.append(name)
+            else:
+                name = (latin_word(rng) + SUFFIXES.get(rank, '')).capitalize()
+            level.append(add(parent, rank, name))
+        parents = level
+    genus_ids = parents
+
+    # Virus branch: families and genera below Viruses
+    virus_families = [add(viruses, 'family', latin_word(rng).capitalize() + 'viridae')
+                      for _ in range(max(1, genera // 50))]
+    virus_genera = [add(rng.choice(virus_families), 'genus', latin_word(rng).capitalize() + 'virus')
+                    for _ in range(max(1, genera // 20))]
+
+    species_ids = []
+    for _ in range(species):
+        if rng.random() < viral:
+            parent = rng.choice(virus_genera)
+            name = f'{latin_word(rng).capitalize()} {latin_word(rng, 2)} {rng.choice(VIRUS_WORDS)}'
+            if rng.random() < 0.3:
+                name += f' {rng.randint(1, 20)}'
+            species_ids.append(add(parent, 'species', name))
+            continue
+
+        parent = rng.choice(genus_ids)
+        genus = names[parent - 1][1]
+        if rng.random() < 0.15:
+            name = f'{genus} sp. {accession(rng)}'
+        elif rng.random() < 0.05:
+            name = f'uncultured {genus} sp.'
+        else:
+            name = f'{genus} {latin_word(rng)}'
+        tax_id = add(parent, 'species', name)
+        species_ids.append(tax_id)
+
+        # Further names of the species
+        if rng.random() < 0.1:
+            names.append((tax_id, f'{genus} {latin_word(rng)}', '', 'synonym'))
+        if rng.random() < 0.2:
+            author = latin_word(rng, 2).capitalize()
+            names.append((tax_id, f'{name} {author}, {rng.randint(1758, 2024)}', '', 'authority'))
+        if rng.random() < 0.02:
+            names.append((tax_id, f'{genus} {latin_word(rng)} {accession(rng)}', '', 'type material'))
+
+    for _ in range(species // 4):
+        parent = rng.choice(species_ids)
+        add(parent, 'strain', f'{names[parent - 1][1]} strain {accession(rng)}')
+
+    # Environmental names as found in the real dump
+    for word in ['eukaryote', 'bacterium', 'archaeon', 'fungus']:
+        add(cellular, 'species', f'uncultured {word}')
+
+    return nodes, names
+
+def write_dump(folder:str, nodes:list, names:list, merged:int = 100, deleted:int = 100, seed:int = 1):
+    '''
+    Function to write taxdmp.zip holding names.dmp, nodes.dmp, merged.dmp
+    and delnodes.dmp in the format of the NCBI taxonomy dump. merged old
+    tax IDs are redirected to random existing nodes, deleted tax IDs lie
+    beyond the generated ones. nodes.dmp has all 13 fields of the NCBI
+    dump, the ones not generated hold fixed filler values.
+    '''
+
+    rng = random.Random(seed)
+    last = nodes[-1][0]
+    tax_ids = [node[0] for node in nodes[1:]]
+    with zipfile.ZipFile(os.path.join(folder, 'taxdmp.zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('names.dmp', ''.join(f'{tax_id}\t|\t{name}\t|\t{unique}\t|\t{name_class}\t|\n'
+                                              for tax_id, name, unique, name_class in names))
+        # embl code, division id, inherited div flag, genetic code id,
+        # inherited GC flag, mitochondrial genetic code id, inherited MGC
+        # flag, GenBank hidden flag, hidden subtree root flag, comments
+        filler = '\t|\t'.join(['', '0', '1', '11', '1', '0', '1', '0', '0', ''])
+        archive.writestr('nodes.dmp', ''.join(f'{tax_id}\t|\t{parent}\t|\t{rank}\t|\t{filler}\t|\n'
+                                              for tax_id, parent, rank in nodes))
+        archive.writestr('merged.dmp', ''.join(f'{last + 1 + i}\t|\t{rng.choice(tax_ids)}\t|\n'
+                                               for i in range(merged)))
+        archive.writestr('delnodes.dmp', ''.join(f'{last + 1 + merged + i}\t|\n' for i in range(deleted)))
+
+def misspell(rng:random.Random, name:str) -> str:
+    '''Returns name with one letter (not the first) replaced, dropped or doubled.'''
+    i = rng.randrange(1, len(name))
+    kind = rng.randrange(3)
+    if kind == 0:
+        return name[:i] + rng.choice(string.ascii_lowercase) + name[i+1:]
+    if kind == 1:
+        return name[:i] + name[i+1:]
+    return name[:i] + name[i] + name[i:]
+
+def query_names(names:list, count:int, seed:int = 1) -> list:
+    '''
+    Function to draw count noisy query names from the names of a
+    (synthetic) taxonomy: about 30% exact names, 10% case, underscore or
+    quote variants, 20% misspellings, 20% names with accession or clone
+    suffixes, 10% viral strain names and 10% names not in the taxonomy.
+    '''
+
+    rng = random.Random(seed)
+    scientific = [name for _, name, _, name_class in names if name_class == 'scientific name']
+    binomials = [name for name in scientific if ' ' in name]
+    viral = [name for name in binomials if 'virus' in name or 'phage' in name] or binomials
+
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        name = rng.choice(binomials)
+        if kind < 0.3:
+            queries.append(rng.choice(scientific))
+        elif kind < 0.4:
+            variant = rng.choice([name.replace(' ', '_'), name.upper(), f'"{name}"', name.replace(' ', '  ')])
+            queries.append(variant)
+        elif kind < 0.6:
+            queries.append(misspell(rng, name))
+        elif kind < 0.7:
+            # e.g. 345_uncultured_eukaryote_SLV_3GJ1_11_KT072099
+            words = name.split(' ')[:2]
+            queries.append(f'{rng.randint(1, 999)}_uncultured_{"_".join(words)}_'
+                           f'{latin_word(rng, 1).upper()}_{rng.randint(1, 9)}{accession(rng)[:3]}_'
+                           f'{rng.randint(1, 99)}_{accession(rng)}')
+        elif kind < 0.8:
+            queries.append(f'{name.replace(" ", "_")}_clone_{rng.choice(string.ascii_uppercase)}'
+                           f'{rng.randint(1, 999)}_{accession(rng)}')
+        elif kind < 0.9:
+            queries.append(f'{rng.choice(viral)} strain {accession(rng)}')
+        else:
+            queries.append(f'{latin_word(rng).capitalize()} {latin_word(rng)}')
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic NCBI taxonomy dump and query names.')
+    parser.add_argument('folder', help='Folder in which to write taxdmp.zip and queries.txt.')
+    parser.add_argument('--species', type=int, default=100000,
+                        help='Number of species of the taxonomy. Default is 100000.')
+    parser.add_argument('--queries', type=int, default=10000,
+                        help='Number of query names written to queries.txt. Default is 10000.')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random generator. Default is 1.')
+    args = parser.parse_args()
+
+    os.makedirs(args.folder, exist_ok=True)
+    nodes, names = generate_taxonomy(args.species, args.seed)
+    write_dump(args.folder, nodes, names, seed=args.seed)
+    with open(os.path.join(args.folder, 'queries.txt'), 'w', encoding='utf-8') as w:
+        w.write('\n'.join(query_names(names, args.queries, args.seed)) + '\n')
+    print(f'Wrote {len(nodes)} nodes, {len(names)} names and {args.queries} queries into {args.folder}.')
+
+if __name__ == "__main__":
+    main()
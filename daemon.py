@@ -0,0 +1,129 @@
+import json
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import search_name
+import taxonomy_db
+
+class TaxonomyServer:
+    '''Class holding the loaded taxonomy of the daemon: the TaxonomySearcher,
+    the lineage resolver and, if more than one core is used, a worker pool
+    for relaxed and lenient searches.'''
+
+    def __init__(self, folder:str, score:float, cores:int = 1, start_method:str|None = None):
+        self.folder = folder
+        self.score = score
+
+        # Load everything up front instead of on the first request
+        self.db = taxonomy_db.TaxonomyDB(folder)
+        self.searcher = self.db.searcher(score)
+        self.resolver = self.db.resolver
+        self.lineage_lock = threading.Lock()
+
+        self.pool = None
+        if cores > 1:
+            ctx = multiprocessing.get_context(start_method)
+            self.pool = ctx.Pool(cores, initializer=search_name.init_worker,
+                                 initargs=(folder, score))
+
+    def lookup(self, names:list, mode:str) -> list:
+        '''
+        Function to search the tax IDs of a batch of names: exact search
+        first, then the names not found are searched in the given mode.
+        Requests are served concurrently, so they only read the searcher
+        initialized at start; the mode is passed per call.
+        Returns a list of (tax_id or None, result record) as process_name.
+        '''
+
+        results = [search_name.process_name((name, 'strict', self.searcher)) for name in names]
+        failed = [i for i, result in enumerate(results) if result[0] is None]
+        if mode == 'strict' or len(failed) == 0:
+            return results
+
+        if self.pool is None:
+            approximate = [search_name.process_name((names[i], mode, self.searcher)) for i in failed]
+        else:
+            approximate = self.pool.map(search_name.process_worker, [(names[i], mode) for i in failed])
+        for i, result in zip(failed, approximate):
+            results[i] = result
+
+        return results
+
+    def lineage(self, tax_ids:list, mode:str) -> list:
+        '''Returns the lineages of tax_ids as LineageResolver.resolve.'''
+        # The memoized paths of the resolver are shared by all requests
+        with self.lineage_lock:
+            return self.resolver.resolve(tax_ids, mode)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+class RequestHandler(BaseHTTPRequestHandler):
+    '''Handler of the daemon endpoints:
+    GET /health, POST /lookup {"names", "mode"} and POST /lineage {"tax_ids", "mode"}.'''
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status:int, body:dict):
+        data = json.dumps(body, default=lambda x: x.item()).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok', 'score': self.server.taxonomy.score,
+                                 'db': self.server.taxonomy.folder})
+        else:
+            self.send_json(404, {'error': 'unknown endpoint '+self.path})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            if self.path == '/lookup':
+                results = self.server.taxonomy.lookup(request['names'], request.get('mode', 'strict'))
+                self.send_json(200, {'results': results})
+            elif self.path == '/lineage':
+                lineages = self.server.taxonomy.lineage(request['tax_ids'], request.get('mode', 'full'))
+                self.send_json(200, {'lineages': lineages})
+            else:
+                self.send_json(404, {'error': 'unknown endpoint '+self.path})
+        except (KeyError, TypeError, ValueError) as x:
+            self.send_json(400, {'error': str(x)})
+
+def make_server(taxonomy:TaxonomyServer, host:str = '127.0.0.1', port:int = 0) -> ThreadingHTTPServer:
+    '''Returns an HTTP server answering requests with taxonomy.
+    Port 0 picks a free port (see server.server_address).'''
+    httpd = ThreadingHTTPServer((host, port), RequestHandler)
+    httpd.daemon_threads = True
+    httpd.taxonomy = taxonomy
+    return httpd
+
+def serve(args):
+    '''Function to load the taxonomy once and answer name and lineage
+    requests until interrupted. Returns None.
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        arguments parsed from command line in main function.
+    '''
+
+    taxonomy = TaxonomyServer(args.db, args.score, int(args.cores), args.start_method)
+    httpd = make_server(taxonomy, args.host, args.port)
+    host, port = httpd.server_address[:2]
+    print(f'Taxonomy daemon listening on http://{host}:{port} (score {args.score}). '
+          f'Use --server http://{host}:{port} or set NCBI_TAX_SERVER to query it.')
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        taxonomy.close()
@@ -0,0 +1,79 @@
+import os
+import json
+import urllib.error
+import urllib.request
+
+# Number of names or tax IDs sent per request by the client
+BATCH_SIZE = 1000
+
+class Client:
+    '''Thin client of a running daemon. resolve() has the same interface as
+    LineageResolver.resolve, lookup() returns the results of process_name.'''
+
+    def __init__(self, url:str, timeout:float = 600):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, path:str, body:dict|None = None) -> dict:
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.url+path, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def health(self) -> dict | None:
+        '''Returns the status of the daemon, None if it is not reachable.'''
+        try:
+            return self.request('/health')
+        except (urllib.error.URLError, OSError, ValueError):
+            return None
+
+    def lookup(self, names, mode:str):
+        '''Yields (tax_id or None, result record) for each name, sending the
+        names in batches of BATCH_SIZE.'''
+        batch = []
+        for name in names:
+            batch.append(name)
+            if len(batch) == BATCH_SIZE:
+                yield from self.lookup_batch(batch, mode)
+                batch = []
+        if batch:
+            yield from self.lookup_batch(batch, mode)
+
+    def lookup_batch(self, names:list, mode:str) -> list:
+        results = self.request('/lookup', {'names': names, 'mode': mode})['results']
+        return [(tax_id, tuple(record)) for tax_id, record in results]
+
+    def resolve(self, tax_ids:list, mode:str) -> list:
+        '''Returns the lineages of tax_ids computed by the daemon.'''
+        lineages = []
+        tax_ids = [int(tax_id) for tax_id in tax_ids]
+        for start in range(0, len(tax_ids), BATCH_SIZE):
+            lineages += self.request('/lineage', {'tax_ids': tax_ids[start:start+BATCH_SIZE],
+                                                  'mode': mode})['lineages']
+        return lineages
+
+def connect(args) -> Client | None:
+    '''
+    Function to connect to the daemon given with --server (or the
+    NCBI_TAX_SERVER environment variable). Returns a Client if the daemon
+    is reachable and uses the same score, else None, in which case the
+    taxonomy is loaded locally.
+    '''
+
+    url = getattr(args, 'server', None) or os.environ.get('NCBI_TAX_SERVER')
+    if not url:
+        return None
+
+    client = Client(url)
+    status = client.health()
+    if status is None:
+        print(f'No taxonomy daemon reachable at {url}, loading the taxonomy locally.')
+        return None
+    if status['score'] != args.score:
+        print(f'The taxonomy daemon at {url} uses score {status["score"]} instead of \
+{args.score}, loading the taxonomy locally.')
+        return None
+
+    print(f'Using the taxonomy daemon at {url}.')
+    return client
@@ -6,6 +6,22 @@ from collections import Counter
 
 import utils
 import ncbi_tax
+import daemon_client
+import metrics
+
+REDUCED_RANKS = ['domain', 'kingdom', 'subkingdom', 'superphylum', 
+                 'subphylum', 'phylum', 'superclass', 'class', 'subclass', 
+                 'infraclass', 'cohort', 'subcohort', 'superorder', 'order', 
+                 'suborder', 'infraorder', 'parvorder', 'superfamily', 'family', 
+                 'subfamily', 'genus', 'subgenus', 'species group', 'species subgroup', 
+                 'species', 'subspecies', 'tribe', 'subtribe', 'forma', 'varietas', 
+                 'strain', 'section', 'subsection', 'pathogroup', 'subvariety', 
+                 'genotype', 'serotype', 'isolate', 'morph', 'series', 
+                 'forma specialis', 'serogroup', 'biotype', 'acellular root', 'cellular root']
+MINIMAL_RANKS = ['species', 'genus', 'family', 'order', 'class',
+    'phylum', 'kingdom', 'domain', 'acellular root', 'cellular root', 'realm']
+# Number of tax IDs resolved (and written) at a time by get_lineage
+LINEAGE_BATCH = 10000
 
 def search_nodes(tax_id:int, nodes_df:pd.DataFrame, ranks:list, mode:str) -> list:
     '''Function to retrieve the lineage of a given taxon ID. 
@@ -62,6 +78,107 @@ def search_nodes(tax_id:int, nodes_df:pd.DataFrame, ranks:list, mode:str) -> lis
 
     return lineage
 
+class LineageResolver:
+    '''Class to resolve the lineages of many taxon IDs using the dense node
+    arrays of the NCBI taxonomy. Ancestor paths are memoized, hence the path
+    of an ancestor shared by several taxon IDs is only walked once.'''
+
+    def __init__(self, nodes, ranks:list):
+        self.nodes = nodes
+        reduced_ranks, minimal_ranks = ranks
+        self.reduced = nodes.rank_codes(reduced_ranks)
+        self.minimal = nodes.rank_codes(minimal_ranks)
+        # tax_id -> (path from the top most node to tax_id, missing tax_id)
+        self.paths = {}
+
+    def get_path(self, tax_id:int) -> tuple:
+        '''
+        Function to get the path from the root (or the top most node found)
+        down to tax_id. Returns the path as tuple of tax IDs and the first
+        tax ID that was not found in the nodes (None if the root was reached).
+        '''
+
+        stack = []
+        current_tax = tax_id
+        while True:
+            if current_tax in self.paths:
+                path, missing = self.paths[current_tax]
+                break
+            if current_tax not in self.nodes:
+                path, missing = (), current_tax
+                break
+            stack.append(current_tax)
+            if current_tax == 1:
+                path, missing = (), None
+                break
+            current_tax = int(self.nodes.parent[current_tax])
+
+        # Memoize the paths of all nodes walked
+        for node in reversed(stack):
+            path = path + (node,)
+            self.paths[node] = (path, missing)
+
+        return path, missing
+
+    def keep(self, tax_id:int, mode:str) -> bool:
+        '''Returns whether tax_id is part of the lineage in the given mode.'''
+        if mode == 'full' or tax_id == 1:
+            return True
+        if mode == 'reduced':
+            return bool(self.reduced[self.nodes.rank[tax_id]])
+        if mode == 'minimal':
+            return bool(self.minimal[self.nodes.rank[tax_id]])
+        return False
+
+    def lineage_ids(self, tax_id:int, mode:str) -> list:
+        '''
+        Function to get the tax IDs of the lineage of tax_id in the given
+        mode, root first. Merged tax IDs are resolved via the tax ID they
+        were merged into. Returns an empty list for deleted tax IDs.
+        '''
+
+        tax_id = int(tax_id)
+        if tax_id not in self.nodes:
+            # Follow merged tax IDs to the tax ID they were merged into
+            new_tax_id = self.nodes.redirect(tax_id)
+            if new_tax_id != tax_id:
+                print('NOTE: Taxon ID '+str(tax_id)+' was merged into taxon ID '+str(new_tax_id)+'.')
+                tax_id = new_tax_id
+            elif self.nodes.is_deleted(tax_id):
+                print('WARNING: Taxon ID '+str(tax_id)+' was deleted from the NCBI taxonomy database.')
+                return []
+        path, missing = self.get_path(tax_id)
+        if missing is not None:
+            print('WARNING: Taxon ID '+str(missing)+' was not found in the NCBI \
+              taxonomy database as stored in the nodes store.')
+
+        return [node for node in path if self.keep(node, mode)]
+
+    def resolve(self, tax_ids:list, mode:str) -> list:
+        '''
+        Function to retrieve the lineages of a batch of taxon IDs.
+        Returns the same lineages as search_nodes (list of lists of strings).
+
+        Parameters
+        ----------
+        tax_ids : list
+            Taxon IDs for which to find the lineages.
+        mode : str
+            States whether to return full, reduced or minimal lineages.
+        '''
+
+        names = {}
+        lineages = []
+        for tax_id in tax_ids:
+            lineage = []
+            for node in self.lineage_ids(tax_id, mode):
+                if node not in names:
+                    names[node] = self.nodes.name(node)+':'+str(node)
+                lineage.append(names[node])
+            lineages.append(lineage)
+
+        return lineages
+
 def get_lineage(args):
     '''Function to retrieve the lineage given the arguments parsed from the 
     command line in the main function. Results are writen into an output file. 
@@ -73,21 +190,12 @@ def get_lineage(args):
         arguments parsed from command line in main function. 
     '''
 
-    # Setup
-    nodes_df = ncbi_tax.get_nodes(args.db)
+    # Setup: a running daemon resolves the lineages if there is one
+    resolver = args.client if hasattr(args, 'client') else daemon_client.connect(args)
+    if resolver is None:
+        nodes = ncbi_tax.get_node_arrays(args.db)
+        resolver = LineageResolver(nodes, [REDUCED_RANKS, MINIMAL_RANKS])
     output_file = args.prefix+'lineage.tsv'
-    reduced_ranks = ['domain', 'kingdom', 'subkingdom', 'superphylum', 
-                     'subphylum', 'phylum', 'superclass', 'class', 'subclass', 
-                     'infraclass', 'cohort', 'subcohort', 'superorder', 'order', 
-                     'suborder', 'infraorder', 'parvorder', 'superfamily', 'family', 
-                     'subfamily', 'genus', 'subgenus', 'species group', 'species subgroup', 
-                     'species', 'subspecies', 'tribe', 'subtribe', 'forma', 'varietas', 
-                     'strain', 'section', 'subsection', 'pathogroup', 'subvariety', 
-                     'genotype', 'serotype', 'isolate', 'morph', 'series', 
-                     'forma specialis', 'serogroup', 'biotype', 'acellular root', 'cellular root']
-    minimal_ranks = ['species', 'genus', 'family', 'order', 'class',
-        'phylum', 'kingdom', 'domain', 'acellular root', 'cellular root', 'realm']
-
     tax_ids = []
 
     if args.tax_id:
@@ -104,17 +212,28 @@ def get_lineage(args):
         now = str(datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
         print(f'\n{now}: Retrieving lineages ({args.lineage})....')
         
-        unique_tax_ids = Counter(tax_ids)
-
-        for tax_id, count in tqdm(unique_tax_ids.items(), disable=not args.quiet):
-            lineage = search_nodes(tax_id, nodes_df, [reduced_ranks, minimal_ranks], args.lineage)
-            line = f'{tax_id}\t{count}\t'
-            for lin in lineage:
-                line += f'{lin};'
-            w.write(line+'\n')
-
-            if not args.quiet:
-                print(line)
+        unique_tax_ids = list(Counter(tax_ids).items())
+        run_metrics = getattr(args, 'run_metrics', None)
+        phase = metrics.start(run_metrics, 'get_lineage', len(unique_tax_ids))
+
+        # Lineages are resolved, written and printed in batches
+        with tqdm(total=len(unique_tax_ids), disable=not args.quiet) as progress:
+            for start in range(0, len(unique_tax_ids), LINEAGE_BATCH):
+                batch = unique_tax_ids[start:start+LINEAGE_BATCH]
+                lineages = resolver.resolve([tax_id for tax_id, _ in batch], args.lineage)
+                lines = []
+                for (tax_id, count), lineage in zip(batch, lineages):
+                    line = f'{tax_id}\t{count}\t'
+                    for lin in lineage:
+                        line += f'{lin};'
+                    lines.append(line+'\n')
+                    phase.add(len(lineage) > 0)
+                w.writelines(lines)
+                progress.update(len(batch))
+
+                if not args.quiet:
+                    print(''.join(lines), end='', flush=True)
+        metrics.finish(run_metrics, phase)
 
         now = str(datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
         print(f'\n{now}: Results were written into {output_file} file.\n')
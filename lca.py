@@ -0,0 +1,157 @@
+import numpy as np
+
+import ncbi_tax
+
+class LCAIndex:
+    '''Class answering lowest common ancestor and ancestor queries on the
+    NCBI taxonomy tree using binary lifting. The jump table is built once
+    from the dense node arrays; each query then takes O(log depth) steps and
+    all queries of a batch are answered together with numpy operations.'''
+
+    def __init__(self, nodes):
+        self.nodes = nodes
+        parent = np.asarray(nodes.parent)
+
+        # Dense positions of all existing tax IDs
+        self.tax_ids = np.nonzero(parent >= 0)[0].astype(np.int64)
+        self.position = np.full(len(parent), -1, dtype=np.int64)
+        self.position[self.tax_ids] = np.arange(len(self.tax_ids))
+
+        # Parent positions; nodes whose parent is missing become roots
+        up = self.position[parent[self.tax_ids]]
+        roots = up < 0
+        up[roots] = np.nonzero(roots)[0]
+
+        # Depth by pointer doubling (roots point to themselves)
+        depth = (up != np.arange(len(up))).astype(np.int64)
+        ancestor = up.copy()
+        while True:
+            depth = depth + depth[ancestor]
+            next_ancestor = ancestor[ancestor]
+            if np.array_equal(next_ancestor, ancestor):
+                break
+            ancestor = next_ancestor
+        self.depth = depth
+        self.root = ancestor
+
+        # Jump table: self.up[k][i] is the 2^k-th ancestor of i
+        levels = max(1, int(depth.max()).bit_length()) if len(depth) > 0 else 1
+        self.up = [up]
+        for k in range(1, levels):
+            self.up.append(self.up[k-1][self.up[k-1]])
+
+    def get_positions(self, tax_ids) -> np.ndarray:
+        '''Returns the dense positions of tax_ids (-1 for unknown tax IDs).'''
+        tax_ids = np.asarray(tax_ids, dtype=np.int64)
+        valid = (tax_ids >= 0) & (tax_ids < len(self.position))
+        positions = np.full(tax_ids.shape, -1, dtype=np.int64)
+        positions[valid] = self.position[tax_ids[valid]]
+        return positions
+
+    def lift(self, positions:np.ndarray, steps:np.ndarray) -> np.ndarray:
+        '''Returns the ancestors steps levels above positions.'''
+        positions = positions.copy()
+        for k in range(len(self.up)):
+            jump = (steps >> k) & 1 == 1
+            positions[jump] = self.up[k][positions[jump]]
+        return positions
+
+    def lca(self, tax_ids_a, tax_ids_b) -> np.ndarray:
+        '''
+        Function to get the lowest common ancestors of pairs of taxon IDs.
+
+        Parameters
+        ----------
+        tax_ids_a : list
+            First taxon ID of each pair.
+        tax_ids_b : list
+            Second taxon ID of each pair.
+
+        Returns
+        ----------
+        lca : np.ndarray
+            Taxon ID of the lowest common ancestor of each pair, -1 if a
+            taxon ID is unknown or the pair has no common ancestor.
+        '''
+
+        a = self.get_positions(tax_ids_a)
+        b = self.get_positions(tax_ids_b)
+        result = np.full(a.shape, -1, dtype=np.int64)
+        valid = (a >= 0) & (b >= 0)
+        a, b = a[valid], b[valid]
+
+        # Bring both nodes to the same depth
+        swap = self.depth[a] < self.depth[b]
+        a[swap], b[swap] = b[swap], a[swap]
+        a = self.lift(a, self.depth[a] - self.depth[b])
+
+        # Jump up as long as the ancestors differ
+        for k in reversed(range(len(self.up))):
+            differ = self.up[k][a] != self.up[k][b]
+            a[differ] = self.up[k][a[differ]]
+            b[differ] = self.up[k][b[differ]]
+
+        common = np.where(a == b, a, self.up[0][a])
+        connected = self.root[a] == self.root[b]
+        result[valid] = np.where(connected, self.tax_ids[common], -1)
+
+        return result
+
+    def lca_set(self, tax_ids) -> int:
+        '''Returns the lowest common ancestor of all taxon IDs in tax_ids,
+        -1 if there is none.'''
+
+        current = np.asarray(tax_ids, dtype=np.int64)
+        if len(current) == 0:
+            return -1
+        # Reduce pairwise, halving the set in each round
+        while len(current) > 1:
+            if len(current) % 2 == 1:
+                current = np.append(current, current[-1])
+            current = self.lca(current[0::2], current[1::2])
+            if np.any(current < 0):
+                return -1
+        return int(current[0])
+
+    def is_ancestor(self, ancestors, tax_ids) -> np.ndarray:
+        '''
+        Function to test whether ancestors[i] is an ancestor of tax_ids[i].
+        A taxon ID counts as its own ancestor. Unknown taxon IDs give False.
+        Returns boolean array.
+        '''
+
+        a = self.get_positions(ancestors)
+        b = self.get_positions(tax_ids)
+        result = np.zeros(a.shape, dtype=bool)
+        valid = (a >= 0) & (b >= 0)
+        valid[valid] = self.depth[a[valid]] <= self.depth[b[valid]]
+        lifted = self.lift(b[valid], self.depth[b[valid]] - self.depth[a[valid]])
+        result[valid] = lifted == a[valid]
+        return result
+
+def get_lca(args):
+    '''Function to print the lowest common ancestor of the taxon IDs given
+    with --lca and, if --ancestor is given, whether each of them descends
+    from that taxon ID. Returns None.
+
+    Parameters
+    ----------
+    args: argparse.Namespace
+        arguments parsed from command line in main function.
+    '''
+
+    nodes = ncbi_tax.get_node_arrays(args.db)
+    index = LCAIndex(nodes)
+    tax_ids = args.lca
+
+    lca = index.lca_set(tax_ids)
+    if lca < 0:
+        print(f'No common ancestor found for {len(tax_ids)} taxon IDs.')
+    else:
+        print(f'Lowest common ancestor of {len(tax_ids)} taxon IDs: {nodes.name(lca)}:{lca}')
+
+    if args.ancestor:
+        flags = index.is_ancestor([args.ancestor]*len(tax_ids), tax_ids)
+        print(f'tax_id\tdescendant_of_{args.ancestor}')
+        for tax_id, flag in zip(tax_ids, flags):
+            print(f'{tax_id}\t{bool(flag)}')
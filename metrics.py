@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import threading
+import multiprocessing
+
+import utils
+
+# Prefix of the metric names in the Prometheus exposition format
+PROMETHEUS_PREFIX = 'ncbi_tax'
+# Metrics of each phase: (name, help text)
+PROMETHEUS_METRICS = [
+    ('running', 'Whether the phase is running (1) or finished (0).'),
+    ('elapsed_seconds', 'Seconds since the start of the phase.'),
+    ('names_total', 'Number of names (tax IDs for get_lineage) of the phase, NaN if not known yet.'),
+    ('names_processed', 'Number of names processed so far.'),
+    ('names_found', 'Number of names found so far.'),
+    ('names_failed', 'Number of names not found so far.'),
+    ('names_per_second', 'Names processed per second since the start of the phase.'),
+    ('eta_seconds', 'Estimated seconds until the phase is finished, NaN if not known.'),
+    ('success_ratio', 'Fraction of the processed names that were found.'),
+    ('queue_depth', 'Names handed to the worker pool whose results were not returned yet.'),
+    ('writer_queue_depth', 'Results waiting to be written into the output files.'),
+    ('workers', 'Number of worker processes.'),
+    ('main_rss_bytes', 'Resident set size of the main process.'),
+    ('worker_rss_bytes', 'Summed resident set size of the worker processes.'),
+]
+
+class Phase:
+    '''
+    Progress of one phase of a run (dict_search, index_search or
+    get_lineage). The phase's loop calls add() for every processed name;
+    everything else is computed by RunMetrics in the background.
+
+    Parameters
+    ----------
+    name : str
+        Name of the phase.
+    total : int
+        Number of names of the phase, None if not known in advance.
+    writer : utils.ResultWriter
+        Writer of the phase, whose queue is reported as writer queue depth.
+    '''
+
+    def __init__(self, name:str, total:int|None = None, writer = None):
+        self.name = name
+        self.total = total
+        self.writer = writer
+        self.processed = 0
+        self.found = 0
+        self.submitted = 0
+        self.start = time.time()
+        self.end = None
+        self.rss = (0, 0, {})
+
+    def add(self, found:bool):
+        self.processed += 1
+        self.found += bool(found)
+
+    def feed(self, iterable, size = None):
+        '''Yields the items of iterable, counting those handed out (e.g. to a
+        worker pool) to report the queue depth. size returns the number of
+        names of an item, if an item holds several.'''
+        for item in iterable:
+            self.submitted += 1 if size is None else size(item)
+            yield item
+
+    def measure(self, final:bool = False):
+        '''Measures the RSS of this process and its workers. The final
+        measurement keeps the last worker RSS if the workers have exited.'''
+        rss = process_rss()
+        if final and not rss[2]:
+            rss = (rss[0], *self.rss[1:])
+        self.rss = rss
+
+    def snapshot(self) -> dict:
+        '''Returns the current progress of the phase as a dictionary.'''
+        running = self.end is None
+        elapsed = (time.time() if running else self.end) - self.start
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total is not None and rate > 0:
+            eta = max(self.total - self.processed, 0) / rate
+        if running:
+            self.measure()
+        main_rss, worker_rss, workers = self.rss
+        return {'phase': self.name, 'running': int(running), 'time': time.time(),
+                'elapsed_seconds': elapsed, 'names_total': self.total,
+                'names_processed': self.processed, 'names_found': self.found,
+                'names_failed': self.processed - self.found, 'names_per_second': rate,
+                'eta_seconds': eta,
+                'success_ratio': self.found / self.processed if self.processed else None,
+                'queue_depth': max(self.submitted - self.processed, 0),
+                'writer_queue_depth': self.writer.queue.qsize() if self.writer is not None and running else 0,
+                'workers': len(workers), 'main_rss_bytes': main_rss, 'worker_rss_bytes': worker_rss,
+                'worker_rss': workers}
+
+def process_rss() -> tuple:
+    '''Returns the RSS in bytes of this process, the summed RSS of its
+    child processes (e.g. pool workers) and the RSS of each child by PID.'''
+    workers = {child.pid: int(utils.get_rss(child.pid) * 1024**2)
+               for child in multiprocessing.active_children()}
+    return int(utils.get_rss() * 1024**2), sum(workers.values()), workers
+
+class RunMetrics:
+    '''
+    Class writing the progress of all phases of a run every interval
+    seconds from a background thread, so the search loops only count.
+    Files ending in .prom are written in the Prometheus exposition format
+    (e.g. for the node exporter's textfile collector) and replaced
+    atomically; any other file receives one JSON line per phase and
+    interval.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the metrics file.
+    interval : float
+        Number of seconds between two writes. Default=10.0
+    '''
+
+    def __init__(self, file_name:str, interval:float = 10.0):
+        self.file_name = file_name
+        self.prometheus = file_name.endswith('.prom')
+        self.interval = interval
+        self.phases = {}
+        self.lock = threading.Lock()
+        if self.prometheus is False:
+            open(file_name, 'w', encoding='utf-8').close()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def start(self, name:str, total:int|None = None, writer = None) -> Phase:
+        '''Starts (or restarts) phase name and returns it.'''
+        phase = Phase(name, total, writer)
+        with self.lock:
+            self.phases[name] = phase
+        self.write()
+        return phase
+
+    def finish(self, phase:Phase):
+        '''Marks phase as finished and writes its final state.'''
+        phase.measure(final=True)
+        phase.end = time.time()
+        self.write([phase])
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self, phases:list|None = None):
+        '''Writes the state of all phases (Prometheus) or of the running
+        phases, or the given phases (JSON lines).'''
+        with self.lock:
+            if self.prometheus:
+                snapshots = [phase.snapshot() for phase in self.phases.values()]
+                temp_file = self.file_name + '.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as w:
+                    w.write(format_prometheus(snapshots))
+                os.replace(temp_file, self.file_name)
+                return
+
+            if phases is None:
+                phases = [phase for phase in self.phases.values() if phase.end is None]
+            with open(self.file_name, 'a', encoding='utf-8') as w:
+                for phase in phases:
+                    w.write(json.dumps(phase.snapshot()) + '\n')
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+def format_prometheus(snapshots:list) -> str:
+    '''Returns the snapshots of the phases in the Prometheus exposition format.'''
+    lines = []
+    for key, text in PROMETHEUS_METRICS:
+        name = f'{PROMETHEUS_PREFIX}_{key}'
+        lines.append(f'# HELP {name} {text}')
+        lines.append(f'# TYPE {name} gauge')
+        for snapshot in snapshots:
+            value = snapshot[key]
+            lines.append(f'{name}{{phase="{snapshot["phase"]}"}} '
+                         f'{"NaN" if value is None else value}')
+    return '\n'.join(lines) + '\n'
+
+def open_metrics(args) -> RunMetrics | None:
+    '''Returns a RunMetrics writing into args.metrics, None if no metrics
+    file was given.'''
+    if getattr(args, 'metrics', None) is None:
+        return None
+    return RunMetrics(str(args.metrics), args.metrics_interval)
+
+def start(metrics:RunMetrics|None, name:str, total:int|None = None, writer = None) -> Phase:
+    '''Starts phase name of metrics. Without metrics, returns a Phase that
+    is only counted, so the loops need no case distinction.'''
+    if metrics is None:
+        return Phase(name, total, writer)
+    return metrics.start(name, total, writer)
+
+def finish(metrics:RunMetrics|None, phase:Phase):
+    if metrics is not None:
+        metrics.finish(phase)
@@ -1,40 +1,129 @@
 import sys
+import csv
+import bisect
 import os.path
+import re
+import hashlib
 import shutil
+import zipfile
 import string
 import urllib
 import urllib.request
+import urllib.error
 import pathlib
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-import json
-from tqdm import tqdm
 
-import utils
+import taxa_store
+import query_cache
 
-def sort_taxa_names(folder:pathlib.Path) -> pd.DataFrame:
+DUMP_URL = 'https://ftp.ncbi.nih.gov/pub/taxonomy/taxdmp.zip'
+# Number of bytes per chunk when downloading and hashing the dump
+DOWNLOAD_CHUNK = 1 << 20
+# Dump files the nodes store is built from (besides the scientific names)
+NODES_MEMBERS = ['nodes.dmp', 'merged.dmp', 'delnodes.dmp']
+
+def read_dmp_file(file_name:str, header:list, chunksize:int = 1000000) -> pd.DataFrame:
+    '''
+    Function to read in a "\\t|\\t" seperated dump file of the NCBI taxonomy
+    database in chunks using the C parser of pandas. Applies the clean up
+    of utils.read_line as column operations.
+
+    Parameters
+    ----------
+    file_name : str | file object
+        Path to the dump file (e.g. names.dmp or nodes.dmp) or a binary
+        file object as returned by open_dump_member.
+    header : list
+        Names of the leading columns to keep. Trailing columns are skipped.
+    chunksize : int
+        Number of lines to parse per chunk. Default is 1000000.
+
+    Returns
+    ----------
+    dmp_df : pd.DataFrame
+        DataFrame holding the cleaned up columns as strings.
+    '''
 
-    file_name = os.path.join(os.path.join(folder, 'taxdmp'), 'names.dmp')
+    # Fields are enclosed by tabs around the "|" delimiter, hence splitting
+    # on tabs puts the values on every second column without any tabs left.
+    reader = pd.read_csv(file_name, sep='\t', header=None,
+                         usecols=range(0, 2*len(header), 2), dtype=object,
+                         engine='c', quoting=csv.QUOTE_NONE, na_filter=False,
+                         encoding='utf-8', chunksize=chunksize)
+
+    chunks = []
+    for chunk in reader:
+        chunk.columns = header
+        if len(header) > 1:
+            # Second column: remove quotes and a leading whitespace
+            name = chunk[header[1]].str.replace('["\']', '', regex=True)
+            leading = name.str.startswith(' ')
+            name[leading] = name[leading].str.slice(1)
+            chunk[header[1]] = name
+        chunks.append(chunk)
+
+    if len(chunks) == 0:
+        return pd.DataFrame(columns=header, dtype=object)
+
+    return pd.concat(chunks, ignore_index=True)
+
+def open_dump_member(folder:pathlib.Path, member:str):
+    '''
+    Function to open a file of the NCBI taxonomy dump (e.g. names.dmp) for
+    reading. The file is streamed straight out of taxdmp.zip without
+    extracting the archive; only if there is no taxdmp.zip, a previously
+    extracted taxdmp folder is used. Returns a binary file object, None
+    if the dump does not contain member.
+    '''
+
+    zip_file = os.path.join(folder, 'taxdmp.zip')
+    if os.path.exists(zip_file):
+        with zipfile.ZipFile(zip_file) as archive:
+            if member not in archive.namelist():
+                return None
+            print('Reading in file '+zip_file+':'+member+'...')
+            # The member stays readable after the archive is closed
+            return archive.open(member)
+
+    file_name = os.path.join(folder, 'taxdmp', member)
+    if os.path.exists(file_name) is False:
+        return None
+    print('Reading in file '+file_name+'...')
+    return open(file_name, 'rb')
+
+def dump_checksums(folder:pathlib.Path, members:list) -> dict | None:
+    '''
+    Function to get the CRC-32 of files of taxdmp.zip as recorded in the
+    archive, without reading them. Returns a dict by member (None for
+    missing members), None if there is no taxdmp.zip.
+    '''
 
-    print('Reading in file '+str(file_name)+'...')
-    # Read in file line after line
-    with open(file_name, encoding='utf=8') as t:
-        taxa = t.readlines()
+    zip_file = os.path.join(folder, 'taxdmp.zip')
+    if os.path.exists(zip_file) is False:
+        return None
+    with zipfile.ZipFile(zip_file) as archive:
+        names = archive.namelist()
+        return {member: archive.getinfo(member).CRC if member in names else None for member in members}
 
-    # Split lines into corresponding columns
-    for i, value in enumerate(taxa):
-        taxa[i] = utils.read_line(taxa[i])
+def sort_taxa_names(folder:pathlib.Path) -> pd.DataFrame:
 
     # Declare header for DataFrame
     header = ['tax_id', 'name_txt', 'unique name', 'name class']
 
-    # Sort list of lists according to the second position in list (taxon name)
+    with open_dump_member(folder, 'names.dmp') as dmp:
+        taxa_df = read_dmp_file(dmp, header)
+
+    # Sort DataFrame according to the taxon name (case-insensitive, stable).
+    # Python's sort on the lower case column is faster than numpy's argsort
+    # on object arrays and keeps the order of the previous implementation.
     print('Sorting taxa names alphabetically...')
-    taxa.sort(key = lambda row: row[1].lower())
+    keys = taxa_df['name_txt'].str.lower().tolist()
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    del keys
+    taxa_df = taxa_df.take(order).reset_index(drop=True)
 
-    # Transform sorted list of lists into DataFrame and write
-    taxa_df = pd.DataFrame(taxa, columns=header)
     taxa_df.to_csv(os.path.join(folder, 'taxa_names_sorted.tsv'), sep='\t', index=False)
     print('The DataFrame containing the sorted taxon names and taxon IDs \
 were written into file: '+os.path.join(folder, 'taxa_names_sorted.tsv')+'.\n')
@@ -53,11 +142,14 @@ def get_indeces(folder:pathlib.Path, taxa:pd.DataFrame) -> dict:
     for letter in letters:
         indeces[letter] = []
 
+    # First letter of each name, looked up once instead of per row
+    first_letters = [name[0].upper() for name in taxa['name_txt'].tolist()]
+
     # Get indices in the taxa df for all names not starting with a letter.
     # Starting index is 0.
     indeces.setdefault('_', []).append(0)
     for i in range(len(taxa.index)):
-        if taxa.at[i, 'name_txt'][0].upper() == letters[0]:
+        if first_letters[i] == letters[0]:
             indeces.setdefault('_', []).append(i-1)
             break
 
@@ -65,7 +157,7 @@ def get_indeces(folder:pathlib.Path, taxa:pd.DataFrame) -> dict:
     for key in letters:
         indeces.setdefault(key, []).append(i)
         while i < len(taxa.index):
-            name = taxa.at[i,'name_txt'][0].upper()
+            name = first_letters[i]
             # Once the first letter in the name does not correspond
             # to the current letter anymore, store index in indeces dict and break
             if name != key:
@@ -105,7 +197,7 @@ def get_nodes_file(folder:pathlib.Path, names:pd.DataFrame) -> pd.DataFrame:
     Parameters
     ----------
     folder : str
-        Path to folder in which to write the nodes.tsv file.
+        Path to folder holding taxdmp.zip, in which to write the nodes.tsv file.
     names : pd.DataFrame
         DataFrame holding the taxa names and tax IDs.
 
@@ -115,26 +207,14 @@ def get_nodes_file(folder:pathlib.Path, names:pd.DataFrame) -> pd.DataFrame:
         DataFrame holding the nodes of the NCBI taxonomy database.
     '''
 
-    nodes_file = os.path.join(os.path.join(folder, 'taxdmp'), 'nodes.dmp')
+    # Declare header for DataFrame (only the first three columns are needed)
+    header = ['tax_id', 'parent_tax_id', 'rank']
 
-    print('Reading in file '+str(nodes_file)+'...')
-    # Read in file line after line
-    with open(nodes_file, encoding='utf=8') as t:
-        nodes = t.readlines()
-
-    for i, value in enumerate(nodes):
-        nodes[i] = utils.read_line(nodes[i])
-
-    # Declare header for DataFrame
-    header = ['tax_id', 'parent_tax_id', 'rank', 'name class', 'embl code',
-        'division id', 'inherited div flag', 'genetic code id',
-        'inherited GC  flag', 'mitochondrial genetic code id', 
-        'inherited MGC flag', 'GenBank hidden flag', 'hidden subtree root flag'] 
+    with open_dump_member(folder, 'nodes.dmp') as dmp:
+        nodes_df = read_dmp_file(dmp, header)
 
     taxa_df = names[['tax_id', 'name_txt']]
 
-    nodes_df = pd.DataFrame(nodes, columns=header)
-    nodes_df = nodes_df[['tax_id', 'parent_tax_id', 'rank']]
     nodes_df = nodes_df.astype({'tax_id': int, 'parent_tax_id': int})
     taxa_df = taxa_df.astype({'tax_id': int})
 
@@ -148,9 +228,223 @@ def get_nodes_file(folder:pathlib.Path, names:pd.DataFrame) -> pd.DataFrame:
 
     return nodes_df
 
-def get_dumpfile(folder, timeout=540) -> None:
+def read_merged_file(folder:pathlib.Path) -> tuple:
+    '''
+    Function to read the merged.dmp and delnodes.dmp files of the NCBI
+    taxonomy database, if the dump contains them.
+
+    Parameters
+    ----------
+    folder : str
+        Path to folder holding taxdmp.zip (or the extracted taxdmp folder).
+
+    Returns
+    ----------
+    merged_df : pd.DataFrame | None
+        DataFrame holding the old_tax_id and the new_tax_id it was merged into.
+    deleted : list | None
+        List of deleted tax IDs.
+    '''
+
+    merged_df, deleted = None, None
+    merged_file = open_dump_member(folder, 'merged.dmp')
+    if merged_file is not None:
+        with merged_file:
+            merged_df = read_dmp_file(merged_file, ['old_tax_id', 'new_tax_id'])
+        merged_df = merged_df.astype({'old_tax_id': int, 'new_tax_id': int})
+    deleted_file = open_dump_member(folder, 'delnodes.dmp')
+    if deleted_file is not None:
+        with deleted_file:
+            deleted = read_dmp_file(deleted_file, ['tax_id'])['tax_id'].astype(int).tolist()
+
+    return merged_df, deleted
+
+def patch_taxa(old_taxa:pd.DataFrame, new_names:pd.DataFrame) -> tuple:
+    '''
+    Function to apply the differences between the previous sorted taxa
+    DataFrame and a newly read names.dmp to the sorted taxa DataFrame.
+    Deleted rows are dropped and added rows are inserted at their sorted
+    position, rows with equal names (case-insensitive) ordered as in
+    names.dmp. Gives the same result as sorting the new names with
+    sort_taxa_names, with all columns of new_names.
+
+    Parameters
+    ----------
+    old_taxa : pd.DataFrame
+        Previous sorted DataFrame with the columns tax_id, name_txt and name class.
+    new_names : pd.DataFrame
+        Unsorted DataFrame read from the new names.dmp file.
+
+    Returns
+    ----------
+    taxa_df : pd.DataFrame
+        Sorted DataFrame holding the new taxa names.
+    row_map : np.ndarray
+        New row of each row of old_taxa, -1 if it was deleted.
+    added_rows : np.ndarray
+        Rows of taxa_df that were added.
+    '''
+
+    columns = ['tax_id', 'name_txt', 'name class']
+    old_rows = old_taxa[columns].astype({'tax_id': int}).reset_index(drop=True)
+    new_rows = new_names[columns].astype({'tax_id': int}).reset_index(drop=True)
+
+    def row_keys(rows):
+        # 64-bit hash of each row, repeated rows are numbered so that the
+        # diff respects multiplicities
+        hashes = pd.util.hash_pandas_object(rows, index=False, categorize=False).to_numpy()
+        order = np.argsort(hashes)
+        sorted_hashes = hashes[order]
+        first = np.ones(len(hashes), dtype=bool)
+        first[1:] = sorted_hashes[1:] != sorted_hashes[:-1]
+        starts = np.nonzero(first)[0]
+        repeat = np.empty(len(hashes), dtype=np.uint64)
+        repeat[order] = np.arange(len(hashes)) - np.repeat(starts, np.diff(np.append(starts, len(hashes))))
+        return hashes + repeat * np.uint64(0x9E3779B97F4A7C15)
+
+    old_keys, new_keys = row_keys(old_rows), row_keys(new_rows)
+    # Keys are unique within each side, hence a key occurring twice in the
+    # combined sorted keys belongs to a row found in both.
+    keys = np.concatenate([old_keys, new_keys])
+    order = np.argsort(keys)
+    equal = keys[order][1:] == keys[order][:-1]
+    matched = np.zeros(len(keys), dtype=bool)
+    matched[order[1:][equal]] = True
+    matched[order[:-1][equal]] = True
+    deleted = np.nonzero(~matched[:len(old_keys)])[0]
+    added = np.nonzero(~matched[len(old_keys):])[0]
+    del old_keys, new_keys
+    print(f'{len(deleted)} taxa names were removed and {len(added)} were added.')
+
+    # Row of names.dmp of each kept row
+    pairs = np.sort(np.stack([order[:-1][equal], order[1:][equal]]), axis=0)
+    source = np.full(len(old_rows), -1, dtype=np.int64)
+    source[pairs[0]] = pairs[1] - len(old_rows)
+    del order, equal, pairs
+
+    kept = np.ones(len(old_rows), dtype=bool)
+    kept[deleted] = False
+    kept_keys = old_rows.loc[kept, 'name_txt'].str.lower().tolist()
+
+    # Sort the added rows by name, in order of names.dmp for equal names
+    added_keys = new_rows.loc[added, 'name_txt'].str.lower().tolist()
+    added_order = sorted(range(len(added_keys)), key=added_keys.__getitem__)
+    added = added[added_order]
+    added_keys = [added_keys[i] for i in added_order]
+
+    # Insertion position of each added row among the kept rows
+    positions = np.fromiter((bisect.bisect_left(kept_keys, key) for key in added_keys),
+                            dtype=np.int64, count=len(added_keys))
+    kept_new = np.arange(len(kept_keys)) + np.searchsorted(positions, np.arange(len(kept_keys)), side='right')
+    added_new = positions + np.arange(len(positions))
+
+    # Order rows of equal names by their row of names.dmp, as the stable
+    # sort of sort_taxa_names does
+    rows = np.empty(len(kept_keys) + len(added_keys), dtype=np.int64)
+    rows[kept_new] = source[kept]
+    rows[added_new] = added
+    keys = np.empty(len(rows), dtype=object)
+    keys[kept_new] = kept_keys
+    keys[added_new] = added_keys
+    del kept_keys, added_keys
+    runs = np.cumsum(np.r_[True, keys[1:] != keys[:-1]])
+    del keys
+    order = np.lexsort((rows, runs))
+    final = np.empty(len(rows), dtype=np.int64)
+    final[order] = np.arange(len(rows))
+
+    # All columns are taken from names.dmp, as written by sort_taxa_names
+    taxa_df = new_names.take(rows[order]).reset_index(drop=True)
+
+    row_map = np.full(len(old_rows), -1, dtype=np.int64)
+    row_map[kept] = final[kept_new]
+
+    return taxa_df, row_map, np.sort(final[added_new])
+
+def read_update_log(folder:str) -> dict:
+    '''Returns the md5 checksum and Last-Modified date of the last download
+    recorded in update.log (empty dict if none was recorded).'''
+
+    recorded = {}
+    log_file = os.path.join(folder, 'update.log')
+    if os.path.exists(log_file) is False:
+        return recorded
+
+    with open(log_file, encoding='utf-8') as t:
+        for line in t:
+            match = re.search(r'md5: (\S*) Last-Modified: (.*)$', line.strip('\n'))
+            if match:
+                recorded = {'md5': match.group(1), 'last_modified': match.group(2)}
+    return recorded
+
+def read_snapshot(folder:str) -> str:
+    '''Returns the taxonomy snapshot of the database: the date of the last
+    download recorded in update.log, followed by its md5 checksum if one
+    was recorded. "unknown" if update.log records no download.'''
+
+    snapshot = 'unknown'
+    log_file = os.path.join(folder, 'update.log')
+    if os.path.exists(log_file) is False:
+        return snapshot
+
+    with open(log_file, encoding='utf-8') as t:
+        for line in t:
+            match = re.search(r'updated on: (.*?)\.(?: md5: (\S*)|\s*$)', line)
+            if match:
+                snapshot = match.group(1) + (f' md5: {match.group(2)}' if match.group(2) else '')
+    return snapshot
+
+def file_md5(file_name:str, chunk_size:int = DOWNLOAD_CHUNK) -> str:
+    '''Returns the hex md5 checksum of file_name, read in chunks.'''
+    md5 = hashlib.md5()
+    with open(file_name, 'rb') as t:
+        for chunk in iter(lambda: t.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def download_part(url:str, part_file:str, last_modified:str, timeout:int) -> bool:
+    '''
+    Function to stream url into part_file. If part_file exists, the download
+    is resumed via an HTTP range request, provided the file on the server
+    did not change meanwhile. A part_file already holding the whole file
+    (answered with 416 by the server) is kept as it is.
+    Returns True if the existing part_file was resumed or kept, else False.
+    '''
+    offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+    request = urllib.request.Request(url)
+    if offset > 0:
+        request.add_header('Range', f'bytes={offset}-')
+        request.add_header('If-Range', last_modified)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as dl_file:
+            if offset > 0 and dl_file.status == 206:
+                print(f'Resuming download at byte {offset}...')
+                mode = 'ab'
+            else:
+                mode = 'wb'
+            with open(part_file, mode) as out_file:
+                shutil.copyfileobj(dl_file, out_file, DOWNLOAD_CHUNK)
+    except urllib.error.HTTPError as x:
+        # Range not satisfiable: the previous run downloaded the whole file
+        if offset > 0 and x.code == 416:
+            print('The download of taxdmp.zip was already complete.')
+            return True
+        raise
+    return mode == 'ab'
+
+def get_dumpfile(folder, timeout=540, url=DUMP_URL) -> dict | None:
     '''
     Function to download the taxdmp.zip file from the NCBI taxonomy database.
+    The file is streamed in chunks into taxdmp.zip.part, an interrupted
+    download is resumed via an HTTP range request. The file is verified
+    against the published md5 checksum before it replaces taxdmp.zip; a
+    resumed file failing the check is downloaded again. Nothing is
+    downloaded if the checksum (or, if no checksum is published, the
+    Last-Modified date) matches the one recorded in update.log for the
+    existing taxdmp.zip, or if taxdmp.zip already matches the checksum
+    (downloaded by a run that did not finish building the database).
+    The download is recorded in update.log by write_update_log once the
+    database has been built from it.
 
     Parameters
     ----------
@@ -158,29 +452,78 @@ def get_dumpfile(folder, timeout=540) -> None:
         Path to folder in which to write the taxdmp.zip file.
     timeout : int
         Timeout in seconds for downloading the file. Default is 540 seconds.
+    url : str
+        URL of the taxdmp.zip file. Default is the NCBI FTP server.
+
+    Returns
+    ----------
+    download : dict
+        md5 checksum and Last-Modified date of taxdmp.zip (see
+        write_update_log), None if the database is up to date.
     '''
 
-    print('Downloading taxdmp.zip file from the NCBI taxonomy database...\n')
-    url = 'https://ftp.ncbi.nih.gov/pub/taxonomy/taxdmp.zip'
+    dump_file = os.path.join(folder, 'taxdmp.zip')
+    part_file = dump_file + '.part'
+    recorded = read_update_log(folder)
 
-    # Download names.dmp file
     try:
-        with urllib.request.urlopen(url, timeout=timeout) as dl_file:
-            with open(os.path.join(folder,'taxdmp.zip'), 'wb') as out_file:
-                out_file.write(dl_file.read())
+        # Published checksum and Last-Modified date of the current dump
+        md5 = None
+        try:
+            with urllib.request.urlopen(url+'.md5', timeout=timeout) as dl_file:
+                md5 = dl_file.read().decode('utf-8').split()[0].lower()
+        except urllib.error.HTTPError:
+            print('No md5 checksum found for '+url+', the download cannot be verified.')
+        request = urllib.request.Request(url, method='HEAD')
+        with urllib.request.urlopen(request, timeout=timeout) as dl_file:
+            last_modified = dl_file.headers.get('Last-Modified', '')
+
+        if os.path.exists(dump_file) and recorded and \
+            ((md5 is not None and md5 == recorded['md5']) or
+             (md5 is None and last_modified != '' and last_modified == recorded['last_modified'])):
+            print('The NCBI taxonomy database is up to date (taxdmp.zip unchanged).\n')
+            return None
+        if md5 is not None and os.path.exists(dump_file) and file_md5(dump_file) == md5:
+            print('taxdmp.zip was already downloaded, the database is built from it.\n')
+            return {'md5': md5, 'last_modified': last_modified}
+
+        print('Downloading taxdmp.zip file from the NCBI taxonomy database...\n')
+        resumed = download_part(url, part_file, last_modified, timeout)
+        checksum = file_md5(part_file)
+        if md5 is not None and checksum != md5 and resumed:
+            # The kept part may be corrupt, start over
+            print('The md5 checksum of the resumed taxdmp.zip does not match, downloading it again...')
+            os.remove(part_file)
+            download_part(url, part_file, last_modified, timeout)
+            checksum = file_md5(part_file)
 
     except Exception as x:
         print(x)
         sys.exit(1)
 
+    if md5 is not None and checksum != md5:
+        os.remove(part_file)
+        print(f'The md5 checksum of the downloaded taxdmp.zip ({checksum}) does not match \
+the published one ({md5}). Please rerun the download.')
+        sys.exit(1)
+    os.replace(part_file, dump_file)
+
+    return {'md5': checksum, 'last_modified': last_modified}
+
+def write_update_log(folder:str, download:dict):
+    '''Records download (see get_dumpfile) in update.log. Called once the
+    stores are built from it, so an interrupted build is redone.'''
     date = datetime.now()
     with open(os.path.join(folder, 'update.log'), 'a', encoding='utf-8') as w:
-        w.write(f'NCBI taxonomy last downloaded and updated on: {date}.\n')
+        w.write(f'NCBI taxonomy last downloaded and updated on: {date}. '
+                f'md5: {download["md5"]} Last-Modified: {download["last_modified"]}\n')
 
 def get_taxa(folder:str) -> list:
     '''
-    Function to get the taxa DataFrame and the lexicon from the NCBI taxonomy database
-    If taxa_names_sorted.tsv and taxa_indeces.txt files do not exist, they will be created.
+    Function to get the taxa store and the lexicon from the NCBI taxonomy database.
+    If the binary taxa store, taxa_names_sorted.tsv and taxa_indeces.txt files
+    do not exist, they will be created. The taxa store is opened via memory
+    mapping, hence it is not read into memory.
 
     Parameters
     ----------
@@ -189,30 +532,38 @@ def get_taxa(folder:str) -> list:
 
     Returns
     ----------
-    taxa : pd.DataFrame
-        DataFrame holding the taxa names and tax IDs.
+    taxa : taxa_store.TaxaStore
+        Memory-mapped store holding the taxa names and tax IDs.
     list_index : dict
-        Dictionary holding the lexicon for the taxa DataFrame.
+        Dictionary holding the lexicon for the taxa store.
     '''
 
     if os.path.isdir(folder) is False:
         os.mkdir(folder)
 
-    if os.path.exists(os.path.join(folder, 'taxdmp.zip')) is False:
-        get_dumpfile(folder)
-
-    if os.path.exists(os.path.join(folder, 'taxdmp')) is False:
-        shutil.unpack_archive(filename=os.path.join(folder, 'taxdmp.zip'),
-                              extract_dir=os.path.join(folder, 'taxdmp'))
-
-    if os.path.exists(os.path.join(folder,'taxa_names_sorted.tsv')) is False:
-        # Sort taxa names; get indices to create lexicon.
-        taxa = sort_taxa_names(folder)
-        list_index = get_indeces(folder, taxa)
-    else:
-        print('Reading in '+os.path.join(folder, 'taxa_names_sorted.tsv')+' file...')
-        taxa = pd.read_csv(os.path.join(folder, 'taxa_names_sorted.tsv'), sep='\t')
-        list_index = read_indices(os.path.join(folder, 'taxa_indeces.txt'))
+    if taxa_store.store_exists(folder) is False:
+        download = None
+        if os.path.exists(os.path.join(folder,'taxa_names_sorted.tsv')) is False:
+            if os.path.exists(os.path.join(folder, 'taxdmp.zip')) is False \
+                and os.path.exists(os.path.join(folder, 'taxdmp')) is False:
+                download = get_dumpfile(folder)
+
+            # Sort taxa names; get indices to create lexicon.
+            taxa = sort_taxa_names(folder)
+            get_indeces(folder, taxa)
+        else:
+            # Convert the existing taxa_names_sorted.tsv file once
+            print('Reading in '+os.path.join(folder, 'taxa_names_sorted.tsv')+' file...')
+            taxa = pd.read_csv(os.path.join(folder, 'taxa_names_sorted.tsv'), sep='\t',
+                               keep_default_na=False)
+        add_dup_to_taxa(folder, taxa)
+        taxa_store.write_store(folder, taxa)
+        if download is not None:
+            write_update_log(folder, download)
+
+    print('Opening taxa store '+taxa_store.store_path(folder)+'...')
+    taxa = taxa_store.TaxaStore(folder)
+    list_index = read_indices(os.path.join(folder, 'taxa_indeces.txt'))
 
     return taxa, list_index
 
@@ -234,6 +585,7 @@ def get_nodes(folder:str) -> pd.DataFrame:
 
     if os.path.exists(os.path.join(folder, 'nodes.tsv')) is False:
         taxa, list_index = get_taxa(folder)
+        taxa = taxa.to_frame()
         nodes_df = get_nodes_file(folder, taxa[taxa['name class'] == 'scientific name'])
     else:
         print('Reading in '+os.path.join(folder, 'nodes.tsv')+' file...')
@@ -243,42 +595,60 @@ def get_nodes(folder:str) -> pd.DataFrame:
 
     return nodes_df
 
-def get_homonyms_file(folder:str, taxa:pd.DataFrame, redo = False) -> list:
+def get_node_arrays(folder:str) -> taxa_store.NodesStore:
     '''
-    Function to get all homonyms in the taxa DataFrame.	
-    Writes homonyms into a json file.
+    Function to get the nodes of the NCBI taxonomy database as dense arrays
+    indexed by tax_id (parent, rank code, scientific name). If the binary
+    nodes store does not exist, it will be created from the nodes.tsv file.
 
     Parameters
     ----------
     folder : str
-        Path to folder in which to write the homonyms file.
-    taxa : pd.DataFrame
-        DataFrame holding the taxa names and tax IDs.
+        Path to folder in which to find/write the nodes store.
+
+    Returns
+    ----------
+    nodes : taxa_store.NodesStore
+        Memory-mapped store holding the nodes of the NCBI taxonomy database.
     '''
 
-    homonyms_file = os.path.join(folder, 'homonyms.json')
+    if taxa_store.nodes_exists(folder) is False:
+        nodes_df = get_nodes(folder)
+        merged_df, deleted = read_merged_file(folder)
+        taxa_store.write_nodes_store(folder, nodes_df.reset_index(), merged_df, deleted)
 
-    if os.path.exists(homonyms_file) and redo is False:
-        with open(homonyms_file, "r") as file:
-            duplicates_dict = json.load(file)
-        return duplicates_dict
+    return taxa_store.NodesStore(folder)
 
-    homonyms = defaultdict(list)
-    for idx, row in tqdm(taxa.iterrows(), total=len(taxa)): 
-        homonyms[row['name_txt']].append(idx)
-        # If we encounter a homonym, set dup column ccordingly
-        if len(homonyms[row['name_txt']]) > 1:
-            for idx in homonyms[row['name_txt']]:
-                taxa.at[idx, 'dup'] = 1
+def get_homonyms_file(folder:str, taxa:pd.DataFrame, redo = False) -> dict:
+    '''
+    Function to get all homonyms in the taxa DataFrame. The homonym groups
+    are kept as arrays in the taxa store (see taxa_store.find_homonyms);
+    for a DataFrame the dup column is set accordingly.
 
-    # keep only duplicates
-    duplicates_dict = {name: ids for name, ids in homonyms.items() if len(ids) > 1}
+    Parameters
+    ----------
+    folder : str
+        Path to the folder of the database (kept for compatibility).
+    taxa : pd.DataFrame | taxa_store.TaxaStore
+        DataFrame or taxa store holding the taxa names and tax IDs.
 
-    with open(homonyms_file, "w") as f:
-        json.dump(duplicates_dict, f, indent=4)
-    print('Homonyms were written into file '+homonyms_file+'.')
+    Returns
+    ----------
+    homonyms : dict
+        Rows of all names occurring more than once, by name.
+    '''
 
-    return duplicates_dict
+    if isinstance(taxa, taxa_store.TaxaStore):
+        names = taxa.names()
+        offsets, rows = taxa.homonym_groups()[:2]
+    else:
+        names = taxa['name_txt']
+        dup, offsets, rows = taxa_store.find_homonyms(names)
+        taxa['dup'] = dup
+
+    rows = np.asarray(rows).tolist()
+    return {names.iat[rows[start]]: rows[start:stop]
+            for start, stop in zip(offsets[:-1], offsets[1:])}
 
 def add_dup_to_taxa(folder:str, taxa_df:pd.DataFrame):
     '''
@@ -295,30 +665,90 @@ def add_dup_to_taxa(folder:str, taxa_df:pd.DataFrame):
     if 'dup' in taxa_df.columns:
         return
     
-    taxa_df['dup'] = 0
-    _ = get_homonyms_file(folder, taxa_df, redo = True)       
+    taxa_df['dup'] = taxa_store.find_homonyms(taxa_df['name_txt'])[0]
     
     taxa_df.to_csv(os.path.join(folder, 'taxa_names_sorted.tsv'), sep='\t', index=False)
     return
 
-def update_db(folder: str):
+def update_db(folder: str, incremental:bool = False):
     '''
-    Function to update the NCBI taxonomy database.
+    Function to update the NCBI taxonomy database. In incremental mode only
+    the differences between the new names.dmp and the previous taxa store
+    are applied to the derived files; the trigram and exact-match indices
+    are patched instead of rebuilt. The nodes store is kept if nodes.dmp,
+    merged.dmp and delnodes.dmp are unchanged (checksums in taxdmp.zip) and
+    no scientific name was added or removed, else it is rebuilt in full.
+    Falls back to a full rebuild if there is no previous store.
 
     Parameters
     ----------
     folder : str
         Path to folder in which to write/find the NCBI taxonomy database files.
+    incremental : bool
+        States whether to apply only the differences to the previous
+        database. Default=False
     '''
 
     if os.path.isdir(folder) is False:
         os.mkdir(folder)
 
-    get_dumpfile(folder)
-    shutil.unpack_archive(filename=os.path.join(folder, 'taxdmp.zip'),
-                          extract_dir=os.path.join(folder, 'taxdmp'))
-    taxa = sort_taxa_names(folder)
-    list_index = get_indeces(folder, taxa)
-    nodes_df = get_nodes_file(folder, taxa)
-    add_dup_to_taxa(folder, taxa)
+    download = get_dumpfile(folder)
+    if download is None and taxa_store.store_exists(folder) \
+        and taxa_store.nodes_exists(folder):
+        print('Nothing to update.')
+        return
 
+    sources = dump_checksums(folder, NODES_MEMBERS)
+    update_nodes = True
+    if incremental and taxa_store.store_exists(folder):
+        old_store = taxa_store.TaxaStore(folder)
+        old_taxa = old_store.to_frame()
+        with open_dump_member(folder, 'names.dmp') as dmp:
+            new_names = read_dmp_file(dmp, ['tax_id', 'name_txt', 'unique name', 'name class'])
+
+        print('Applying changes to the sorted taxa names...')
+        taxa, row_map, added_rows = patch_taxa(old_taxa, new_names)
+        del new_names
+        trigram_index = taxa_store.patch_trigram_index(
+            (old_store.trigram_keys, old_store.trigram_offsets, old_store.trigram_rows),
+            row_map, taxa.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        old_index = old_store.exact_index()
+        exact_index = taxa_store.patch_exact_index((old_index.hashes, old_index.rows), row_map,
+                                                   taxa.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        old_index = old_store.normalized_index()
+        normalized_index = taxa_store.patch_normalized_index((old_index.hashes, old_index.rows), row_map,
+                                                             taxa.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        del old_store, old_index
+
+        # The scientific names are the only input of the nodes store
+        # taken from names.dmp
+        update_nodes = sources is None or sources != taxa_store.nodes_sources(folder) \
+            or (old_taxa.loc[row_map < 0, 'name class'] == 'scientific name').any() \
+            or (taxa.loc[added_rows, 'name class'] == 'scientific name').any()
+        del old_taxa
+
+        # dup is set before writing, so the file is written once
+        homonyms = taxa_store.find_homonyms(taxa['name_txt'])
+        taxa['dup'] = homonyms[0]
+        taxa.to_csv(os.path.join(folder, 'taxa_names_sorted.tsv'), sep='\t', index=False)
+        get_indeces(folder, taxa)
+    else:
+        taxa = sort_taxa_names(folder)
+        get_indeces(folder, taxa)
+        trigram_index = None
+        exact_index = None
+        normalized_index = None
+        homonyms = None
+
+    if update_nodes:
+        merged_df, deleted = read_merged_file(folder)
+        nodes_df = get_nodes_file(folder, taxa[taxa['name class'] == 'scientific name'])
+        taxa_store.write_nodes_store(folder, nodes_df, merged_df, deleted, sources)
+    else:
+        print('The nodes are unchanged, the nodes store was kept.')
+    add_dup_to_taxa(folder, taxa)
+    taxa_store.write_store(folder, taxa, trigram_index, exact_index, normalized_index, homonyms)
+    # Recorded only now, so an interrupted rebuild is redone by the next update
+    if download is not None:
+        write_update_log(folder, download)
+    query_cache.invalidate(folder, read_snapshot(folder))
@@ -14,6 +14,9 @@ sys.path.insert(0, script_dir)
 import search_name
 import get_lineage
 import ncbi_tax
+import lca
+import daemon
+import metrics
 
 def main():
     '''Script to retrieve taxon ID according \
@@ -29,6 +32,8 @@ retrieve the lineage of said/a taxon ID.**')
                     help='Taxon name for which to find the taxon ID')
     group.add_argument('-id', '--tax_id', type=int, action='store', nargs='+',
                         help='Taxon ID for which to return the lineage')
+    group.add_argument('-lca', '--lca', type=int, action='store', nargs='+',
+                        help='Taxon IDs for which to return the lowest common ancestor.')
     group.add_argument('-a', '--ali_file', type=pathlib.Path, action='store',
                         help='Alignment file. Will find taxon IDs of the sequence \
                             names given in the file.')
@@ -38,10 +43,16 @@ retrieve the lineage of said/a taxon ID.**')
     group.add_argument('-idf', '--tax_id_file', type=pathlib.Path, action='store',
                         help='File containing a list of taxon IDs for which to extract the \
                             lineage. Each taxon ID has to be stated in a new line.')
+    group.add_argument('--serve', default=False, action='store_true',
+                        help='Starts a daemon that loads the NCBI taxonomy once and answers \
+                            name and lineage requests of clients (see --server).')
     parser.add_argument('-l', '--lineage', type=str, choices=['full','reduced','minimal'],
                         action='store', default='full',
                         help='States whether to return the full, reduced (only unique ranks), \
                             or minimal lineage. Default is full.')
+    parser.add_argument('--ancestor', type=int, action='store', default=None,
+                        help='Used with --lca. States for each given taxon ID whether it \
+                            descends from this taxon ID.')
     parser.add_argument('--mode', type=str, choices=['strict','relaxed','lenient'],
                         default='strict', help='States how strict the search for taxon ID \
                             given a taxon name should be. Strict mode will only return \
@@ -62,13 +73,64 @@ retrieve the lineage of said/a taxon ID.**')
     parser.add_argument('--cores', default=1, action='store', type=int,
                         help='For parallellized searching. Declares the number of cores to us. \
                             Default is 1.')
+    parser.add_argument('--start_method', type=str, default=None,
+                        choices=['fork', 'forkserver', 'spawn'],
+                        help='Start method of the worker processes used with --cores. \
+                            Workers attach to the memory-mapped taxonomy themselves, \
+                            hence all methods work. Default is the platform default.')
+    parser.add_argument('--max_memory', type=float, default=2048,
+                        help='Memory budget in MB for deduplicating the input names. \
+                            Once exceeded, further names are deduplicated via temporary \
+                            files on disk. Default is 2048.')
+    parser.add_argument('--flush_interval', type=float, default=1.0,
+                        help='Maximal number of seconds between two writes of results to \
+                            the output files. Default is 1.')
+    parser.add_argument('--flush_size', type=int, default=500,
+                        help='Number of results after which they are written to the output \
+                            files. Default is 500.')
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help='Will count and time the stages of the search (candidates \
+                            scanned and scored, shave iterations, time per stage, ...) in \
+                            all processes and write a summary to <prefix>profile.json and \
+                            <prefix>profile.tsv.')
+    parser.add_argument('--cprofile', default=False, action='store_true',
+                        help='As --profile, and additionally writes a cProfile dump of each \
+                            worker process into the folder <prefix>profile.')
+    parser.add_argument('--metrics', type=pathlib.Path, default=None,
+                        help='File into which to write the progress of each phase \
+                            (names per second, ETA, success ratio, queue depth, RSS of \
+                            the main and worker processes) every --metrics_interval \
+                            seconds. Written in the Prometheus exposition format if the \
+                            file ends in .prom, else as JSON lines.')
+    parser.add_argument('--metrics_interval', type=float, default=10,
+                        help='Number of seconds between two writes of --metrics. Default is 10.')
+    parser.add_argument('--no_cache', default=False, action='store_true',
+                        help='Will not use the query cache of the database folder, which \
+                            keeps the results of earlier runs for the same mode, score \
+                            and taxonomy snapshot.')
+    parser.add_argument('--cache_size', type=int, default=1000000,
+                        help='Maximal number of results kept in the query cache; the least \
+                            recently used are removed first. Default is 1000000.')
     parser.add_argument('-db', default=str(os.path.join(os.environ.get("HOME"), ".ncbi_tax")),
                         action='store',
                         help='Path to and name of the folder in which to write/find the \
                             NCBI taxonomy database. Default is the folder ".ncbi_tax" in \
                             the home directory of the current user.')
+    parser.add_argument('--server', type=str, default=os.environ.get('NCBI_TAX_SERVER'),
+                        help='URL of a running daemon (e.g. http://127.0.0.1:8765) used \
+                            instead of loading the taxonomy. Falls back to loading it if \
+                            the daemon is not reachable. Default is the NCBI_TAX_SERVER \
+                            environment variable.')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Used with --serve. Address the daemon listens on. \
+                            Default is 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Used with --serve. Port the daemon listens on. Default is 8765.')
     parser.add_argument('--update', default=False, action='store_true',
                         help='Will update NCBI taxonomy database (will be downloaded).')
+    parser.add_argument('--incremental', default=False, action='store_true',
+                        help='Used with --update. Applies only the changes of the new \
+                            names.dmp to the previous database instead of rebuilding it.')
     args = parser.parse_args()
 
     if args.score > 100 or args.score < 60:
@@ -90,18 +152,31 @@ mode equals strict mode (which is more efficient).\n')
         args.prefix = str(args.tax_id_file) + '_'
 
     if args.update is True:
-        ncbi_tax.update_db(args.db)
+        ncbi_tax.update_db(args.db, args.incremental)
 
-    if args.taxon_name or args.ali_file or args.name_file:
-        search_name.get_taxids(args)
+    # Progress of the search and lineage phases, written in the background
+    args.run_metrics = metrics.open_metrics(args)
 
-    elif os.path.isfile(args.prefix+'lineage.tsv') and args.redo is False:
-        print('Output file '+args.prefix+'_lineage.tsv detetced. Nothing to do...')
-        print('Use the --redo flag should you wish to rerun the analysis, ')
-        print('which will overwrite the results file.')
+    try:
+        if args.serve:
+            daemon.serve(args)
 
-    else:
-        get_lineage.get_lineage(args)
+        elif args.taxon_name or args.ali_file or args.name_file:
+            search_name.get_taxids(args)
+
+        elif args.lca:
+            lca.get_lca(args)
+
+        elif os.path.isfile(args.prefix+'lineage.tsv') and args.redo is False:
+            print('Output file '+args.prefix+'_lineage.tsv detetced. Nothing to do...')
+            print('Use the --redo flag should you wish to rerun the analysis, ')
+            print('which will overwrite the results file.')
+
+        else:
+            get_lineage.get_lineage(args)
+    finally:
+        if args.run_metrics is not None:
+            args.run_metrics.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,107 @@
+import os
+import json
+import glob
+import time
+import cProfile
+
+# Counters of the search hot path
+COUNTERS = ['queries', 'approximate_searches', 'candidate_scans', 'candidates_scanned', 'candidates_scored',
+            'variants_tried', 'shave_iterations', 'homonym_hits', 'normalized_hits']
+# Stages of start_search (inclusive times) and the parts of search_approximate
+STAGES = ['exact', 'normalized', 'relaxed', 'reduce_name', 'reduced', 'minimal', 'shave']
+PARTS = ['scan', 'score']
+
+class SearchProfile:
+    '''Counters and timers of the search hot path. A TaxonomySearcher
+    updates them while its profile attribute is set; the profiles of
+    several processes are combined with add().'''
+
+    def __init__(self):
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.times = dict.fromkeys(STAGES + PARTS, 0.0)
+        self.processes = 1
+
+    def count(self, key:str, value:int = 1):
+        self.counts[key] += value
+
+    def lap(self, stage:str, start:float) -> float:
+        '''Adds the time since start to stage. Returns the current time,
+        the start of the next stage.'''
+        now = time.perf_counter()
+        self.times[stage] += now - start
+        return now
+
+    def add(self, other):
+        '''Adds the counters and times of other (SearchProfile or dict).'''
+        if isinstance(other, dict):
+            other = from_dict(other)
+        for key, value in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + value
+        for key, value in other.times.items():
+            self.times[key] = self.times.get(key, 0.0) + value
+        self.processes += other.processes
+
+    def to_dict(self) -> dict:
+        return {'processes': self.processes, 'counts': self.counts, 'times_s': self.times}
+
+    def summary(self) -> dict:
+        '''Returns the counters and times plus the averages per query.'''
+        queries = max(self.counts['queries'], 1)
+        summary = self.to_dict()
+        summary['per_query'] = {**{key: value / queries for key, value in self.counts.items()
+                                   if key != 'queries'},
+                                **{key+'_ms': 1000 * value / queries for key, value in self.times.items()}}
+        return summary
+
+    def write(self, file_name:str):
+        '''Writes the summary as JSON (file_name.json) and as TSV
+        (file_name.tsv) with one "section, key, value" line each.'''
+        summary = self.summary()
+        with open(file_name+'.json', 'w', encoding='utf-8') as w:
+            json.dump(summary, w, indent=2)
+        with open(file_name+'.tsv', 'w', encoding='utf-8') as w:
+            w.write('section\tkey\tvalue\n')
+            w.write(f'all\tprocesses\t{summary["processes"]}\n')
+            for section in ['counts', 'times_s', 'per_query']:
+                for key, value in summary[section].items():
+                    w.write(f'{section}\t{key}\t{value:.6g}\n')
+
+def from_dict(data:dict) -> SearchProfile:
+    profile = SearchProfile()
+    profile.counts.update(data['counts'])
+    profile.times.update(data['times_s'])
+    profile.processes = data['processes']
+    return profile
+
+class WorkerProfile:
+    '''Profile of a pool worker: the SearchProfile and, optionally, a
+    cProfile of the worker. Both are written into folder when the worker
+    exits (see collect).'''
+
+    def __init__(self, folder:str, cprofile:bool = False):
+        self.folder = folder
+        self.search = SearchProfile()
+        self.cprofile = None
+        if cprofile:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def dump(self):
+        file_name = os.path.join(self.folder, f'worker_{os.getpid()}')
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(file_name+'.prof')
+        with open(file_name+'.json', 'w', encoding='utf-8') as w:
+            json.dump(self.search.to_dict(), w)
+
+def collect(folder:str) -> SearchProfile:
+    '''Returns the sum of the SearchProfiles dumped by the workers into folder.'''
+    total = None
+    for file_name in sorted(glob.glob(os.path.join(folder, 'worker_*.json'))):
+        with open(file_name, encoding='utf-8') as t:
+            profile = from_dict(json.load(t))
+        if total is None:
+            total = profile
+        else:
+            total.add(profile)
+    return total
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import sqlite3
+
+CACHE_FILE = 'query_cache.sqlite'
+# Number of names looked up or stored per SQLite statement
+CACHE_BATCH = 500
+
+def cache_path(folder:str) -> str:
+    '''Returns the path to the query cache within the database folder.'''
+    return os.path.join(folder, CACHE_FILE)
+
+def connect(file_name:str) -> sqlite3.Connection:
+    '''Opens (and creates) the cache database. Several processes may use
+    it at the same time; writers wait for each other.'''
+    con = sqlite3.connect(file_name, timeout=60)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('''CREATE TABLE IF NOT EXISTS results (
+                       name TEXT NOT NULL, mode TEXT NOT NULL, score REAL NOT NULL,
+                       snapshot TEXT NOT NULL, tax_id INTEGER, record TEXT,
+                       used REAL NOT NULL,
+                       PRIMARY KEY (name, mode, score, snapshot)) WITHOUT ROWID''')
+    con.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+    return con
+
+class QueryCache:
+    '''
+    Class holding the results of earlier runs in an SQLite database shared
+    by all runs on the same taxonomy database. Results are keyed by the
+    original name, mode, score and taxonomy snapshot, so results of other
+    settings or of a previous taxonomy are never returned. Once more than
+    max_entries results are stored, the least recently used are evicted.
+
+    Parameters
+    ----------
+    file_name : str
+        Path to the SQLite file.
+    mode : str
+        Search mode of the run (strict, relaxed or lenient).
+    score : float
+        Minimal matching score of the run.
+    snapshot : str
+        Taxonomy snapshot (see ncbi_tax.read_snapshot).
+    max_entries : int
+        Maximal number of results kept in the cache.
+    '''
+
+    def __init__(self, file_name:str, mode:str, score:float, snapshot:str,
+                 max_entries:int = 1000000):
+        self.file_name = file_name
+        self.key = (mode, float(score), snapshot)
+        self.max_entries = max_entries
+        self.con = connect(file_name)
+        self.pending = []
+        self.hits = 0
+
+    def lookup(self, names:list) -> dict:
+        '''
+        Returns the cached results of names as a dictionary mapping each
+        found name to (tax_id, record). tax_id is None for failed names;
+        record is None for names failed in strict mode (only their name is
+        written to the failed file).
+        '''
+
+        found = {}
+        now = time.time()
+        for start in range(0, len(names), CACHE_BATCH):
+            batch = names[start:start+CACHE_BATCH]
+            rows = self.con.execute(
+                f'''SELECT name, tax_id, record FROM results
+                    WHERE mode = ? AND score = ? AND snapshot = ?
+                    AND name IN ({",".join("?" * len(batch))})''', (*self.key, *batch)).fetchall()
+            for name, tax_id, record in rows:
+                found[name] = (tax_id, tuple(json.loads(record)) if record is not None else None)
+            if rows:
+                self.con.executemany('UPDATE results SET used = ? WHERE name = ? AND mode = ? \
+AND score = ? AND snapshot = ?', [(now, row[0], *self.key) for row in rows])
+        self.con.commit()
+        self.hits += len(found)
+        return found
+
+    def add(self, name:str, tax_id:int|None, record:tuple|None):
+        '''Stores the result of name; written in batches of CACHE_BATCH.'''
+        self.pending.append((name, *self.key, None if tax_id is None else int(tax_id),
+                             None if record is None else json.dumps(record, default=lambda x: x.item()),
+                             time.time()))
+        if len(self.pending) >= CACHE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.con.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 self.pending)
+            self.con.commit()
+            self.pending = []
+
+    def evict(self):
+        '''Removes the least recently used results beyond max_entries.'''
+        excess = self.con.execute('SELECT COUNT(*) FROM results').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.con.execute('DELETE FROM results WHERE (name, mode, score, snapshot) IN \
+(SELECT name, mode, score, snapshot FROM results ORDER BY used LIMIT ?)', (excess,))
+            self.con.commit()
+
+    def close(self):
+        self.flush()
+        self.evict()
+        self.con.close()
+
+def invalidate(folder:str, snapshot:str):
+    '''Removes all cached results not computed on snapshot, e.g. after the
+    taxonomy database was updated. Does nothing if there is no cache.'''
+
+    file_name = cache_path(folder)
+    if os.path.exists(file_name) is False:
+        return
+    con = connect(file_name)
+    removed = con.execute('DELETE FROM results WHERE snapshot != ?', (snapshot,)).rowcount
+    con.commit()
+    con.execute('VACUUM')
+    con.close()
+    if removed:
+        print(f'Removed {removed} results of the previous taxonomy from the query cache.')
@@ -1,11 +1,33 @@
+import os
 import time
+import sqlite3
 import multiprocessing
+import multiprocessing.util
+from collections import Counter
+import numpy as np
 from tqdm import tqdm
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 import get_lineage
+import daemon_client
 import utils
 import ncbi_tax
+import taxa_store
+import query_cache
+import profiling
+import metrics
+
+# TaxonomySearcher instance of a pool worker, set by init_worker
+worker_searcher = None
+# Comment of the results found by TaxonomySearcher.search_normalized
+NORMALIZED_COMMENT = 'NORMALIZED - exact match after normalizing the name'
+# Number of consecutive names grouped at a time by group_names, and
+# maximal number of names per group
+GROUP_BATCH = 50000
+GROUP_SIZE = 100
+# Number of matches after which dict_search saves a checkpoint, which also
+# frees the name hashes the writer keeps for the checkpoint index
+CHECKPOINT_SIZE = 10000
 
 class Query:
     '''Class to hold information about a taxon name query.'''
@@ -24,6 +46,8 @@ class Query:
         self.relaxed_score = 0
         self.time = None
         self.comment = None
+        # Tax IDs of a normalized match of several taxa (see search_normalized)
+        self.normalized_homonyms = None
 
     def print_info(self):
         print('original', self.original)
@@ -37,6 +61,7 @@ class Query:
         print('strict_score', self.strict_score)
         print('relaxed_score', self.relaxed_score)
         print('comment', self.comment)
+        print('normalized_homonyms', self.normalized_homonyms)
 
     def update(self, row, score=0):
         '''Function to update the Query instance with found taxon information.'''
@@ -67,6 +92,16 @@ class Query:
 
         return scores
 
+    def get_variants(self, word:str) -> list:
+        """
+        Returns the upper case query variants in the order used by get_score:
+        self.name, self.red_name, self.no_numbers, self.min_name and word.
+        Variants that are not set are None.
+        """
+
+        variants = [self.name, self.red_name, self.no_numbers, self.min_name, word]
+        return [v.upper() if v else None for v in variants[:4]] + [word.upper()]
+
     def reduce_name(self):
         """
         Tidy up the name (self.name) by omitting some words and replacing others. 
@@ -121,20 +156,27 @@ class TaxonomySearcher:
     taxa_df = None  # Class-level variable
     list_index = None
     taxa_name_dict = None
-    homonyms_dict = None
     limit = 95
+    # profiling.SearchProfile updated while searching, None if not profiled
+    profile = None
 
     @classmethod
-    def initialize(cls, taxa_df, list_index, taxa_name_dict, homonyms_dict, limit):
-        '''Class method to initialize class-level variables.'''	
+    def initialize(cls, taxa_df, list_index, taxa_name_dict, limit):
+        '''Class method to initialize class-level variables.
+        taxa_name_dict maps names to rows (a dict or the ExactIndex of the
+        taxa store). Homonyms are read from the taxa store when a dup row
+        is hit.'''	
         cls.taxa_df = taxa_df
         cls.list_index = list_index
         cls.taxa_name_dict = taxa_name_dict
         cls.limit = limit
-        cls.homonyms_dict = homonyms_dict
 
     def __init__(self, name):
         self.name = name
+        # Matches of words kept while searching a group of names (see
+        # process_group), None if not kept
+        self.match_cache = None
+        self.cache_hits = 0
 
     def get_subset(self, letter):
         '''
@@ -145,51 +187,244 @@ class TaxonomySearcher:
             limits = self.list_index[letter]
         else:
             limits = self.list_index['_']
-        return self.taxa_df.iloc[limits[0]:limits[1]]
+        return self.taxa_df.names(limits[0], limits[1])
 
     def search_exact(self, query):
         '''
         Function to search for exact matches of a given Query instance.	
         Returns None, updates the Query instance.
         '''
-        if query.name in self.taxa_name_dict:
-            idx = self.taxa_name_dict[query.name]
+        idx = self.taxa_name_dict.get(query.name)
+        if idx is not None:
             # If not a homonym, update directly
-            if self.taxa_df.at[idx, 'dup'] == 0:
-                query.update(self.taxa_df.iloc[idx].to_numpy())
+            if self.taxa_df.dup[idx] == 0:
+                query.update(self.taxa_df.row(idx))
             # If homonym, add comment
             else:
-                homonyms_idx = self.homonyms_dict[self.taxa_df.at[idx, 'name_txt']]
-                homonyms = [self.taxa_df.at[i, 'tax_id'] for i in homonyms_idx]
+                if self.profile is not None:
+                    self.profile.count('homonym_hits')
+                homonyms_idx = self.taxa_df.homonyms(idx)
+                homonyms = [self.taxa_df.tax_id[i] for i in homonyms_idx]
                 query.comment = 'HOMONYM - multiple entries found: {}'.format(', '.join([str(tid) for tid in homonyms]))
 
-    def search_approximate(self, query, subset, word):
-        matching_indices = subset[subset['name_txt'].str.contains(word, case=False,
-                            na=False, regex=False)].index
-        best_scores = [0, 0, 0, 0, 0]
-        best_candidates = [None, None, None, None, None]
+    def search_normalized(self, query):
+        '''
+        Function to search for a Query instance whose name equals a name of
+        the taxonomy after normalizing both (see utils.normalize_name), e.g.
+        differing only by case, whitespace, quotes or 'sp'/'sp.'. As for the
+        fuzzy search, the match must score above the limit. Names
+        normalizing to homonyms or to the names of several tax IDs are not
+        matched, their tax IDs are kept in query.normalized_homonyms and
+        commented by start_search if the fuzzy search fails as well.
+        Returns None, updates the Query instance.
+        '''
+        rows = self.taxa_df.normalized_index().get_all(query.name)
+        if len(rows) == 0:
+            return
+        tax_ids = list(dict.fromkeys(self.taxa_df.tax_id[idx] for idx in rows))
+        if len(tax_ids) > 1 or any(self.taxa_df.dup[idx] != 0 for idx in rows):
+            if self.profile is not None:
+                self.profile.count('homonym_hits')
+            query.normalized_homonyms = tax_ids
+            return
+
+        row = self.taxa_df.row(rows[0])
+        score = fuzz.ratio(query.name.upper(), row[1].upper())
+        if score > self.limit:
+            if self.profile is not None:
+                self.profile.count('normalized_hits')
+            query.update(row, score)
+            query.comment = NORMALIZED_COMMENT
 
-        for idx in matching_indices:
-            candidate = subset.at[idx, 'name_txt']
-            if query.viral and not any(v in candidate.upper()
-                for v in ['VIRAL', 'VIRUS', 'VIRIDAE', 'PHAGE', 'BACTERIOPHAGE']):
+    def find_matches(self, subset, word, window:tuple|None = None):
+        '''
+        Function to find all names in subset containing word (case-insensitive).
+        Candidates are taken from the trigram index of the taxa store and then
+        verified, which gives the same matches as a substring scan of subset.
+        If window (lowest, highest) is given, candidates whose upper case
+        name is not within this range of lengths are skipped before.
+        Returns array of row indices.
+        '''
+        if self.match_cache is not None and window is not None:
+            # The names of a group differ in length, so the kept matches
+            # hold all longer names
+            window = (window[0], np.inf)
+        matches = self.cached_matches(subset, word, window)
+        if matches is not None:
+            return matches
+
+        if self.profile is not None:
+            self.profile.count('candidate_scans')
+        candidates = self.taxa_df.trigram_candidates(word, subset.index.start, subset.index.stop)
+        if candidates is not None and window is not None:
+            lengths = self.taxa_df.upper_lengths(subset.index.start, subset.index.stop)
+            lengths = lengths[candidates - subset.index.start]
+            candidates = candidates[(lengths >= window[0]) & (lengths <= window[1])]
+        if self.profile is not None:
+            self.profile.count('candidates_scanned', len(subset) if candidates is None else len(candidates))
+        if candidates is None:
+            matches = subset[subset.str.contains(word, case=False,
+                             na=False, regex=False)].index.to_numpy()
+            return self.store_matches(subset, word, None, matches)
+
+        upper_word = word.upper()
+        upper_names = self.get_upper(subset)
+        start = subset.index.start
+        matches = candidates[np.fromiter((upper_word in upper_names[idx] for idx in (candidates-start).tolist()),
+                                         dtype=bool, count=len(candidates))]
+        return self.store_matches(subset, word, window, matches)
+
+    def cached_matches(self, subset, word:str, window:tuple|None):
+        '''
+        Function to look up the matches of word in subset kept in match_cache.
+        If word is not kept, its matches are taken from those of the kept
+        word contained in it with the fewest matches (names containing word
+        contain that word). Matches found for a wider window can be used, as
+        the candidates outside a query's windows are never scored (see
+        search_approximate).
+        Returns array of row indices or None if not kept.
+        '''
+        if self.match_cache is None:
+            return None
+        start = subset.index.start
+        upper_word = word.upper()
+        best = None
+        for (kept_start, kept_word), (kept_window, matches) in self.match_cache.items():
+            if kept_start != start or kept_word not in upper_word:
                 continue
-            scores = query.get_score(word, candidate)
-            for i in range(len(scores)):
-                if scores[i] > self.limit and scores[i] > best_scores[i]:
-                    best_scores[i] = scores[i]
-                    best_candidates[i] = idx
-
-        for i in range(len(best_candidates)):
-            if best_candidates[i] is not None:
-                if self.taxa_df.at[best_candidates[i], 'dup'] == 0:
-                    query.update(self.taxa_df.iloc[best_candidates[i]].to_numpy(), best_scores[i])
-                else:
-                    # If homonym, add comment
-                    homonyms_idx = self.homonyms_dict[self.taxa_df.at[best_candidates[i], 'name_txt']]
-                    homonyms = [self.taxa_df.at[i, 'tax_id'] for i in homonyms_idx]
-                    query.comment = 'HOMONYM - multiple entries found: {}'.format(', '.join([str(tid) for tid in homonyms]))
-                break
+            if kept_window is not None and (window is None or kept_window[0] > window[0]
+                                            or kept_window[1] < window[1]):
+                continue
+            if kept_word == upper_word:
+                self.cache_hits += 1
+                return matches
+            if best is None or len(matches) < len(best[1]):
+                best = (kept_window, matches)
+        if best is None:
+            return None
+
+        self.cache_hits += 1
+        kept_window, candidates = best
+        if self.profile is not None:
+            self.profile.count('candidates_scanned', len(candidates))
+        upper_names = self.get_upper(subset)
+        matches = candidates[np.fromiter((upper_word in upper_names[idx] for idx in (candidates-start).tolist()),
+                                         dtype=bool, count=len(candidates))]
+        return self.store_matches(subset, word, kept_window, matches)
+
+    def store_matches(self, subset, word:str, window:tuple|None, matches:np.ndarray) -> np.ndarray:
+        '''Keeps the matches of word in match_cache, if set. Returns matches.'''
+        if self.match_cache is not None:
+            self.match_cache[(subset.index.start, word.upper())] = (window, matches)
+        return matches
+
+    def find_prefix_matches(self, subset, words:list, window:tuple|None = None) -> dict:
+        '''
+        Function to find the names in subset containing each of words, where
+        each word is shaved from the one before (see utils.shave_name), i.e.
+        names containing a word contain all later words. The names containing
+        the last word are found with find_matches (once for all words), those
+        of each earlier word by checking the matches of the word after it.
+        window must hold the lengths searched for all words (see find_matches).
+        Returns dictionary mapping each word to its array of row indices.
+        '''
+        if self.match_cache is not None and window is not None:
+            window = (window[0], np.inf)
+        upper_names = self.get_upper(subset)
+        start = subset.index.start
+        matches = {}
+        shorter = None
+        for word in reversed(words):
+            upper_word = word.upper()
+            if shorter is None or shorter.upper() not in upper_word:
+                matches[word] = self.find_matches(subset, word, window)
+            else:
+                matches[word] = self.cached_matches(subset, word, window)
+            if matches[word] is None:
+                candidates = matches[shorter]
+                if self.profile is not None:
+                    self.profile.count('candidates_scanned', len(candidates))
+                matches[word] = self.store_matches(subset, word, window, candidates[np.fromiter(
+                    (upper_word in upper_names[idx] for idx in (candidates-start).tolist()),
+                    dtype=bool, count=len(candidates))])
+            shorter = word
+        return matches
+
+    def get_upper(self, subset):
+        '''
+        Function to get the upper case names of a subset. The upper case
+        names are computed once per subset and cached in the taxa store.
+        Returns list of upper case names.
+        '''
+        return self.taxa_df.upper_names(subset.index.start, subset.index.stop)
+
+    def search_approximate(self, query, subset, word, matches = None):
+        '''
+        Function to search the names of subset containing word for the best
+        fuzzy match of the variants of a given Query instance. matches are
+        the rows containing word, if already known (see find_prefix_matches).
+        Returns None, updates the Query instance.
+        '''
+        profile = self.profile
+        if profile is not None:
+            profile.count('approximate_searches')
+            lap = time.perf_counter()
+
+        # fuzz.ratio is bounded by the lengths of the strings, so only
+        # names within a window of lengths around one of the query variants
+        # can score above the limit (see utils.ratio_window). Names outside
+        # the windows of all variants are skipped before the substring check.
+        variants = [v for v in dict.fromkeys(query.get_variants(word)) if v is not None]
+        windows = [utils.ratio_window(len(v), self.limit) for v in variants]
+        candidates = matches
+        if candidates is None:
+            candidates = self.find_matches(subset, word, (min(w[0] for w in windows),
+                                                          max(w[1] for w in windows)))
+        upper_names = self.get_upper(subset)
+        start = subset.index.start
+
+        if query.viral:
+            candidates = candidates[np.fromiter((any(v in upper_names[idx] for v in
+                ['VIRAL', 'VIRUS', 'VIRIDAE', 'PHAGE', 'BACTERIOPHAGE']) for idx in (candidates-start).tolist()),
+                dtype=bool, count=len(candidates))]
+        if profile is not None:
+            lap = profile.lap('scan', lap)
+        if len(candidates) == 0:
+            return
+
+        # Each variant only scores the candidates within its own window. The
+        # first variant (in order) with a candidate above the limit wins,
+        # hence later variants are only scored if needed. extractOne raises
+        # its cutoff to the best score found so far and returns the first
+        # candidate with the best score. The result equals scoring all
+        # candidates against all variants.
+        lengths = self.taxa_df.upper_lengths(start, subset.index.stop)[candidates - start]
+        for variant, (lowest, highest) in zip(variants, windows):
+            window = candidates[(lengths >= lowest) & (lengths <= highest)]
+            if profile is not None:
+                profile.count('candidates_scored', len(window))
+                profile.count('variants_tried')
+            if len(window) == 0:
+                continue
+            match = process.extractOne(variant, [upper_names[idx] for idx in (window-start).tolist()],
+                                       scorer=fuzz.ratio, score_cutoff=self.limit)
+            if match is None or match[1] <= self.limit:
+                continue
+
+            best_candidate = int(window[match[2]])
+            if self.taxa_df.dup[best_candidate] == 0:
+                query.update(self.taxa_df.row(best_candidate), float(match[1]))
+            else:
+                # If homonym, add comment
+                if profile is not None:
+                    profile.count('homonym_hits')
+                homonyms_idx = self.taxa_df.homonyms(best_candidate)
+                homonyms = [self.taxa_df.tax_id[i] for i in homonyms_idx]
+                query.comment = 'HOMONYM - multiple entries found: {}'.format(', '.join([str(tid) for tid in homonyms]))
+            break
+
+        if profile is not None:
+            profile.lap('score', lap)
 
 def start_search(q:Query, searcher:TaxonomySearcher, mode:str):
     '''Function to start the search for a given Query instance.	
@@ -205,22 +440,66 @@ def start_search(q:Query, searcher:TaxonomySearcher, mode:str):
         States whether to perform strict, relaxed or lenient search.
     '''
 
+    profile = searcher.profile
+    lap = None
+    if profile is not None:
+        profile.count('queries')
+        lap = time.perf_counter()
+
     if mode == 'strict':
         searcher.search_exact(q)
+        if profile is not None:
+            profile.lap('exact', lap)
+        return
+
+    # Names equal to a taxon name after normalizing need no fuzzy search
+    searcher.search_normalized(q)
+    if profile is not None:
+        lap = profile.lap('normalized', lap)
+    if q.tax_id:
         return
 
+    search_fuzzy(q, searcher, mode, lap)
+    # Normalized matches of several taxa are reported only if the fuzzy
+    # search found neither a match nor homonyms
+    if q.tax_id is None and q.comment is None and q.normalized_homonyms:
+        q.comment = 'HOMONYM - multiple entries found: {}'.format(', '.join([str(tid) for tid in q.normalized_homonyms]))
+
+def search_fuzzy(q:Query, searcher:TaxonomySearcher, mode:str, lap:float|None = None):
+    '''Function to run the relaxed and (in lenient mode) lenient fuzzy
+    search tiers of start_search for a given Query instance.
+    Returns None, updates the Query instance.
+
+    Parameters
+    ----------
+    q : Query
+        Query instance holding the name to search for and other information.
+    searcher : TaxonomySearcher
+        TaxonomySearcher instance to perform the search.
+    mode : str
+        States whether to perform relaxed or lenient search.
+    lap : float
+        Start time of the profiled stage (if profiling). Default=None
+    '''
+
+    profile = searcher.profile
+
     # relaxed and lenient search: Get subset according to first letter
     first_letter = q.name[0].upper()
     subset = searcher.get_subset(first_letter)
 
     #relaxed search
     searcher.search_approximate(q, subset, q.name)
+    if profile is not None:
+        lap = profile.lap('relaxed', lap)
     if q.tax_id or mode == 'relaxed':
         return
 
     # lenient search
     # Reduce the name to its most important parts
     q.reduce_name()
+    if profile is not None:
+        lap = profile.lap('reduce_name', lap)
 
     # If we have a reduced name, search with it
     if q.red_name != q.name:
@@ -228,6 +507,8 @@ def start_search(q:Query, searcher:TaxonomySearcher, mode:str):
             first_letter = q.red_name[0].upper()
             subset = searcher.get_subset(first_letter)
         searcher.search_approximate(q, subset, q.red_name)
+    if profile is not None:
+        lap = profile.lap('reduced', lap)
     if q.tax_id:
         return
 
@@ -237,6 +518,8 @@ def start_search(q:Query, searcher:TaxonomySearcher, mode:str):
             first_letter = q.min_name[0].upper()
             subset = searcher.get_subset(first_letter)
         searcher.search_approximate(q, subset, q.min_name)
+    if profile is not None:
+        lap = profile.lap('minimal', lap)
     if q.tax_id:
         return
 
@@ -247,18 +530,34 @@ def start_search(q:Query, searcher:TaxonomySearcher, mode:str):
             first_letter = q.min_name[0].upper()
             subset = searcher.get_subset(first_letter)
 
+        # Names containing a shaved name contain all names shaved from it,
+        # so the subset is scanned once, for the shortest one. The lengths
+        # cover the variants of all shaved names.
+        shaved = [q.min_name]
+        while utils.shave_name(shaved[-1]):
+            shaved.append(utils.shave_name(shaved[-1]))
+        lengths = [len(v) for v in [q.name, q.red_name, q.no_numbers, *shaved] if v]
+        matches = searcher.find_prefix_matches(subset, shaved,
+                                               (utils.ratio_window(min(lengths), searcher.limit)[0],
+                                                utils.ratio_window(max(lengths), searcher.limit)[1]))
+
         while q.min_name:
-            searcher.search_approximate(q, subset, q.min_name)
+            if profile is not None:
+                profile.count('shave_iterations')
+            searcher.search_approximate(q, subset, q.min_name, matches[q.min_name])
             if q.tax_id:
                 break
             # Set temp name to the name before shaving (for keeping score)
             q.no_numbers = q.min_name
             q.min_name = utils.shave_name(q.min_name)
+    if profile is not None:
+        profile.lap('shave', lap)
 
 def process_name(args):
     '''
     Function to process a single name.
-    Returns tax_id and result string if found, else None and result.
+    Returns tax_id and result record if found, else None and result record.
+    The fields of the record are the columns of the results file.
     '''
 
     # Unpack arguments
@@ -273,10 +572,10 @@ def process_name(args):
     # End timer
     query.time = round(time.time() - start, 5)
 
-    # Prepare result string
-    result = (f"{query.original}\t{query.tax_id}\t{query.name_txt}\t{query.name_class}\t"
-                  f"{query.strict_score}\t{query.relaxed_score}\t{query.red_name}\t{query.no_numbers}\t"
-                  f"{query.min_name}\t{query.time}\t{query.comment}")
+    # Prepare result record
+    result = (query.original, query.tax_id, query.name_txt, query.name_class,
+              query.strict_score, query.relaxed_score, query.red_name, query.no_numbers,
+              query.min_name, query.time, query.comment)
     
     # If successful, return tax_id and result
     if query.tax_id:   
@@ -285,6 +584,108 @@ def process_name(args):
     # If not successful, return None and result
     return None, result
 
+def init_worker(folder:str, limit:float, profile_dir:str|None = None, cprofile:bool = False):
+    '''
+    Initializer of the index_search worker pool. Attaches the worker to the
+    memory-mapped taxa store in folder instead of inheriting or receiving
+    the parent's TaxonomySearcher, so all workers share the page cache.
+    Works with the fork, forkserver and spawn start methods.
+
+    Parameters
+    ----------
+    folder : str
+        Path to the folder holding the NCBI taxonomy database files.
+    limit : float
+        Minimal matching score (TaxonomySearcher.limit).
+    profile_dir : str
+        If given, the worker is profiled and writes its profile into this
+        folder when it exits (see profiling.WorkerProfile).
+    cprofile : bool
+        States whether to also write a cProfile dump of the worker.
+    '''
+    global worker_searcher
+
+    taxa_df = taxa_store.TaxaStore(folder)
+    list_index = ncbi_tax.read_indices(os.path.join(folder, 'taxa_indeces.txt'))
+    TaxonomySearcher.initialize(taxa_df, list_index, {}, limit)
+    TaxonomySearcher.profile = None
+    if profile_dir is not None:
+        worker_profile = profiling.WorkerProfile(profile_dir, cprofile)
+        TaxonomySearcher.profile = worker_profile.search
+        # Runs when the worker exits after the pool was closed
+        multiprocessing.util.Finalize(None, worker_profile.dump, exitpriority=10)
+    worker_searcher = TaxonomySearcher('ncbi')
+
+def process_worker(args):
+    '''
+    Function to process a single name in a pool worker set up by init_worker.
+    Returns tax_id and result record if found, else None and result record.
+    '''
+    name, mode = args
+    return process_name((name, mode, worker_searcher))
+
+def process_group(args):
+    '''
+    Function to process a group of names (see group_names) in a pool worker
+    set up by init_worker. The names are searched one after another, reusing
+    the candidate scans of their shared minimal and shaved names (see
+    TaxonomySearcher.match_cache); the results equal those of process_worker.
+    Returns the results of process_worker of all names and the number of
+    reused candidate scans.
+    '''
+    names, mode = args
+    worker_searcher.match_cache = {} if len(names) > 1 else None
+    worker_searcher.cache_hits = 0
+    results = [process_name((name, mode, worker_searcher)) for name in names]
+    worker_searcher.match_cache = None
+    return results, worker_searcher.cache_hits
+
+def group_key(name:str) -> tuple | None:
+    '''
+    Function to get the key by which names are grouped for the lenient
+    search: the minimal name (the reduced name if there is none, see
+    Query.reduce_name) and whether the name is viral. Names differing only
+    in e.g. accession or clone numbers share their key and thus the names
+    shaved down from it. Returns None if the name cannot be reduced.
+    '''
+    query = Query(name)
+    if not query.name:
+        return None
+    query.reduce_name()
+    if query.red_name is None:
+        return None
+    return query.min_name or query.red_name, query.viral
+
+def group_names(names, batch:int = GROUP_BATCH, size:int = GROUP_SIZE):
+    '''
+    Function to group names sharing their group_key. Names are grouped
+    within batches of batch consecutive names, which bounds the memory, and
+    groups are split into lists of at most size names.
+    Yields lists of names, in order of their first name.
+    '''
+    groups = {}
+    for i, name in enumerate(names, 1):
+        key = group_key(name)
+        groups.setdefault(name if key is None else key, []).append(name)
+        if i % batch == 0:
+            for group in groups.values():
+                for start in range(0, len(group), size):
+                    yield group[start:start+size]
+            groups = {}
+    for group in groups.values():
+        for start in range(0, len(group), size):
+            yield group[start:start+size]
+
+class CheckpointFilter:
+    '''Container of all names found in the checkpoint files.'''
+
+    def __init__(self, processed_names, failed_names):
+        self.processed_names = processed_names
+        self.failed_names = failed_names
+
+    def __contains__(self, name):
+        return name in self.processed_names or name in self.failed_names
+
 def setup(args, output_files):
     '''
     Function to set up the names to process and the TaxonomySearcher class.
@@ -292,18 +693,24 @@ def setup(args, output_files):
     '''
 
     taxa_df, list_index = ncbi_tax.get_taxa(args.db)
-    taxa_name_dict = dict(zip(taxa_df['name_txt'].values, taxa_df.index))
-    ncbi_tax.add_dup_to_taxa(args.db, taxa_df)
-    homonyms_dict = ncbi_tax.get_homonyms_file(args.db, taxa_df)
 
     # Initialize the TaxonomySearcher class
-    TaxonomySearcher.initialize(taxa_df, list_index, taxa_name_dict, homonyms_dict, args.score)
+    TaxonomySearcher.initialize(taxa_df, list_index, taxa_df.exact_index(), args.score)
     searcher = TaxonomySearcher('ncbi')
 
+    return setup_names(args, output_files), searcher
+
+def setup_names(args, output_files):
+    '''
+    Function to set up the names to process: streams the input names and
+    removes duplicates and names found in the checkpoint files.
+    Returns utils.UniqueNames instance.
+    '''
+
     processed_names, failed_names = utils.load_checkpoint(output_files, args.redo)
 
     names = []
-    # Names to process
+    # Names to process, streamed from the name file
     if args.taxon_name:
         names = args.taxon_name
     elif args.ali_file:
@@ -311,26 +718,25 @@ def setup(args, output_files):
         names = utils.read_ali_file(args.ali_file)
     elif args.name_file:
         print(f"Reading in name file {args.name_file}...")
-        names = utils.read_name_file(args.name_file)
+        names = utils.iter_name_file(args.name_file)
 
-    unique_names = set(names)
-    print(f"Loaded {len(names)} names. Of those {len(unique_names)} are unique.")
+    # Deduplicate and exclude already processed names on the fly
+    names_to_process = utils.UniqueNames(names, exclude=CheckpointFilter(processed_names, failed_names),
+                                         max_memory=args.max_memory)
 
-    # Exclude already processed names
-    if len(processed_names) > 0:
-        names_to_process = [name for name in unique_names if name
-            not in processed_names and name not in failed_names]
-    else:
-        names_to_process = unique_names
-
-    return names_to_process, searcher
+    return names_to_process
 
-def index_search(args, results_tuple, searcher, output_files):
+def index_search(args, results_tuple, searcher, output_files, cache = None, run_metrics = None):
 
     failed, tax_ids = results_tuple
-    failed2 = []
-    results = []
     processed_count = 0
+    normalized_count = 0
+    group_count, grouped_count, reused_count = 0, 0, 0
+
+    # Results and failed names are written (and printed) by a background thread
+    writer = utils.ResultWriter(output_files, flush_interval=args.flush_interval,
+                                flush_size=args.flush_size, quiet=args.quiet, echo=not args.quiet)
+    phase = metrics.start(run_metrics, 'index_search', len(failed), writer)
 
     # Prepare multiprocessing
     if args.cores in ['AUTO', 'auto']:
@@ -338,104 +744,293 @@ def index_search(args, results_tuple, searcher, output_files):
     else:
         num_processes = int(args.cores)
 
-    pool = multiprocessing.Pool(num_processes)
-
-    # Prepare arguments for parallel processing
-    args_list = [(name, args.mode, searcher) for name in failed]
+    # Profiled workers write their profiles into profile_dir on exit
+    profile_dir = None
+    if searcher.profile is not None:
+        profile_dir = args.prefix + 'profile'
+        os.makedirs(profile_dir, exist_ok=True)
+        for file_name in os.listdir(profile_dir):
+            if file_name.startswith('worker_'):
+                os.remove(os.path.join(profile_dir, file_name))
+
+    # Workers attach to the taxa store themselves, only names are sent
+    ctx = multiprocessing.get_context(args.start_method)
+    pool = ctx.Pool(num_processes, initializer=init_worker,
+                    initargs=(searcher.taxa_df.folder, searcher.limit, profile_dir, args.cprofile))
+
+    # Prepare arguments for parallel processing. In lenient mode, names
+    # sharing their minimal name are searched together.
+    if args.mode == 'lenient':
+        groups = group_names(failed)
+    else:
+        groups = ([name] for name in failed)
+    args_list = phase.feed(((group, args.mode) for group in groups), size=lambda task: len(task[0]))
     if not args.quiet:
         print("name\ttax_id\tname_txt\tname_class\tstrict_score\t"
 "relaxed_score\treduced_name\tno_number_name\tmin_name\ttime(s)\tcomment")
 
-    with pool:
-        # Process names in parallel
-        for result in tqdm(pool.imap(process_name, args_list),
-                            total=len(failed), disable=not args.quiet):
-            processed_count += 1
-
-            if result[0] is None:
-                failed2.append(result[1].split('\t')[0])  # Collect failed2 names
-            else:
-                tax_ids.append(int(result[0])) # Collect tax_ids
-
-            results.append(result[1])
-
-            if not args.quiet:
-                print(result[1])
-
-            # Periodically save checkpoint
-            if processed_count % 500 == 0:
-                utils.write_checkpoint(output_files, results, failed2,
-                                        processed_count, mode=True, quiet=args.quiet)
+    with pool, tqdm(total=len(failed), disable=not args.quiet) as progress:
+        # Process groups of names in parallel
+        for results, reused in pool.imap(process_group, args_list):
+            progress.update(len(results))
+            if len(results) > 1:
+                group_count += 1
+                grouped_count += len(results)
+                reused_count += reused
+
+            for result in results:
+                processed_count += 1
+                phase.add(result[0] is not None)
+
+                if result[0] is not None:
+                    tax_ids[int(result[0])] += 1 # Collect tax_ids
+                    normalized_count += result[1][10] == NORMALIZED_COMMENT
+
+                writer.put(result[1], failed=result[0] is None)
+                if cache is not None:
+                    cache.add(result[1][0], result[0], result[1])
+
+                # Periodically save checkpoint
+                if processed_count % 500 == 0:
+                    writer.checkpoint(processed_count)
+
+        # Let the workers exit (and write their profiles) before terminating
+        phase.measure()
+        pool.close()
+        pool.join()
+
+    if profile_dir is not None:
+        worker_profiles = profiling.collect(profile_dir)
+        if worker_profiles is not None:
+            searcher.profile.add(worker_profiles)
 
     # Final checkpoint save
-    utils.write_checkpoint(output_files, results, failed2, processed_count, mode=True)
+    writer.close(processed_count)
+    metrics.finish(run_metrics, phase)
+    print(f'{normalized_count} of {processed_count} names were matched by the normalized \
+exact search without fuzzy search.')
+    if args.mode == 'lenient':
+        print(f'{grouped_count} of {processed_count} names were searched in {group_count} groups \
+of names with the same minimal name, reusing {reused_count} candidate scans.')
 
     return tax_ids
 
-def dict_search(names_to_process, searcher, output_files, quiet = False):
+def dict_search(names_to_process, searcher, output_files, quiet = False, cache = None,
+                run_metrics = None, checkpoint_size:int = CHECKPOINT_SIZE):
     '''
     Function to perform exact dictionary search for taxon names.	
-    Returns failed names and found tax_ids.
+    names_to_process may be any iterable and is consumed lazily.
+    A checkpoint is saved every checkpoint_size matches to keep memory
+    bounded.
+    Found names are stored in cache (query_cache.QueryCache), if given.
+    Progress is reported to run_metrics (metrics.RunMetrics), if given.
+    Returns failed names (utils.NameSpool) and found tax_ids (Counter).
     '''
     if not quiet:
         print("name\ttax_id\tname_txt\tname_class\tstrict_score\t"
 "relaxed_score\treduced_name\tno_number_name\tmin_name\ttime(s)\tcomment")
         
-    results, failed, tax_ids = [], [], []
+    failed, tax_ids = utils.NameSpool(), Counter()
+    found = 0
+    writer = utils.ResultWriter(output_files, quiet=quiet, echo=not quiet)
+    phase = metrics.start(run_metrics, 'dict_search', None, writer)
     for name in tqdm(names_to_process, disable=not quiet):
         result = process_name((name, 'strict', searcher))
+        phase.add(result[0] is not None)
         if result[0] is None:
-            failed.append(result[1].split('\t')[0])
+            failed.append(result[1][0])
+            writer.echo(result[1])
         else:
-            results.append(result[1])
-            tax_ids.append(int(result[0]))
+            writer.put(result[1])
+            tax_ids[int(result[0])] += 1
+            found += 1
+            if cache is not None:
+                cache.add(result[1][0], result[0], result[1])
 
-        if not quiet:
-            print(result[1])
+            # Periodically save checkpoint to keep memory bounded
+            if found % checkpoint_size == 0:
+                writer.checkpoint(found)
 
     # Checkpoint save
-    utils.write_checkpoint(output_files, results, failed,
-                           len(results), mode = False, quiet=quiet)
-    
-    # Clear the taxa_name_dict to free up memory
-    searcher.taxa_name_dict.clear()
+    writer.checkpoint(found)
+    writer.close()
+    metrics.finish(run_metrics, phase)
 
     return failed, tax_ids
 
+def open_cache(args) -> query_cache.QueryCache | None:
+    '''
+    Function to open the query cache of the database folder for the mode
+    and score of this run. Returns None if the cache is disabled
+    (--no_cache) or cannot be opened (e.g. read-only database folder).
+    '''
+
+    if args.no_cache:
+        return None
+    try:
+        return query_cache.QueryCache(query_cache.cache_path(args.db), args.mode, args.score,
+                                      ncbi_tax.read_snapshot(args.db), args.cache_size)
+    except sqlite3.Error as x:
+        print(f'Query cache {query_cache.cache_path(args.db)} not used: {x}')
+        return None
+
+def cache_search(args, names_to_process, cache, output_files):
+    '''
+    Function to look up names in the query cache before searching them.
+    Cached results are written as by dict_search and index_search.
+    Returns the names not in the cache (utils.NameSpool), the found
+    tax_ids (Counter) and the number of names taken from the cache.
+    '''
+
+    uncached, tax_ids = utils.NameSpool(), Counter()
+    writer = utils.ResultWriter(output_files, flush_interval=args.flush_interval,
+                                flush_size=args.flush_size, quiet=args.quiet, echo=not args.quiet)
+
+    batch = []
+    def write_batch():
+        found = cache.lookup(batch)
+        for name in batch:
+            if name not in found:
+                uncached.append(name)
+                continue
+            tax_id, record = found[name]
+            if tax_id is not None:
+                tax_ids[tax_id] += 1
+                writer.put(record)
+            elif record is None:
+                writer.put_failed(name)
+            else:
+                writer.put(record, failed=True)
+            if record is None:
+                writer.echo(name)
+        batch.clear()
+
+    for name in names_to_process:
+        batch.append(name)
+        if len(batch) == query_cache.CACHE_BATCH:
+            write_batch()
+    write_batch()
+
+    writer.close(cache.hits if args.quiet is False else None)
+    print(f'{cache.hits} names were taken from the query cache.')
+
+    return uncached, tax_ids, cache.hits
+
+def remote_search(args, names_to_process, client, output_files, run_metrics = None):
+    '''
+    Function to search the tax IDs of all names with a running daemon
+    (daemon_client.Client) instead of the locally loaded taxonomy. Names are sent
+    in batches, results are written as by dict_search and index_search.
+    Returns found tax_ids (Counter) and the number of processed names.
+    '''
+
+    tax_ids = Counter()
+    processed_count = 0
+    writer = utils.ResultWriter(output_files, flush_interval=args.flush_interval,
+                                flush_size=args.flush_size, quiet=args.quiet, echo=not args.quiet)
+    phase = metrics.start(run_metrics, 'remote_search', None, writer)
+    if not args.quiet:
+        print("name\ttax_id\tname_txt\tname_class\tstrict_score\t"
+"relaxed_score\treduced_name\tno_number_name\tmin_name\ttime(s)\tcomment")
+
+    for tax_id, record in tqdm(client.lookup(names_to_process, args.mode), disable=not args.quiet):
+        processed_count += 1
+        phase.add(tax_id is not None)
+        if tax_id is not None:
+            tax_ids[int(tax_id)] += 1
+            writer.put(record)
+        elif args.mode == 'strict':
+            writer.put_failed(record[0])
+            writer.echo(record)
+        else:
+            writer.put(record, failed=True)
+
+        if processed_count % 500 == 0:
+            writer.checkpoint(processed_count)
+
+    writer.close(processed_count if args.quiet is False else None)
+    metrics.finish(run_metrics, phase)
+
+    return tax_ids, processed_count
+
 def get_taxids(args):
 
     # Declare output files
     output_files = args.prefix + "tax_ids.tsv", args.prefix + 'tax_ids_failed.txt'
 
+    # Use a running daemon if there is one
+    args.client = daemon_client.connect(args)
+    if args.client is not None:
+        names_to_process = setup_names(args, output_files)
+        tax_ids, processed_count = remote_search(args, names_to_process, args.client, output_files,
+                                                 getattr(args, 'run_metrics', None))
+        print(f"Loaded {names_to_process.total} names. Of those {names_to_process.unique} are unique.")
+        if processed_count == 0:
+            print(f'0 new names to process were found. Matched and failed names can be found in files \
+{output_files[0]} and {output_files[1]} respectivly. \
+\nUse the --redo flag should you wish to rerun the analysis, which will overwrite the \
+results file.')
+            return
+
+        print(f"\nMatched names written to {output_files[0]}. Failed names to {output_files[1]}.\n")
+        if tax_ids:
+            args.tax_id = tax_ids
+            get_lineage.get_lineage(args)
+        return
+
     # Set up names to process and searcher
     names_to_process, searcher = setup(args, output_files)
+    if args.profile or args.cprofile:
+        TaxonomySearcher.profile = profiling.SearchProfile()
 
-    # Check if there are names to process
-    if len(names_to_process) == 0:
+    # Names searched in earlier runs are taken from the query cache
+    cache = open_cache(args)
+    names_to_search, cached_tax_ids, cached_count = names_to_process, Counter(), 0
+    if cache is not None:
+        names_to_search, cached_tax_ids, cached_count = cache_search(args, names_to_process, cache,
+                                                                     output_files)
+
+    if args.quiet is False:
+        print('\nStarting exact match search...')
+    # Exact search
+    failed, tax_ids = dict_search(names_to_search, searcher, output_files, quiet=args.quiet,
+                                  cache=cache, run_metrics=getattr(args, 'run_metrics', None))
+    tax_ids.update(cached_tax_ids)
+    print(f"Loaded {names_to_process.total} names. Of those {names_to_process.unique} are unique.")
+
+    # Check if there were names to process
+    if cached_count + sum(tax_ids.values()) + len(failed) == 0:
         print(f'0 new names to process were found. Matched and failed names can be found in files \
 {output_files[0]} and {output_files[1]} respectivly. \
 \nUse the --redo flag should you wish to rerun the analysis, which will overwrite the \
 results file.')
         return
 
-    if args.quiet is False:
-        print(f'\nStarting exact match search for {len(names_to_process)} names...')
-    # Exact search
-    failed, tax_ids = dict_search(names_to_process, searcher,
-                                output_files, quiet=args.quiet)
-
     # Approximate or lenient search
     if args.mode != 'strict' and len(failed) > 0:
         if args.quiet is False:
             print(f'\nStarting {args.mode} search for {len(failed)} names using {args.cores} cores...')
-        tax_ids = index_search(args, [failed, tax_ids], searcher, output_files)
+        tax_ids = index_search(args, [failed, tax_ids], searcher, output_files, cache,
+                               getattr(args, 'run_metrics', None))
 
     else:
-        utils.write_checkpoint(output_files, [], failed, len(failed),
-                         mode=True, quiet=args.quiet)
+        writer = utils.ResultWriter(output_files, flush_interval=args.flush_interval,
+                                    flush_size=args.flush_size, quiet=args.quiet)
+        for name in failed:
+            writer.put_failed(name)
+            if cache is not None:
+                cache.add(name, None, None)
+        writer.close(len(failed) if args.quiet is False else None)
+
+    if cache is not None:
+        cache.close()
 
     print(f"\nMatched names written to {output_files[0]}. Failed names to {output_files[1]}.\n")
 
+    if searcher.profile is not None:
+        searcher.profile.write(args.prefix + 'profile')
+        print(f'Search profile written to {args.prefix}profile.json and {args.prefix}profile.tsv.\n')
+
     # If we have tax_ids, get lineages
     if tax_ids:
         args.tax_id = tax_ids
@@ -0,0 +1,737 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+import utils
+
+STORE_DIR = 'taxa_store'
+NODES_DIR = 'nodes_store'
+STORE_VERSION = 3
+# Number of names per chunk when building the trigram index
+TRIGRAM_CHUNK = 500000
+
+def store_path(folder:str) -> str:
+    '''Returns the path to the binary taxa store within the database folder.'''
+    return os.path.join(folder, STORE_DIR)
+
+def store_exists(folder:str) -> bool:
+    '''Checks whether a complete binary taxa store of the current version
+    exists in folder. The meta.json file is written last and marks a
+    finished store.'''
+    meta_file = os.path.join(store_path(folder), 'meta.json')
+    if os.path.exists(meta_file) is False:
+        return False
+    with open(meta_file, encoding='utf-8') as t:
+        meta = json.load(t)
+    return meta.get('version', 1) == STORE_VERSION
+
+def trigram_codes(text:str) -> np.ndarray:
+    '''Returns the unique trigram codes of the upper case string text.
+    Each code packs three 21 bit code points into one integer.'''
+    cp = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.uint64)
+    if len(cp) < 3:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique((cp[:-2] << np.uint64(42)) | (cp[1:-1] << np.uint64(21)) | cp[2:])
+
+def build_trigram_index(names:list) -> tuple:
+    '''
+    Function to build an inverted index mapping each trigram of the upper
+    case names to the sorted list of rows containing it.
+
+    Parameters
+    ----------
+    names : list
+        List of taxon names in store order.
+
+    Returns
+    ----------
+    keys : np.ndarray
+        Sorted unique trigram codes.
+    offsets : np.ndarray
+        Start of the posting list of each key in rows (length len(keys)+1).
+    rows : np.ndarray
+        Concatenated posting lists, each sorted ascending.
+    '''
+
+    newline = np.uint64(ord('\n'))
+    chunk_codes, chunk_rows = [], []
+    for start in range(0, len(names), TRIGRAM_CHUNK):
+        upper = [name.upper() for name in names[start:start+TRIGRAM_CHUNK]]
+        cp = np.frombuffer(('\n'.join(upper)+'\n').encode('utf-32-le'),
+                           dtype=np.uint32).astype(np.uint64)
+        row = np.repeat(np.arange(start, start+len(upper), dtype=np.int32),
+                        np.array([len(name)+1 for name in upper], dtype=np.int64))
+        # Keep trigrams that do not span two names
+        valid = (cp[:-2] != newline) & (cp[1:-1] != newline) & (cp[2:] != newline)
+        codes = ((cp[:-2] << np.uint64(42)) | (cp[1:-1] << np.uint64(21)) | cp[2:])[valid]
+        row = row[:-2][valid]
+        del cp, valid
+        # Sort by code then row and drop repeated trigrams within a name
+        order = np.lexsort((row, codes))
+        codes, row = codes[order], row[order]
+        keep = np.ones(len(codes), dtype=bool)
+        keep[1:] = (codes[1:] != codes[:-1]) | (row[1:] != row[:-1])
+        chunk_codes.append(codes[keep])
+        chunk_rows.append(row[keep])
+
+    if len(chunk_codes) == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+
+    codes = np.concatenate(chunk_codes)
+    rows = np.concatenate(chunk_rows)
+    del chunk_codes, chunk_rows
+    # Chunks are in row order, hence a stable sort keeps the rows sorted
+    order = np.argsort(codes, kind='stable')
+    codes, rows = codes[order], rows[order]
+    del order
+
+    keys, counts = np.unique(codes, return_counts=True)
+    offsets = np.zeros(len(keys)+1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    return keys, offsets, rows
+
+def patch_trigram_index(trigram_index:tuple, row_map:np.ndarray,
+                        added_names:list, added_rows:np.ndarray) -> tuple:
+    '''
+    Function to update a trigram index built by build_trigram_index after
+    rows were deleted from and inserted into the store. Only the trigrams
+    of the inserted names are computed, the posting lists of all other rows
+    are renumbered and merged with them. Returns the same index as
+    build_trigram_index on the updated names.
+
+    Parameters
+    ----------
+    trigram_index : tuple
+        keys, offsets and rows of the previous index.
+    row_map : np.ndarray
+        New row of each previous row, -1 for deleted rows.
+    added_names : list
+        Inserted names.
+    added_rows : np.ndarray
+        New row of each inserted name (ascending).
+    '''
+
+    keys, offsets, rows = trigram_index
+    counts = np.diff(np.asarray(offsets))
+    new_keys, new_offsets, new_rows = build_trigram_index(added_names)
+    new_rows = np.asarray(added_rows, dtype=np.int64)[new_rows]
+
+    # Number the keys of both indexes, a posting is then identified by the
+    # key number (high 32 bits) and its row (low 32 bits).
+    all_keys = np.union1d(np.asarray(keys), new_keys)
+    mapped = np.asarray(row_map, dtype=np.int64)[np.asarray(rows)]
+    keep = mapped >= 0
+    old_postings = np.repeat(np.searchsorted(all_keys, keys), counts)[keep] << 32 | mapped[keep]
+    del mapped, keep
+    # Rows of equal names may have been reordered
+    if np.any(old_postings[1:] < old_postings[:-1]):
+        old_postings.sort()
+    new_postings = np.repeat(np.searchsorted(all_keys, new_keys), np.diff(new_offsets)) << 32 | new_rows
+
+    postings = np.insert(old_postings, np.searchsorted(old_postings, new_postings), new_postings)
+    del old_postings
+
+    key_counts = np.bincount(postings >> 32, minlength=len(all_keys))
+    present = key_counts > 0
+    patched_offsets = np.zeros(int(present.sum())+1, dtype=np.int64)
+    np.cumsum(key_counts[present], out=patched_offsets[1:])
+
+    return all_keys[present], patched_offsets, (postings & 0xffffffff).astype(np.int32)
+
+def find_homonyms(names:pd.Series) -> tuple:
+    '''
+    Function to find all groups of rows sharing the same name.
+
+    Parameters
+    ----------
+    names : pd.Series
+        Taxon names in store order.
+
+    Returns
+    ----------
+    dup : np.ndarray
+        1 for every row whose name occurs more than once, else 0 (uint8).
+    offsets : np.ndarray
+        Start of each group in rows (length number of groups + 1).
+    rows : np.ndarray
+        Rows of all groups, groups in order of their first row and
+        the rows of each group ascending.
+    '''
+
+    # Codes are numbered in order of the first occurrence of each name
+    codes, uniques = pd.factorize(names.to_numpy(dtype=object), use_na_sentinel=False)
+    counts = np.bincount(codes, minlength=len(uniques))
+    dup = counts[codes] > 1
+
+    rows = np.nonzero(dup)[0]
+    rows = rows[np.argsort(codes[rows], kind='stable')].astype(np.int32)
+    group_counts = counts[counts > 1]
+    offsets = np.zeros(len(group_counts)+1, dtype=np.int64)
+    np.cumsum(group_counts, out=offsets[1:])
+
+    return dup.astype(np.uint8), offsets, rows
+
+def build_exact_index(names:list) -> tuple:
+    '''
+    Function to build the exact-match index of the names: the 64-bit hash
+    of every name (utils.hash_name) sorted ascending, with the rows in
+    ascending order for equal hashes.
+
+    Parameters
+    ----------
+    names : list
+        List of taxon names in store order.
+
+    Returns
+    ----------
+    hashes : np.ndarray
+        Sorted name hashes (uint64).
+    rows : np.ndarray
+        Row of each hash (int32).
+    '''
+
+    hashes = np.fromiter((utils.hash_name(name) for name in names), dtype=np.uint64, count=len(names))
+    order = np.argsort(hashes, kind='stable')
+    return hashes[order], order.astype(np.int32)
+
+def patch_exact_index(exact_index:tuple, row_map:np.ndarray,
+                      added_names:list, added_rows:np.ndarray, key=None) -> tuple:
+    '''
+    Function to update an exact-match index built by build_exact_index
+    after rows were deleted from and inserted into the store. Only the
+    inserted names are hashed, the hashes of all other rows are renumbered
+    and merged with them. Returns the same index as build_exact_index on
+    the updated names (see patch_normalized_index for the normalized
+    index).
+
+    Parameters
+    ----------
+    exact_index : tuple
+        hashes and rows of the previous index.
+    row_map : np.ndarray
+        New row of each previous row, -1 for deleted rows.
+    added_names : list
+        Inserted names.
+    added_rows : np.ndarray
+        New row of each inserted name.
+    key : function
+        Function applied to the inserted names before hashing, e.g.
+        utils.normalize_name. Default=None
+    '''
+
+    if key is not None:
+        added_names = [key(name) for name in added_names]
+    hashes, rows = exact_index
+    mapped = np.asarray(row_map, dtype=np.int64)[np.asarray(rows)]
+    keep = mapped >= 0
+    added_hashes = np.fromiter((utils.hash_name(name) for name in added_names),
+                               dtype=np.uint64, count=len(added_names))
+    hashes = np.concatenate([np.asarray(hashes)[keep], added_hashes])
+    rows = np.concatenate([mapped[keep], np.asarray(added_rows, dtype=np.int64)])
+    # Sorted by hash, equal hashes by row as the stable sort of build_exact_index
+    order = np.lexsort((rows, hashes))
+    return hashes[order], rows[order].astype(np.int32)
+
+def build_normalized_index(names:list) -> tuple:
+    '''
+    Function to build the normalized exact-match index: the exact-match
+    index (see build_exact_index) of the normalized names
+    (utils.normalize_name) of all rows. Keys shared by several rows are
+    kept, ExactIndex.get_all returns all of them.
+
+    Parameters
+    ----------
+    names : list
+        List of taxon names in store order.
+
+    Returns
+    ----------
+    hashes : np.ndarray
+        Sorted hashes of the normalized names (uint64).
+    rows : np.ndarray
+        Row of each hash (int32).
+    '''
+
+    return build_exact_index([utils.normalize_name(name) for name in names])
+
+def patch_normalized_index(normalized_index:tuple, row_map:np.ndarray,
+                           added_names:list, added_rows:np.ndarray) -> tuple:
+    '''
+    Function to update the normalized exact-match index after rows were
+    deleted from and inserted into the store (see patch_exact_index).
+    Returns the same index as build_normalized_index on the updated names.
+
+    Parameters
+    ----------
+    normalized_index : tuple
+        hashes and rows of the previous index.
+    row_map : np.ndarray
+        New row of each previous row, -1 for deleted rows.
+    added_names : list
+        Inserted names.
+    added_rows : np.ndarray
+        New row of each inserted name.
+
+    Returns
+    ----------
+    hashes : np.ndarray
+        Sorted hashes of the normalized names (uint64).
+    rows : np.ndarray
+        Row of each hash (int32).
+    '''
+
+    return patch_exact_index(normalized_index, row_map, added_names, added_rows, utils.normalize_name)
+
+class ExactIndex:
+    '''Read-only mapping of the names of a taxa store to their row, equal
+    to dict(zip(names, rows)): a name held by several rows maps to the
+    last one. Looks up the name hash by binary search and compares the
+    name of the candidate rows, so hash collisions are resolved. With a
+    key function (e.g. utils.normalize_name) the names are compared as
+    keys.'''
+
+    def __init__(self, store, hashes:np.ndarray, rows:np.ndarray, key=None):
+        self.store = store
+        self.hashes = hashes
+        self.rows = rows
+        self.key = key
+
+    def get(self, name:str, default=None):
+        if self.key is not None:
+            name = self.key(name)
+        key = np.uint64(utils.hash_name(name))
+        pos = int(np.searchsorted(self.hashes, key, side='right'))
+        # Rows of equal hashes are ascending, hence look at the last first
+        while pos > 0 and self.hashes[pos-1] == key:
+            pos -= 1
+            row = int(self.rows[pos])
+            candidate = self.store.name(row)
+            if (candidate if self.key is None else self.key(candidate)) == name:
+                return row
+        return default
+
+    def get_all(self, name:str) -> list:
+        '''Returns all rows of name (ascending), empty list if none.'''
+        if self.key is not None:
+            name = self.key(name)
+        key = np.uint64(utils.hash_name(name))
+        start = int(np.searchsorted(self.hashes, key, side='left'))
+        stop = int(np.searchsorted(self.hashes, key, side='right'))
+        rows = [int(row) for row in self.rows[start:stop]]
+        return [row for row in rows if (self.store.name(row) if self.key is None
+                                        else self.key(self.store.name(row))) == name]
+
+    def __contains__(self, name:str) -> bool:
+        return self.get(name) is not None
+
+    def __getitem__(self, name:str) -> int:
+        row = self.get(name)
+        if row is None:
+            raise KeyError(name)
+        return row
+
+def write_store(folder:str, taxa:pd.DataFrame, trigram_index:tuple|None = None,
+                exact_index:tuple|None = None, normalized_index:tuple|None = None,
+                homonyms:tuple|None = None) -> None:
+    '''
+    Function to write the sorted taxa DataFrame into a compact binary store
+    that can be opened via memory mapping. The store consists of columnar
+    arrays (tax_id, name offsets, name class code, dup flag), a blob
+    holding all names separated by newlines, the trigram index, the
+    homonym groups (see find_homonyms) and the exact-match indices (see
+    build_exact_index and build_normalized_index). The dup flag is derived from the
+    names, a dup column of taxa is not used.
+
+    Parameters
+    ----------
+    folder : str
+        Path to the folder holding the NCBI taxonomy database files.
+    taxa : pd.DataFrame
+        DataFrame holding the sorted taxa names, tax IDs, name classes
+        and the dup column.
+    trigram_index : tuple
+        Trigram index of the names if already known (e.g. patched by
+        patch_trigram_index). Built from the names if None.
+    exact_index : tuple
+        Exact-match index of the names if already known (e.g. patched by
+        patch_exact_index). Built from the names if None.
+    normalized_index : tuple
+        Normalized exact-match index of the names if already known (e.g.
+        patched by patch_exact_index). Built from the names if None.
+    homonyms : tuple
+        Result of find_homonyms on the names if already known. Found
+        from the names if None.
+    '''
+
+    names = taxa['name_txt'].fillna('').astype(str)
+    name_class = taxa['name class'].fillna('').astype(str)
+
+    offsets, blob = encode_names(names)
+
+    # Name classes are stored as codes into a small list of labels
+    classes, class_codes = np.unique(name_class.to_numpy(dtype=str), return_inverse=True)
+
+    if trigram_index is None:
+        print('Building trigram index for the taxa names...')
+        trigram_index = build_trigram_index(names.tolist())
+    trigram_keys, trigram_offsets, trigram_rows = trigram_index
+
+    if homonyms is None:
+        homonyms = find_homonyms(names)
+    dup, homonym_offsets, homonym_rows = homonyms
+    if exact_index is None:
+        exact_index = build_exact_index(names.tolist())
+    exact_hashes, exact_rows = exact_index
+    if normalized_index is None:
+        normalized_index = build_normalized_index(names.tolist())
+    normalized_hashes, normalized_rows = normalized_index
+
+    save_arrays(store_path(folder), {'tax_id': pd.to_numeric(taxa['tax_id']).to_numpy(dtype=np.int32),
+                                     'name_offsets': offsets,
+                                     'name_class': class_codes.astype(np.uint8),
+                                     'dup': dup,
+                                     'names': blob,
+                                     'trigram_keys': trigram_keys,
+                                     'trigram_offsets': trigram_offsets,
+                                     'trigram_rows': trigram_rows,
+                                     'homonym_offsets': homonym_offsets,
+                                     'homonym_rows': homonym_rows,
+                                     'exact_hashes': exact_hashes,
+                                     'exact_rows': exact_rows,
+                                     'normalized_hashes': normalized_hashes,
+                                     'normalized_rows': normalized_rows},
+                {'version': STORE_VERSION, 'rows': len(taxa), 'classes': classes.tolist()})
+    print('Binary taxa store was written into folder '+store_path(folder)+'.\n')
+
+def encode_names(names:pd.Series) -> tuple:
+    '''Encodes names into a blob holding all names separated (and terminated)
+    by a newline. Returns the byte offsets (length len(names)+1) and the blob
+    as uint8 array.'''
+
+    lengths = names.str.encode('utf-8').str.len().to_numpy(dtype=np.int64) + 1
+    offsets = np.zeros(len(names)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    blob = ('\n'.join(names.tolist()) + '\n').encode('utf-8') if len(names) > 0 else b''
+    return offsets, np.frombuffer(blob, dtype=np.uint8)
+
+def decode_name(blob:np.ndarray, offsets:np.ndarray, idx:int) -> str:
+    '''Returns the name at position idx of a blob written by encode_names.'''
+    return blob[offsets[idx]:offsets[idx+1]-1].tobytes().decode('utf-8')
+
+def nodes_exists(folder:str) -> bool:
+    '''Checks whether the binary nodes store exists in folder.'''
+    return os.path.exists(os.path.join(folder, NODES_DIR, 'meta.json'))
+
+def write_nodes_store(folder:str, nodes_df:pd.DataFrame, merged:pd.DataFrame|None = None,
+                      deleted:list|None = None, sources:dict|None = None) -> None:
+    '''
+    Function to write the nodes of the NCBI taxonomy into dense arrays indexed
+    by tax_id: parent tax_id (-1 if the tax_id does not exist), rank code and
+    offsets into a blob holding the scientific names. Merged and deleted
+    tax IDs are stored as sorted arrays.
+
+    Parameters
+    ----------
+    folder : str
+        Path to the folder holding the NCBI taxonomy database files.
+    nodes_df : pd.DataFrame
+        DataFrame with the columns tax_id, parent_tax_id, rank and name_txt.
+    merged : pd.DataFrame
+        DataFrame with the columns old_tax_id and new_tax_id (merged.dmp).
+    deleted : list
+        Deleted tax IDs (delnodes.dmp).
+    sources : dict
+        Checksums of the dump files the nodes were read from, kept in
+        meta.json (see nodes_sources). Default=None
+    '''
+
+    nodes_df = nodes_df.drop_duplicates('tax_id')
+    tax_ids = nodes_df['tax_id'].to_numpy(dtype=np.int64)
+    size = int(tax_ids.max()) + 1 if len(tax_ids) > 0 else 1
+
+    parent = np.full(size, -1, dtype=np.int32)
+    parent[tax_ids] = nodes_df['parent_tax_id'].to_numpy(dtype=np.int32)
+
+    ranks, rank_codes = np.unique(nodes_df['rank'].fillna('').astype(str).to_numpy(dtype=str),
+                                  return_inverse=True)
+    rank = np.full(size, -1, dtype=np.int16)
+    rank[tax_ids] = rank_codes
+
+    names = np.full(size, '', dtype=object)
+    names[tax_ids] = nodes_df['name_txt'].astype(str).to_numpy(dtype=object)
+    offsets, blob = encode_names(pd.Series(names, dtype=object))
+
+    if merged is None:
+        merged = pd.DataFrame({'old_tax_id': [], 'new_tax_id': []})
+    merged = merged.astype({'old_tax_id': np.int64, 'new_tax_id': np.int64}).sort_values('old_tax_id')
+    deleted = np.unique(np.asarray(deleted if deleted is not None else [], dtype=np.int32))
+
+    save_arrays(os.path.join(folder, NODES_DIR), {'parent': parent, 'rank': rank,
+                                                  'name_offsets': offsets, 'names': blob,
+                                                  'merged_old': merged['old_tax_id'].to_numpy(dtype=np.int32),
+                                                  'merged_new': merged['new_tax_id'].to_numpy(dtype=np.int32),
+                                                  'deleted': deleted},
+                {'version': STORE_VERSION, 'nodes': len(tax_ids), 'ranks': ranks.tolist(),
+                 'sources': sources})
+    print('Binary nodes store was written into folder '+os.path.join(folder, NODES_DIR)+'.\n')
+
+def nodes_sources(folder:str) -> dict | None:
+    '''Returns the checksums of the dump files the nodes store in folder was
+    written from (see write_nodes_store), None if unknown.'''
+    meta_file = os.path.join(folder, NODES_DIR, 'meta.json')
+    if os.path.exists(meta_file) is False:
+        return None
+    with open(meta_file, encoding='utf-8') as t:
+        return json.load(t).get('sources')
+
+def save_arrays(final_dir:str, arrays:dict, meta:dict) -> None:
+    '''
+    Function to save a set of numpy arrays and a meta.json file into
+    final_dir. Writes into a temporary folder first, so that a half
+    written store is never opened by a concurrently running process.
+
+    Parameters
+    ----------
+    final_dir : str
+        Path to the store folder.
+    arrays : dict
+        Dictionary mapping file names (without .npy) to arrays.
+    meta : dict
+        Meta data written into meta.json.
+    '''
+
+    tmp_dir = final_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.mkdir(tmp_dir)
+
+    for key, array in arrays.items():
+        np.save(os.path.join(tmp_dir, key+'.npy'), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as w:
+        json.dump(meta, w)
+
+    if os.path.exists(final_dir):
+        shutil.rmtree(final_dir)
+    os.replace(tmp_dir, final_dir)
+
+class TaxaStore:
+    '''Class giving read access to the memory-mapped binary taxa store.
+    All arrays are opened read-only via memory mapping, hence several
+    processes opening the same store share the page cache.'''
+
+    def __init__(self, folder:str):
+        path = store_path(folder)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as t:
+            meta = json.load(t)
+        self.folder = folder
+        self.classes = meta['classes']
+        self.tax_id = np.load(os.path.join(path, 'tax_id.npy'), mmap_mode='r')
+        self.name_offsets = np.load(os.path.join(path, 'name_offsets.npy'), mmap_mode='r')
+        self.name_class = np.load(os.path.join(path, 'name_class.npy'), mmap_mode='r')
+        self.dup = np.load(os.path.join(path, 'dup.npy'), mmap_mode='r')
+        self.blob = np.load(os.path.join(path, 'names.npy'), mmap_mode='r')
+        self.trigram_keys = np.load(os.path.join(path, 'trigram_keys.npy'), mmap_mode='r')
+        self.trigram_offsets = np.load(os.path.join(path, 'trigram_offsets.npy'), mmap_mode='r')
+        self.trigram_rows = np.load(os.path.join(path, 'trigram_rows.npy'), mmap_mode='r')
+        self._names_cache = {}
+        self._upper_cache = {}
+        self._length_cache = {}
+        self._homonym_groups = None
+        self._exact_index = None
+        self._normalized_index = None
+
+    def __len__(self):
+        return len(self.tax_id)
+
+    def name(self, idx:int) -> str:
+        '''Returns the taxon name stored at row idx.'''
+        return decode_name(self.blob, self.name_offsets, idx)
+
+    def row(self, idx:int) -> tuple:
+        '''Returns tax_id, name_txt and name class stored at row idx.'''
+        return int(self.tax_id[idx]), self.name(idx), self.classes[self.name_class[idx]]
+
+    def names(self, start:int = 0, stop:int|None = None) -> pd.Series:
+        '''
+        Returns the names of rows start to stop (exclusive) as a Series
+        indexed by their row number. Decoded slices are cached.
+        '''
+        if stop is None:
+            stop = len(self)
+        if (start, stop) not in self._names_cache:
+            if stop <= start:
+                names = []
+            else:
+                chunk = self.blob[self.name_offsets[start]:self.name_offsets[stop]]
+                names = chunk.tobytes().decode('utf-8').split('\n')[:-1]
+            self._names_cache[(start, stop)] = pd.Series(names, index=range(start, start+len(names)),
+                                                         dtype=object, name='name_txt')
+        return self._names_cache[(start, stop)]
+
+    def upper_names(self, start:int = 0, stop:int|None = None) -> list:
+        '''Returns the upper case names of rows start to stop (exclusive)
+        as a list. Computed once per slice and cached.'''
+        if stop is None:
+            stop = len(self)
+        if (start, stop) not in self._upper_cache:
+            self._upper_cache[(start, stop)] = [name.upper() for name in self.names(start, stop).tolist()]
+        return self._upper_cache[(start, stop)]
+
+    def upper_lengths(self, start:int = 0, stop:int|None = None) -> np.ndarray:
+        '''Returns the lengths of the upper case names of rows start to stop
+        (exclusive). Computed once per slice and cached.'''
+        if stop is None:
+            stop = len(self)
+        if (start, stop) not in self._length_cache:
+            self._length_cache[(start, stop)] = np.fromiter(map(len, self.upper_names(start, stop)),
+                                                            dtype=np.int32)
+        return self._length_cache[(start, stop)]
+
+    def trigram_candidates(self, word:str, start:int, stop:int) -> np.ndarray | None:
+        '''
+        Returns the sorted rows within start and stop (exclusive) whose upper
+        case name contains every trigram of word.upper(). This is a superset
+        of the rows containing word (case-insensitive). Returns None if the
+        word is too short to be looked up in the index.
+        '''
+        codes = trigram_codes(word.upper())
+        if len(codes) == 0:
+            return None
+
+        pos = np.searchsorted(self.trigram_keys, codes)
+        if np.any(pos >= len(self.trigram_keys)) or \
+            np.any(self.trigram_keys[np.minimum(pos, len(self.trigram_keys)-1)] != codes):
+            return np.zeros(0, dtype=np.int32)
+
+        # Restrict each posting list to the requested rows, start
+        # intersecting with the shortest one.
+        postings = []
+        for p in pos:
+            rows = self.trigram_rows[self.trigram_offsets[p]:self.trigram_offsets[p+1]]
+            lo, hi = np.searchsorted(rows, [start, stop])
+            postings.append(rows[lo:hi])
+        postings.sort(key=len)
+
+        candidates = np.asarray(postings[0])
+        for rows in postings[1:]:
+            if len(candidates) == 0:
+                break
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+
+        return candidates
+
+    def homonym_groups(self) -> tuple:
+        '''
+        Returns the homonym groups as offsets and rows (see find_homonyms)
+        plus the group of each homonym row (sorted rows, group numbers).
+        Opened on first use; computed from the names for stores written
+        before the groups were stored.
+        '''
+        if self._homonym_groups is None:
+            path = store_path(self.folder)
+            if os.path.exists(os.path.join(path, 'homonym_rows.npy')):
+                offsets = np.load(os.path.join(path, 'homonym_offsets.npy'), mmap_mode='r')
+                rows = np.load(os.path.join(path, 'homonym_rows.npy'), mmap_mode='r')
+            else:
+                _, offsets, rows = find_homonyms(self.names())
+            groups = np.repeat(np.arange(len(offsets)-1, dtype=np.int32), np.diff(offsets))
+            order = np.argsort(rows)
+            self._homonym_groups = (offsets, rows, np.asarray(rows)[order], groups[order])
+        return self._homonym_groups
+
+    def homonyms(self, idx:int) -> list:
+        '''Returns all rows (ascending) with the same name as row idx,
+        an empty list if the name is unique.'''
+        offsets, rows, sorted_rows, groups = self.homonym_groups()
+        pos = np.searchsorted(sorted_rows, idx)
+        if pos == len(sorted_rows) or sorted_rows[pos] != idx:
+            return []
+        group = groups[pos]
+        return np.asarray(rows[offsets[group]:offsets[group+1]]).tolist()
+
+    def exact_index(self) -> ExactIndex:
+        '''
+        Returns the ExactIndex of the store, used instead of a dictionary
+        of all names for exact searches. Opened on first use; built from
+        the names for stores written before the index was stored.
+        '''
+        if self._exact_index is None:
+            path = store_path(self.folder)
+            if os.path.exists(os.path.join(path, 'exact_rows.npy')):
+                hashes = np.load(os.path.join(path, 'exact_hashes.npy'), mmap_mode='r')
+                rows = np.load(os.path.join(path, 'exact_rows.npy'), mmap_mode='r')
+            else:
+                hashes, rows = build_exact_index(self.names().tolist())
+            self._exact_index = ExactIndex(self, hashes, rows)
+        return self._exact_index
+
+    def normalized_index(self) -> ExactIndex:
+        '''
+        Returns the ExactIndex of the normalized names (see
+        build_normalized_index); get() takes a name and normalizes it.
+        Opened on first use; built from the names for stores written before
+        the index was stored.
+        '''
+        if self._normalized_index is None:
+            path = store_path(self.folder)
+            if os.path.exists(os.path.join(path, 'normalized_rows.npy')):
+                hashes = np.load(os.path.join(path, 'normalized_hashes.npy'), mmap_mode='r')
+                rows = np.load(os.path.join(path, 'normalized_rows.npy'), mmap_mode='r')
+            else:
+                hashes, rows = build_normalized_index(self.names().tolist())
+            self._normalized_index = ExactIndex(self, hashes, rows, utils.normalize_name)
+        return self._normalized_index
+
+    def to_frame(self) -> pd.DataFrame:
+        '''Returns the complete store as a DataFrame.'''
+        return pd.DataFrame({'tax_id': np.asarray(self.tax_id, dtype=np.int64),
+                             'name_txt': self.names().to_numpy(),
+                             'name class': np.asarray(self.classes, dtype=object)[self.name_class],
+                             'dup': np.asarray(self.dup, dtype=np.int64)})
+
+class NodesStore:
+    '''Class giving read access to the memory-mapped nodes store. The arrays
+    parent, rank and name_offsets are indexed by tax_id.'''
+
+    def __init__(self, folder:str):
+        path = os.path.join(folder, NODES_DIR)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as t:
+            meta = json.load(t)
+        self.folder = folder
+        self.ranks = meta['ranks']
+        self.parent = np.load(os.path.join(path, 'parent.npy'), mmap_mode='r')
+        self.rank = np.load(os.path.join(path, 'rank.npy'), mmap_mode='r')
+        self.name_offsets = np.load(os.path.join(path, 'name_offsets.npy'), mmap_mode='r')
+        self.blob = np.load(os.path.join(path, 'names.npy'), mmap_mode='r')
+        # Stores written before merged.dmp/delnodes.dmp were read lack these
+        self.merged_old, self.merged_new, self.deleted = [
+            np.load(os.path.join(path, key+'.npy')) if os.path.exists(os.path.join(path, key+'.npy'))
+            else np.zeros(0, dtype=np.int32) for key in ['merged_old', 'merged_new', 'deleted']]
+
+    def __contains__(self, tax_id:int) -> bool:
+        return 0 <= tax_id < len(self.parent) and self.parent[tax_id] >= 0
+
+    def redirect(self, tax_id:int) -> int:
+        '''Returns the tax ID that tax_id was merged into, tax_id itself if
+        it was not merged.'''
+        idx = np.searchsorted(self.merged_old, tax_id)
+        if idx < len(self.merged_old) and self.merged_old[idx] == tax_id:
+            return int(self.merged_new[idx])
+        return tax_id
+
+    def is_deleted(self, tax_id:int) -> bool:
+        '''Returns whether tax_id was deleted from the NCBI taxonomy.'''
+        idx = np.searchsorted(self.deleted, tax_id)
+        return bool(idx < len(self.deleted) and self.deleted[idx] == tax_id)
+
+    def name(self, tax_id:int) -> str:
+        '''Returns the scientific name of tax_id.'''
+        return decode_name(self.blob, self.name_offsets, tax_id)
+
+    def rank_codes(self, ranks:list) -> np.ndarray:
+        '''Returns a boolean array over the rank codes, True for all codes
+        whose rank is in ranks.'''
+        return np.array([rank in ranks for rank in self.ranks], dtype=bool)
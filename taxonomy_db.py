@@ -0,0 +1,156 @@
+'''Library interface to the NCBI taxonomy database.
+
+Importing this module is cheap: pandas, numpy, rapidfuzz and the search
+modules are only imported once a TaxonomyDB first needs them, and the
+taxa store and nodes are loaded on first use.
+
+    from taxonomy_db import TaxonomyDB
+    db = TaxonomyDB()
+    db.lookup(['Homo sapiens'])[0].tax_id             # 9606
+    [node.name for node in db.lineage([9606])[0].nodes]
+'''
+
+import os
+from typing import NamedTuple
+
+class Match(NamedTuple):
+    '''Result of a name lookup; the fields are the columns of tax_ids.tsv.'''
+    name: str
+    tax_id: int | None
+    name_txt: str | None
+    name_class: str | None
+    strict_score: float
+    relaxed_score: float
+    reduced_name: str | None
+    no_number_name: str | None
+    min_name: str | None
+    time: float | None
+    comment: str | None
+
+class LineageNode(NamedTuple):
+    '''One taxon of a lineage.'''
+    tax_id: int
+    name: str
+    rank: str
+
+class Lineage(NamedTuple):
+    '''Lineage of tax_id, root first. Empty for unknown or deleted tax IDs.'''
+    tax_id: int
+    nodes: list
+
+class TaxonomyDB:
+    """
+    Class giving access to name lookups and lineages of the NCBI taxonomy
+    without the command line interface. Names and nodes are loaded lazily
+    on first use and kept for later calls; homonyms are read from the taxa
+    store only when a search hits one. The database is downloaded and built
+    on first use if it does not exist in folder.
+
+    Parameters
+    ----------
+    folder : str
+        Path to the folder holding the NCBI taxonomy database files.
+        Default is the folder ".ncbi_tax" in the home directory.
+    """
+
+    def __init__(self, folder:str|None = None):
+        if folder is None:
+            folder = os.path.join(os.path.expanduser('~'), '.ncbi_tax')
+        self.folder = folder
+        self._taxa = None
+        self._resolver = None
+
+    @property
+    def taxa(self) -> tuple:
+        '''Taxa store, lexicon and exact-match index (loaded on first use).'''
+        if self._taxa is None:
+            import ncbi_tax
+            taxa_df, list_index = ncbi_tax.get_taxa(self.folder)
+            self._taxa = (taxa_df, list_index, taxa_df.exact_index())
+        return self._taxa
+
+    @property
+    def resolver(self):
+        '''get_lineage.LineageResolver over the nodes store (loaded on first use).'''
+        if self._resolver is None:
+            import ncbi_tax
+            import get_lineage
+            nodes = ncbi_tax.get_node_arrays(self.folder)
+            self._resolver = get_lineage.LineageResolver(nodes, [get_lineage.REDUCED_RANKS,
+                                                                 get_lineage.MINIMAL_RANKS])
+        return self._resolver
+
+    def searcher(self, score:float):
+        '''Returns a search_name.TaxonomySearcher on this database using score.'''
+        import search_name
+        taxa_df, list_index, taxa_name_dict = self.taxa
+        search_name.TaxonomySearcher.initialize(taxa_df, list_index, taxa_name_dict, score)
+        return search_name.TaxonomySearcher('ncbi')
+
+    def search(self, names:list, mode:str = 'strict', score:float = 95) -> list:
+        '''
+        Function to search the tax IDs of names: exact search first, then
+        the names not found are searched in the given mode, as done by the
+        command line interface. Returns a list of (tax_id or None, result
+        record) as search_name.process_name.
+        '''
+
+        import search_name
+        searcher = self.searcher(score)
+        results = [search_name.process_name((name, 'strict', searcher)) for name in names]
+        if mode != 'strict':
+            results = [result if result[0] is not None else
+                       search_name.process_name((name, mode, searcher))
+                       for name, result in zip(names, results)]
+        return results
+
+    def lookup(self, names:list, mode:str = 'strict', score:float = 95) -> list:
+        '''
+        Function to find the tax IDs of taxon names.
+
+        Parameters
+        ----------
+        names : list
+            Taxon names to look up.
+        mode : str
+            strict, relaxed or lenient (see --mode). Default is strict.
+        score : float
+            Minimal matching score in relaxed and lenient mode. Default is 95.
+
+        Returns
+        ----------
+        matches : list
+            Match for each name (tax_id is None if no match was found).
+        '''
+
+        if isinstance(names, str):
+            names = [names]
+        return [Match(*record) for _, record in self.search(list(names), mode, score)]
+
+    def lineage(self, tax_ids:list, level:str = 'full') -> list:
+        '''
+        Function to get the lineages of tax IDs.
+
+        Parameters
+        ----------
+        tax_ids : list
+            Taxon IDs for which to get the lineages.
+        level : str
+            full, reduced or minimal (see --lineage). Default is full.
+
+        Returns
+        ----------
+        lineages : list
+            Lineage for each tax ID.
+        '''
+
+        if isinstance(tax_ids, int):
+            tax_ids = [tax_ids]
+        resolver = self.resolver
+        nodes = resolver.nodes
+        lineages = []
+        for tax_id in tax_ids:
+            lineages.append(Lineage(int(tax_id), [
+                LineageNode(node, nodes.name(node), nodes.ranks[nodes.rank[node]])
+                for node in resolver.lineage_ids(tax_id, level)]))
+        return lineages
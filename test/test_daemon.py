@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import daemon, daemon_client, get_lineage, taxa_store
+import search_name as sn
+from test_get_lineage import NODES
+from test_search_name import NAMES
+
+class TestDaemon(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        taxa = pd.read_csv('test/data/taxa_names_sorted.tsv', sep='\t', keep_default_na=False)
+        taxa['dup'] = 0
+        taxa_store.write_store(cls.tmp.name, taxa)
+        shutil.copy('test/data/taxa_indeces.txt', cls.tmp.name)
+        nodes_df = pd.DataFrame(NODES, columns=['tax_id', 'parent_tax_id', 'rank', 'name_txt'])
+        taxa_store.write_nodes_store(cls.tmp.name, nodes_df)
+
+        cls.taxonomy = daemon.TaxonomyServer(cls.tmp.name, 80)
+        cls.httpd = daemon.make_server(cls.taxonomy)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%d' % cls.httpd.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+        cls.taxonomy.close()
+        cls.tmp.cleanup()
+
+    def test_lookup(self):
+        client = daemon_client.Client(self.url)
+        names = NAMES * 3
+        for mode in ['strict', 'lenient']:
+            expected = [sn.process_name((name, 'strict', self.taxonomy.searcher)) for name in names]
+            if mode != 'strict':
+                expected = [result if result[0] is not None else
+                            sn.process_name((name, mode, self.taxonomy.searcher))
+                            for name, result in zip(names, expected)]
+            # Requests only read the searcher initialized at start
+            with patch.object(sn.TaxonomySearcher, 'initialize') as initialize:
+                results = list(client.lookup(iter(names), mode))
+            self.assertEqual(0, initialize.call_count)
+
+            self.assertEqual(len(names), len(results))
+            self.assertListEqual([result[0] for result in expected], [result[0] for result in results])
+            # Records equal apart from the search time
+            self.assertListEqual([result[1][:9] for result in expected], [result[1][:9] for result in results])
+
+    def test_concurrent_lookup(self):
+        expected = [sn.process_name((name, 'lenient', self.taxonomy.searcher))[0] for name in NAMES]
+        results = {}
+        def lookup(i):
+            results[i] = [tax_id for tax_id, _ in daemon_client.Client(self.url).lookup(iter(NAMES), 'lenient')]
+
+        threads = [threading.Thread(target=lookup, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual([expected] * 4, [results[i] for i in range(4)])
+
+    def test_lineage(self):
+        client = daemon_client.Client(self.url)
+        resolver = get_lineage.LineageResolver(taxa_store.NodesStore(self.tmp.name),
+                                               [get_lineage.REDUCED_RANKS, get_lineage.MINIMAL_RANKS])
+        tax_ids = [63221, 9606, 10090, 1, 556, 42]
+        for mode in ['full', 'minimal']:
+            self.assertListEqual(resolver.resolve(tax_ids, mode), client.resolve(tax_ids, mode))
+
+    def test_connect(self):
+        args = argparse.Namespace(server=self.url, score=80)
+        self.assertIsInstance(daemon_client.connect(args), daemon_client.Client)
+
+        args.score = 95
+        self.assertIsNone(daemon_client.connect(args))
+
+        args = argparse.Namespace(server='http://127.0.0.1:1', score=80)
+        self.assertIsNone(daemon_client.connect(args))
+
+if __name__=="__main__":
+    unittest.main()
@@ -2,10 +2,20 @@ import unittest
 from unittest.mock import patch
 import os 
 import sys
+import tempfile
 import pandas as pd
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-import ncbi_tax, get_lineage
+import ncbi_tax, get_lineage, taxa_store
+
+NODES = [[1, 1, 'no rank', 'root'], [131567, 1, 'cellular root', 'cellular organisms'],
+         [2759, 131567, 'domain', 'Eukaryota'], [33208, 2759, 'kingdom', 'Metazoa'],
+         [7711, 33208, 'phylum', 'Chordata'], [89593, 7711, 'subphylum', 'Craniata'],
+         [9604, 89593, 'family', 'Hominidae'], [207598, 9604, 'subfamily', 'Homininae'],
+         [9605, 207598, 'genus', 'Homo'], [9606, 9605, 'species', 'Homo sapiens'],
+         [63221, 9606, 'subspecies', 'Homo sapiens neanderthalensis'],
+         [10088, 33208, 'genus', 'Mus'], [10090, 10088, 'species', 'Mus musculus'],
+         [555, 444, 'species', 'Orphan species'], [556, 555, 'strain', 'Orphan strain']]
 
 class TestFerLineage(unittest.TestCase): 
 
@@ -51,3 +61,41 @@ class TestFerLineage(unittest.TestCase):
             line += ';'
         self.assertEqual('root:1;Eukaryota:2759;Metazoa:33208;Chordata:7711;Mammalia:40674;Primates:9443;Hominidae:9604;Homo:9605;Homo sapiens:9606;', line)
         
+
+class TestLineageResolver(unittest.TestCase):
+
+    def test_resolve(self):
+        nodes_df = pd.DataFrame(NODES, columns=['tax_id', 'parent_tax_id', 'rank', 'name_txt'])
+        ranks = [get_lineage.REDUCED_RANKS, get_lineage.MINIMAL_RANKS]
+
+        with tempfile.TemporaryDirectory() as folder:
+            taxa_store.write_nodes_store(folder, nodes_df)
+            resolver = get_lineage.LineageResolver(taxa_store.NodesStore(folder), ranks)
+
+            tax_ids = [63221, 9606, 10090, 1, 556, 555, 42, 9606]
+            for mode in ['full', 'reduced', 'minimal']:
+                expected = [get_lineage.search_nodes(tax_id, nodes_df.set_index('tax_id'), ranks, mode)
+                            for tax_id in tax_ids]
+                self.assertListEqual(expected, resolver.resolve(tax_ids, mode))
+
+            self.assertListEqual(['root:1', 'cellular organisms:131567', 'Eukaryota:2759',
+                                  'Metazoa:33208', 'Chordata:7711',
+                                  'Hominidae:9604', 'Homo:9605', 'Homo sapiens:9606'],
+                                 resolver.resolve([9606], 'minimal')[0])
+
+    def test_merged_and_deleted(self):
+        nodes_df = pd.DataFrame(NODES, columns=['tax_id', 'parent_tax_id', 'rank', 'name_txt'])
+        merged_df = pd.DataFrame({'old_tax_id': [10089, 99999], 'new_tax_id': [10090, 9606]})
+        ranks = [get_lineage.REDUCED_RANKS, get_lineage.MINIMAL_RANKS]
+
+        with tempfile.TemporaryDirectory() as folder:
+            taxa_store.write_nodes_store(folder, nodes_df, merged_df, [12345])
+            nodes = taxa_store.NodesStore(folder)
+            resolver = get_lineage.LineageResolver(nodes, ranks)
+
+            self.assertEqual(10090, nodes.redirect(10089))
+            self.assertEqual(9606, nodes.redirect(9606))
+            self.assertTrue(nodes.is_deleted(12345))
+            self.assertListEqual(resolver.resolve([10090, 9606], 'full'),
+                                 resolver.resolve([10089, 99999], 'full'))
+            self.assertListEqual([[]], resolver.resolve([12345], 'full'))
@@ -0,0 +1,41 @@
+import unittest
+import os
+import sys
+import tempfile
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import lca, taxa_store
+from test_get_lineage import NODES
+
+class TestLCAIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        nodes_df = pd.DataFrame(NODES, columns=['tax_id', 'parent_tax_id', 'rank', 'name_txt'])
+        taxa_store.write_nodes_store(self.tmp.name, nodes_df)
+        self.index = lca.LCAIndex(taxa_store.NodesStore(self.tmp.name))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lca(self):
+        pairs = [(9606, 10090, 33208), (63221, 9605, 9605), (9606, 9606, 9606),
+                 (1, 9606, 1), (7711, 10090, 33208), (556, 555, 555),
+                 (556, 9606, -1), (42, 9606, -1)]
+        result = self.index.lca([p[0] for p in pairs], [p[1] for p in pairs])
+        self.assertListEqual([p[2] for p in pairs], result.tolist())
+
+    def test_lca_set(self):
+        self.assertEqual(33208, self.index.lca_set([63221, 9606, 10090]))
+        self.assertEqual(9605, self.index.lca_set([63221, 9605, 9606]))
+        self.assertEqual(10090, self.index.lca_set([10090]))
+        self.assertEqual(-1, self.index.lca_set([9606, 556]))
+
+    def test_is_ancestor(self):
+        result = self.index.is_ancestor([2759, 9606, 9606, 10088, 1, 444],
+                                        [63221, 9606, 9605, 9606, 556, 556])
+        self.assertListEqual([True, True, False, False, False, False], result.tolist())
+
+if __name__=="__main__":
+    unittest.main()
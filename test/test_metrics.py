@@ -0,0 +1,85 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import metrics
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_phase(self):
+        phase = metrics.Phase('index_search', 4)
+        for name in phase.feed(['a', 'b', 'c']):
+            pass
+        phase.add(True)
+        phase.add(False)
+        snapshot = phase.snapshot()
+
+        self.assertEqual(2, snapshot['names_processed'])
+        self.assertEqual(1, snapshot['names_failed'])
+        self.assertEqual(0.5, snapshot['success_ratio'])
+        self.assertEqual(1, snapshot['queue_depth'])
+        self.assertGreater(snapshot['eta_seconds'], 0)
+        self.assertEqual(1, snapshot['running'])
+
+        # Without a total there is no ETA
+        self.assertIsNone(metrics.Phase('dict_search').snapshot()['eta_seconds'])
+
+    def test_json_lines(self):
+        file_name = os.path.join(self.tmp.name, 'metrics.jsonl')
+        run_metrics = metrics.RunMetrics(file_name, interval=60)
+        phase = metrics.start(run_metrics, 'dict_search')
+        phase.add(True)
+        metrics.finish(run_metrics, phase)
+        run_metrics.close()
+
+        with open(file_name, encoding='utf-8') as t:
+            lines = [json.loads(line) for line in t]
+        self.assertEqual(['dict_search', 'dict_search'], [line['phase'] for line in lines])
+        self.assertEqual(0, lines[-1]['running'])
+        self.assertEqual(1, lines[-1]['names_found'])
+        self.assertGreater(lines[-1]['main_rss_bytes'], 0)
+
+    def test_prometheus(self):
+        file_name = os.path.join(self.tmp.name, 'metrics.prom')
+        run_metrics = metrics.RunMetrics(file_name, interval=0.05)
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(2) as pool:
+            phase = metrics.start(run_metrics, 'index_search', 10)
+            pool.map(abs, range(10))
+            for _ in range(10):
+                phase.add(True)
+            metrics.finish(run_metrics, phase)
+        metrics.start(run_metrics, 'get_lineage')
+        run_metrics.close()
+
+        with open(file_name, encoding='utf-8') as t:
+            lines = t.read().splitlines()
+        samples = dict(line.rsplit(' ', 1) for line in lines if not line.startswith('#'))
+        self.assertEqual('10', samples['ncbi_tax_names_processed{phase="index_search"}'])
+        self.assertEqual('1.0', samples['ncbi_tax_success_ratio{phase="index_search"}'])
+        self.assertEqual('0', samples['ncbi_tax_running{phase="index_search"}'])
+        self.assertEqual('2', samples['ncbi_tax_workers{phase="index_search"}'])
+        self.assertGreater(int(samples['ncbi_tax_worker_rss_bytes{phase="index_search"}']), 0)
+        self.assertEqual('NaN', samples['ncbi_tax_names_total{phase="get_lineage"}'])
+        self.assertIn('# TYPE ncbi_tax_eta_seconds gauge', lines)
+        self.assertFalse(os.path.exists(file_name + '.tmp'))
+
+    def test_disabled(self):
+        # Without a metrics file the phases are only counted
+        phase = metrics.start(None, 'get_lineage', 1)
+        phase.add(True)
+        metrics.finish(None, phase)
+        self.assertEqual(1, phase.found)
+
+if __name__=="__main__":
+    unittest.main()
@@ -2,10 +2,140 @@ import unittest
 from unittest.mock import patch
 import os 
 import sys
+import tempfile
+import hashlib
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
 import pandas as pd
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-import ncbi_tax
+import ncbi_tax, utils, taxa_store
+
+class DumpHandler(BaseHTTPRequestHandler):
+    '''Stand-in for the NCBI server, serving taxdmp.zip with range support.'''
+    files = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def send_file(self, body:bool):
+        self.requests.append((self.command, self.path, self.headers.get('Range')))
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+        data = self.files[self.path]
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range') == 'Mon, 01 Jan 2024 00:00:00 GMT':
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            if start >= len(data):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data)-1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)-start))
+        self.send_header('Last-Modified', 'Mon, 01 Jan 2024 00:00:00 GMT')
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start:])
+
+    def do_GET(self):
+        self.send_file(True)
+
+    def do_HEAD(self):
+        self.send_file(False)
+
+class TestGetDumpfile(unittest.TestCase):
+
+    def setUp(self):
+        self.data = os.urandom(3*1024*1024 + 123)
+        DumpHandler.files = {'/taxdmp.zip': self.data,
+                             '/taxdmp.zip.md5': (hashlib.md5(self.data).hexdigest()+'  taxdmp.zip\n').encode()}
+        DumpHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), DumpHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/taxdmp.zip'
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def downloads(self):
+        return [request for request in DumpHandler.requests if request[:2] == ('GET', '/taxdmp.zip')]
+
+    def test_download_and_skip(self):
+        download = ncbi_tax.get_dumpfile(self.folder, url=self.url)
+        with open(os.path.join(self.folder, 'taxdmp.zip'), 'rb') as t:
+            self.assertEqual(self.data, t.read())
+        self.assertEqual(hashlib.md5(self.data).hexdigest(), download['md5'])
+        self.assertEqual('Mon, 01 Jan 2024 00:00:00 GMT', download['last_modified'])
+        # Not recorded before the database is built
+        self.assertDictEqual({}, ncbi_tax.read_update_log(self.folder))
+
+        # Not recorded (e.g. the build was interrupted): no new download,
+        # but the database is built again
+        self.assertDictEqual(download, ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        self.assertEqual(1, len(self.downloads()))
+
+        # Recorded and unchanged checksum: up to date
+        ncbi_tax.write_update_log(self.folder, download)
+        self.assertEqual(download['md5'], ncbi_tax.read_update_log(self.folder)['md5'])
+        self.assertIsNone(ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        self.assertEqual(1, len(self.downloads()))
+
+    def test_read_snapshot(self):
+        self.assertEqual('unknown', ncbi_tax.read_snapshot(self.folder))
+        with open(os.path.join(self.folder, 'update.log'), 'w', encoding='utf-8') as w:
+            w.write('NCBI taxonomy last downloaded and updated on: 2025-10-20 16:41:49.120.\n')
+        self.assertEqual('2025-10-20 16:41:49.120', ncbi_tax.read_snapshot(self.folder))
+
+        ncbi_tax.write_update_log(self.folder, ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        snapshot = ncbi_tax.read_snapshot(self.folder)
+        self.assertTrue(snapshot.endswith(' md5: '+hashlib.md5(self.data).hexdigest()))
+        self.assertNotIn('2025-10-20', snapshot)
+
+    def test_resume(self):
+        with open(os.path.join(self.folder, 'taxdmp.zip.part'), 'wb') as w:
+            w.write(self.data[:1000000])
+        self.assertTrue(ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        self.assertEqual([('GET', '/taxdmp.zip', 'bytes=1000000-')], self.downloads())
+        with open(os.path.join(self.folder, 'taxdmp.zip'), 'rb') as t:
+            self.assertEqual(self.data, t.read())
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'taxdmp.zip.part')))
+
+    def test_resume_complete(self):
+        # A previous run downloaded the whole file but did not verify it
+        with open(os.path.join(self.folder, 'taxdmp.zip.part'), 'wb') as w:
+            w.write(self.data)
+        self.assertTrue(ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        self.assertEqual([('GET', '/taxdmp.zip', f'bytes={len(self.data)}-')], self.downloads())
+        with open(os.path.join(self.folder, 'taxdmp.zip'), 'rb') as t:
+            self.assertEqual(self.data, t.read())
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'taxdmp.zip.part')))
+
+    def test_resume_corrupt(self):
+        # A complete but corrupt part is discarded and downloaded again
+        with open(os.path.join(self.folder, 'taxdmp.zip.part'), 'wb') as w:
+            w.write(b'x' + self.data[1:])
+        self.assertTrue(ncbi_tax.get_dumpfile(self.folder, url=self.url))
+        self.assertEqual([('GET', '/taxdmp.zip', f'bytes={len(self.data)}-'), ('GET', '/taxdmp.zip', None)],
+                         self.downloads())
+        with open(os.path.join(self.folder, 'taxdmp.zip'), 'rb') as t:
+            self.assertEqual(self.data, t.read())
+
+    def test_checksum_mismatch(self):
+        DumpHandler.files['/taxdmp.zip.md5'] = b'0'*32 + b'  taxdmp.zip\n'
+        with self.assertRaises(SystemExit):
+            ncbi_tax.get_dumpfile(self.folder, url=self.url)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'taxdmp.zip')))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'taxdmp.zip.part')))
 
 class TestGetTaxa(unittest.TestCase): 
 
@@ -18,5 +148,142 @@ class TestGetTaxa(unittest.TestCase):
         #taxa2, list_index2 = ncbi_tax.get_taxa()
         #self.assertDictEqual(list_index, list_index2)
 
+    def test_read_dmp_file(self):
+        lines = ['144551\t|\t Krishnamurthy 11-00121\t|\t Krishnamurthy 11-00121 <holotype>\t|\ttype material\t|\n',
+                 '144509\t|\tFusarium sp. BBA 65925\t|\t\t|\tscientific name\t|\n',
+                 '9606\t|\t"Homo sapiens" Linnaeus, 1758\t|\t\t|\tauthority\t|\n',
+                 '562\t|\tEscherichia coli O\'Brien\t|\t\t|\tsynonym\t|\n']
+        header = ['tax_id', 'name_txt', 'unique name', 'name class']
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'names.dmp')
+            with open(file_name, 'w', encoding='utf-8') as w:
+                w.writelines(lines)
+            dmp_df = ncbi_tax.read_dmp_file(file_name, header, chunksize=3)
+
+        expected = [utils.read_line(line) for line in lines]
+        self.assertListEqual(expected, dmp_df.values.tolist())
+
+    def test_open_dump_member(self):
+        names = ['9606\t|\tHomo sapiens\t|\t\t|\tscientific name\t|\n',
+                 '10090\t|\tMus musculus\t|\t\t|\tscientific name\t|\n',
+                 '10090\t|\thouse mouse\t|\t\t|\tgenbank common name\t|\n']
+
+        with tempfile.TemporaryDirectory() as folder:
+            with zipfile.ZipFile(os.path.join(folder, 'taxdmp.zip'), 'w') as archive:
+                archive.writestr('names.dmp', ''.join(names))
+                archive.writestr('merged.dmp', '10089\t|\t10090\t|\n')
+
+            self.assertIsNone(ncbi_tax.open_dump_member(folder, 'citations.dmp'))
+            taxa = ncbi_tax.sort_taxa_names(folder)
+            merged_df, deleted = ncbi_tax.read_merged_file(folder)
+            # Nothing was extracted
+            self.assertFalse(os.path.exists(os.path.join(folder, 'taxdmp')))
+
+        self.assertListEqual(['Homo sapiens', 'house mouse', 'Mus musculus'], taxa['name_txt'].tolist())
+        self.assertListEqual([[10089, 10090]], merged_df.values.tolist())
+        self.assertIsNone(deleted)
+
+    def test_update_db_incremental(self):
+        nodes = ['1\t|\t1\t|\tno rank\t|\n', '7460\t|\t1\t|\tspecies\t|\n',
+                 '9606\t|\t1\t|\tspecies\t|\n', '10090\t|\t1\t|\tspecies\t|\n']
+        names = ['1\t|\troot\t|\t\t|\tscientific name\t|\n',
+                 '7460\t|\tApis mellifera\t|\t\t|\tscientific name\t|\n',
+                 '9606\t|\tHomo sapiens\t|\t\t|\tscientific name\t|\n',
+                 '10090\t|\tMus musculus\t|\t\t|\tscientific name\t|\n']
+
+        def write_dump(folder, names):
+            with zipfile.ZipFile(os.path.join(folder, 'taxdmp.zip'), 'w') as archive:
+                archive.writestr('names.dmp', ''.join(names))
+                archive.writestr('nodes.dmp', ''.join(nodes))
+                archive.writestr('merged.dmp', '10089\t|\t10090\t|\n')
+
+        def read_files(folder):
+            with open(os.path.join(folder, 'taxa_names_sorted.tsv'), encoding='utf-8') as t:
+                return t.read(), taxa_store.TaxaStore(folder).to_frame()
+
+        download = {'md5': 'x', 'last_modified': ''}
+        with tempfile.TemporaryDirectory() as folder, tempfile.TemporaryDirectory() as full, \
+            patch.object(ncbi_tax, 'get_dumpfile', return_value=download):
+            write_dump(folder, names)
+            ncbi_tax.update_db(folder)
+
+            # Only a synonym was added: the nodes store is kept
+            names.append('10090\t|\thouse mouse\t|\t\t|\tgenbank common name\t|\n')
+            for path in [folder, full]:
+                write_dump(path, names)
+            with patch.object(taxa_store, 'write_nodes_store', wraps=taxa_store.write_nodes_store) as write_nodes:
+                ncbi_tax.update_db(folder, incremental=True)
+                self.assertEqual(0, write_nodes.call_count)
+                ncbi_tax.update_db(full)
+            self.assertEqual(read_files(full)[0], read_files(folder)[0])
+            pd.testing.assert_frame_equal(read_files(full)[1], read_files(folder)[1])
+            self.assertEqual('Mus musculus', taxa_store.NodesStore(folder).name(10090))
+
+            # A renamed scientific name changes the nodes store
+            names[3] = names[3].replace('Mus musculus', 'Mus musculus musculus')
+            write_dump(folder, names)
+            ncbi_tax.update_db(folder, incremental=True)
+            self.assertEqual('Mus musculus musculus', taxa_store.NodesStore(folder).name(10090))
+
+    def test_patch_taxa(self):
+        columns = ['tax_id', 'name_txt', 'unique name', 'name class']
+        taxa = pd.read_csv('test/data/taxa_names_sorted.tsv', sep='\t', keep_default_na=False)
+        # names.dmp is ordered by tax ID
+        new_names = taxa[columns].sort_values('tax_id', kind='stable').reset_index(drop=True)
+
+        old_names = new_names.drop(range(0, len(new_names), 7)).copy()
+        old_names.loc[old_names.index[::11], 'name_txt'] += ' old'
+        old_names = pd.concat([old_names, pd.DataFrame([[9606, 'Homo sapiens', '', 'synonym']], columns=columns)])
+        # Names equal up to case: an added row before a kept one of the same
+        # tax ID, and rows of several tax IDs
+        ties = pd.DataFrame([[1, 'homo SAPIENS', '', 'synonym'], [1, 'Homo Sapiens', 'x', 'misspelling'],
+                             [9999999, 'HOMO sapiens', '', 'synonym']], columns=columns)
+        old_names = pd.concat([old_names, ties.iloc[[1]]])
+        new_names = pd.concat([new_names, ties])
+        old_names = old_names.sort_values('tax_id', kind='stable').reset_index(drop=True)
+        new_names = new_names.sort_values('tax_id', kind='stable').reset_index(drop=True)
+
+        def write_names(folder, names):
+            os.makedirs(os.path.join(folder, 'taxdmp'), exist_ok=True)
+            with open(os.path.join(folder, 'taxdmp', 'names.dmp'), 'w', encoding='utf-8') as w:
+                for row in names.itertuples(index=False):
+                    w.write('\t|\t'.join(str(value) for value in row) + '\t|\n')
+
+        with tempfile.TemporaryDirectory() as folder:
+            write_names(folder, old_names)
+            old_taxa = ncbi_tax.sort_taxa_names(folder)
+            write_names(folder, new_names)
+            new_taxa = ncbi_tax.sort_taxa_names(folder)
+            new_dmp = ncbi_tax.read_dmp_file(os.path.join(folder, 'taxdmp', 'names.dmp'), columns)
+
+        # Same rows, order and columns as sorting the new names.dmp
+        taxa_df, row_map, added_rows = ncbi_tax.patch_taxa(old_taxa, new_dmp)
+        pd.testing.assert_frame_equal(new_taxa, taxa_df)
+        self.assertListEqual(['homo SAPIENS', 'Homo Sapiens', 'HOMO sapiens'],
+                             [name for name in taxa_df['name_txt'] if name.lower() == 'homo sapiens'][-3:])
+
+        kept = row_map >= 0
+        self.assertListEqual(old_taxa.loc[kept, 'name_txt'].tolist(), taxa_df.loc[row_map[kept], 'name_txt'].tolist())
+
+        trigram_index = taxa_store.patch_trigram_index(
+            taxa_store.build_trigram_index(old_taxa['name_txt'].tolist()),
+            row_map, taxa_df.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        for patched, built in zip(trigram_index, taxa_store.build_trigram_index(taxa_df['name_txt'].tolist())):
+            np.testing.assert_array_equal(built, patched)
+
+        exact_index = taxa_store.patch_exact_index(
+            taxa_store.build_exact_index(old_taxa['name_txt'].tolist()),
+            row_map, taxa_df.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        for patched, built in zip(exact_index, taxa_store.build_exact_index(taxa_df['name_txt'].tolist())):
+            np.testing.assert_array_equal(built, patched)
+            self.assertEqual(built.dtype, patched.dtype)
+
+        normalized_index = taxa_store.patch_normalized_index(
+            taxa_store.build_normalized_index(old_taxa['name_txt'].tolist()),
+            row_map, taxa_df.loc[added_rows, 'name_txt'].tolist(), added_rows)
+        for patched, built in zip(normalized_index, taxa_store.build_normalized_index(taxa_df['name_txt'].tolist())):
+            np.testing.assert_array_equal(built, patched)
+
 if __name__=="__main__": 
     unittest.main()
\ No newline at end of file
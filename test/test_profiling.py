@@ -0,0 +1,34 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import profiling
+
+class TestProfiling(unittest.TestCase):
+
+    def test_add_and_write(self):
+        first, second = profiling.SearchProfile(), profiling.SearchProfile()
+        first.count('queries', 4)
+        first.count('candidates_scored', 10)
+        second.count('queries')
+        second.times['scan'] = 0.5
+        first.add(second.to_dict())
+
+        self.assertEqual(2, first.processes)
+        self.assertEqual(5, first.counts['queries'])
+        self.assertEqual(2, first.summary()['per_query']['candidates_scored'])
+        self.assertEqual(100, first.summary()['per_query']['scan_ms'])
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'profile')
+            first.write(file_name)
+            with open(file_name+'.json', encoding='utf-8') as t:
+                self.assertEqual(first.counts, json.load(t)['counts'])
+            with open(file_name+'.tsv', encoding='utf-8') as t:
+                self.assertIn('counts\tqueries\t5\n', t.read())
+
+if __name__=="__main__":
+    unittest.main()
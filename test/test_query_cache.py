@@ -0,0 +1,67 @@
+import unittest
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import query_cache
+
+RECORD = ('Homo_sapiens', 9606, 'Homo sapiens', 'scientific name', 100.0, 0, None, None, None, 0.0, None)
+
+class TestQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file_name = query_cache.cache_path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lookup(self):
+        cache = query_cache.QueryCache(self.file_name, 'lenient', 95, '2026-01-01')
+        cache.add('Homo_sapiens', 9606, RECORD)
+        cache.add('Unicorn', None, ('Unicorn',) + (None,) * 10)
+        cache.add('Mus', None, None)
+        cache.close()
+
+        cache = query_cache.QueryCache(self.file_name, 'lenient', 95, '2026-01-01')
+        found = cache.lookup(['Homo_sapiens', 'Unicorn', 'Mus', 'Escherichia'])
+        self.assertDictEqual({'Homo_sapiens': (9606, RECORD), 'Unicorn': (None, ('Unicorn',) + (None,) * 10),
+                              'Mus': (None, None)}, found)
+        self.assertEqual(3, cache.hits)
+        cache.close()
+
+        # Other modes, scores and snapshots do not share results
+        for key in [('strict', 95, '2026-01-01'), ('lenient', 90, '2026-01-01'), ('lenient', 95, '2026-02-01')]:
+            cache = query_cache.QueryCache(self.file_name, *key)
+            self.assertDictEqual({}, cache.lookup(['Homo_sapiens']))
+            cache.close()
+
+    def test_eviction(self):
+        cache = query_cache.QueryCache(self.file_name, 'strict', 95, '2026-01-01', max_entries=3)
+        for i in range(5):
+            cache.add(f'name {i}', i, None)
+        cache.flush()
+        # A used result is kept over older unused ones
+        cache.lookup(['name 0'])
+        cache.close()
+
+        cache = query_cache.QueryCache(self.file_name, 'strict', 95, '2026-01-01')
+        self.assertListEqual(['name 0', 'name 3', 'name 4'],
+                             sorted(cache.lookup([f'name {i}' for i in range(5)])))
+        cache.close()
+
+    def test_invalidate(self):
+        for snapshot in ['2026-01-01', '2026-02-01']:
+            cache = query_cache.QueryCache(self.file_name, 'strict', 95, snapshot)
+            cache.add('Homo_sapiens', 9606, RECORD)
+            cache.close()
+
+        query_cache.invalidate(self.tmp.name, '2026-02-01')
+        for snapshot, expected in [('2026-01-01', 0), ('2026-02-01', 1)]:
+            cache = query_cache.QueryCache(self.file_name, 'strict', 95, snapshot)
+            self.assertEqual(expected, len(cache.lookup(['Homo_sapiens'])))
+            cache.close()
+
+if __name__=="__main__":
+    unittest.main()
@@ -2,11 +2,14 @@ import unittest
 from unittest.mock import patch
 import os 
 import sys
+import shutil
+import tempfile
+import multiprocessing
 import pandas as pd
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import search_name as sn
-import ncbi_tax, utils
+import ncbi_tax, utils, taxa_store, profiling
 
 class TestGetTaxa(unittest.TestCase): 
 
@@ -30,7 +33,7 @@ class TestGetTaxa(unittest.TestCase):
         folder = f'{os.path.join(os.environ.get("HOME"), ".ncbi_tax")}'
 
         taxa_df, list_index = ncbi_tax.get_taxa(folder)
-        taxa_name_dict = dict(zip(taxa_df['name_txt'].values, taxa_df.index))
+        taxa_name_dict = taxa_df.exact_index()
         score = 95
         mode = 'lenient'
 
@@ -67,5 +70,221 @@ class TestGetTaxa(unittest.TestCase):
         searcher.search_approximate(q, subset, 'uncultured eukaryote')
         
 
+NAMES = ['Hybomitra montan', 'Hybomitra_montana_XY12_1', 'Helina sp BIOUG31989-A08',
+         'Microgobius microlepis 123 KT0001', 'Megaselia sp', 'Mammalian expression vector']
+
+def measure_worker(rounds):
+    '''Runs searches in a pool worker and returns the RSS growth in MB
+    after a warm up round.'''
+    for name in NAMES:
+        sn.process_worker((name, 'lenient'))
+    before = utils.get_rss()
+    for i in range(rounds):
+        for name in NAMES:
+            sn.process_worker((name, 'lenient'))
+    return utils.get_rss() - before
+
+class TestSearchApproximate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        taxa = pd.read_csv('test/data/taxa_names_sorted.tsv', sep='\t', keep_default_na=False)
+        taxa['dup'] = 0
+        taxa_store.write_store(self.tmp.name, taxa)
+        store = taxa_store.TaxaStore(self.tmp.name)
+        shutil.copy('test/data/taxa_indeces.txt', self.tmp.name)
+        ncbi_tax.get_homonyms_file(self.tmp.name, store)
+        list_index = ncbi_tax.read_indices('test/data/taxa_indeces.txt')
+        sn.TaxonomySearcher.initialize(store, list_index, {}, 80)
+        self.searcher = sn.TaxonomySearcher('ncbi')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def loop_search(self, query, subset, word):
+        '''Reference implementation scoring one candidate after another.'''
+        matching = subset[subset.str.contains(word, case=False, na=False, regex=False)].index
+        best_scores = [0, 0, 0, 0, 0]
+        best_candidates = [None, None, None, None, None]
+        for idx in matching:
+            scores = query.get_score(word, subset.at[idx])
+            for i in range(len(scores)):
+                if scores[i] > self.searcher.limit and scores[i] > best_scores[i]:
+                    best_scores[i] = scores[i]
+                    best_candidates[i] = idx
+        for i in range(len(best_candidates)):
+            if best_candidates[i] is not None:
+                return best_candidates[i], best_scores[i]
+        return None, 0
+
+    def test_search_approximate(self):
+        found = 0
+        for name in NAMES:
+            for reduce in [False, True]:
+                q = sn.Query(name)
+                if reduce:
+                    q.reduce_name()
+                word = q.min_name if q.min_name else q.name
+                subset = self.searcher.get_subset(word[0].upper())
+                idx, score = self.loop_search(q, subset, word)
+
+                self.searcher.search_approximate(q, subset, word)
+                if idx is None:
+                    self.assertIsNone(q.tax_id)
+                else:
+                    self.assertEqual(self.searcher.taxa_df.tax_id[idx], q.tax_id)
+                    self.assertEqual(round(score, 3), q.relaxed_score)
+                    found += 1
+        self.assertGreater(found, 3)
+
+    def test_find_prefix_matches(self):
+        words = ['Megaselia sp. BIOUG21844-C11 xy', 'Megaselia sp. BIOUG21844-C11', 'Megaselia sp.',
+                 'Megaselia']
+        subset = self.searcher.get_subset('M')
+        sn.TaxonomySearcher.profile = profiling.SearchProfile()
+        try:
+            matches = self.searcher.find_prefix_matches(subset, words)
+            profile = sn.TaxonomySearcher.profile
+        finally:
+            sn.TaxonomySearcher.profile = None
+
+        # Same matches as a scan for each word, with a single scan
+        for word in words:
+            self.assertListEqual(list(self.searcher.find_matches(subset, word)), list(matches[word]))
+        self.assertGreater(len(matches['Megaselia']), len(matches['Megaselia sp. BIOUG21844-C11']))
+        self.assertEqual(1, profile.counts['candidate_scans'])
+
+    def test_process_group(self):
+        names = ['Megaselia_sp._clone_12_KX1234', 'Megaselia_sp._clone_7_MN98765',
+                 'Megaselia_sp._clone_3_OQ4321', 'Megaselia_xy_clone_1', 'Bacillus_sp._clone_2_AB123']
+        groups = list(sn.group_names(names + ['']))
+        self.assertListEqual([names[:3], [names[3]], [names[4]], ['']], groups)
+        self.assertListEqual([names[:2], [names[2]]], list(sn.group_names(names[:3], size=2)))
+        self.assertListEqual([names[:2], [names[2]]], list(sn.group_names(names[:3], batch=2)))
+
+        expected = [sn.process_name((name, 'lenient', self.searcher)) for name in names[:3]]
+        sn.worker_searcher = self.searcher
+        try:
+            results, reused = sn.process_group((names[:3], 'lenient'))
+        finally:
+            sn.worker_searcher = None
+        # Same results, with the scans of the first name reused by the others
+        self.assertListEqual([result[0] for result in expected], [result[0] for result in results])
+        self.assertListEqual([result[1][:9] for result in expected], [result[1][:9] for result in results])
+        self.assertGreater(reused, 0)
+        self.assertIsNone(self.searcher.match_cache)
+
+    def test_search_normalized(self):
+        store = self.searcher.taxa_df
+        for name, expected in [('nocardia_sp_Bt_12', 'Nocardia sp. Bt 12'),
+                               ('"Xerasia  GRISESCENS"', 'Xerasia grisescens'),
+                               ('Fusarium sp NRRL 45996', 'Fusarium sp. NRRL 45996')]:
+            q = sn.Query(name)
+            self.searcher.search_exact(q)
+            self.assertIsNone(q.tax_id)
+
+            result = sn.process_name((name, 'relaxed', self.searcher))
+            self.assertEqual(expected, result[1][2])
+            self.assertEqual(store.tax_id[store.exact_index()[expected]], result[0])
+            self.assertEqual(sn.NORMALIZED_COMMENT, result[1][10])
+
+        q = sn.Query('Nocardia sp. Bt 1')
+        self.searcher.search_normalized(q)
+        self.assertIsNone(q.tax_id)
+
+        # Normalized matches must score above the limit as well
+        q = sn.Query('"Xerasia  GRISESCENS"')
+        with patch.object(sn.TaxonomySearcher, 'limit', 95):
+            self.searcher.search_normalized(q)
+        self.assertIsNone(q.tax_id)
+        self.assertIsNone(q.comment)
+
+    def test_search_normalized_homonyms(self):
+        taxa = pd.DataFrame({'tax_id': [1, 2, 3, 3, 4], 'name class': 'scientific name',
+                             'name_txt': ['Bacillus sp. A', 'bacillus SP A', 'Homo sapiens',
+                                          'Homo sapiens', 'Mus musculus']})
+        taxa_store.write_store(self.tmp.name, taxa)
+        store = taxa_store.TaxaStore(self.tmp.name)
+        list_index = {'B': [0, 2], 'H': [2, 4], 'M': [4, 5]}
+        sn.TaxonomySearcher.initialize(store, list_index, store.exact_index(), 80)
+
+        # Keys of several tax IDs and homonyms are not matched
+        for name, tax_ids in [('Bacillus_sp_A', [1, 2]), ('homo sapiens', [3]), ('mus_musculus', None)]:
+            q = sn.Query(name)
+            self.searcher.search_normalized(q)
+            self.assertEqual(tax_ids, q.normalized_homonyms)
+            self.assertEqual(None if tax_ids else 4, q.tax_id)
+            self.assertEqual(None if tax_ids else sn.NORMALIZED_COMMENT, q.comment)
+
+        # A fuzzy match of such a key is not commented as homonym
+        tax_id, result = sn.process_name(('Bacillus_sp_A', 'relaxed', self.searcher))
+        self.assertIn(tax_id, [1, 2])
+        self.assertIsNone(result[10])
+
+        # The homonyms are commented if the fuzzy search fails as well
+        with patch.object(sn.TaxonomySearcher, 'limit', 100):
+            tax_id, result = sn.process_name(('Bacillus_sp_A', 'relaxed', self.searcher))
+        self.assertIsNone(tax_id)
+        self.assertEqual('HOMONYM - multiple entries found: 1, 2', result[10])
+
+    def test_dict_search_checkpoints(self):
+        store = self.searcher.taxa_df
+        sn.TaxonomySearcher.initialize(store, self.searcher.list_index, store.exact_index(), 80)
+        names = [name for idx, name in store.names(0, 50).items() if store.dup[idx] == 0 and '_' not in name][:5]
+        names.append('Not a taxon name')
+        file_path = [os.path.join(self.tmp.name, 'tax_ids.tsv'), os.path.join(self.tmp.name, 'tax_ids_failed.txt')]
+        utils.load_checkpoint(file_path, True)
+
+        # A checkpoint every 2 matches and one at the end
+        with patch.object(utils.ResultWriter, 'checkpoint', autospec=True,
+                          side_effect=utils.ResultWriter.checkpoint) as checkpoint:
+            failed, tax_ids = sn.dict_search(iter(names), self.searcher, file_path, quiet=True, checkpoint_size=2)
+        self.assertListEqual([2, 4, 5], [call.args[1] for call in checkpoint.call_args_list])
+        self.assertListEqual(['Not a taxon name'], list(failed))
+        self.assertEqual(5, sum(tax_ids.values()))
+        self.assertEqual([5, 0], utils.CheckpointSidecar(file_path).read_state()['counts'])
+
+    def test_profile(self):
+        expected = [sn.process_name((name, 'lenient', self.searcher)) for name in NAMES]
+        sn.TaxonomySearcher.profile = profiling.SearchProfile()
+        try:
+            results = [sn.process_name((name, 'lenient', self.searcher)) for name in NAMES]
+            profile = sn.TaxonomySearcher.profile
+        finally:
+            sn.TaxonomySearcher.profile = None
+
+        # Profiling does not change the results
+        self.assertListEqual([result[1][:9] for result in expected], [result[1][:9] for result in results])
+        self.assertEqual(len(NAMES), profile.counts['queries'])
+        self.assertGreater(profile.counts['shave_iterations'], 0)
+        # Each candidate is scored against at most the 5 query variants
+        self.assertGreater(profile.counts['candidates_scored'], 0)
+        self.assertLessEqual(profile.counts['candidates_scored'], 5 * profile.counts['candidates_scanned'])
+        self.assertGreater(profile.times['relaxed'], 0)
+
+        # Profiles of pool workers are written on exit and collected
+        ctx = multiprocessing.get_context('spawn')
+        pool = ctx.Pool(2, initializer=sn.init_worker, initargs=(self.tmp.name, 80, self.tmp.name, True))
+        pool.map(sn.process_worker, [(name, 'lenient') for name in NAMES])
+        pool.close()
+        pool.join()
+        workers = profiling.collect(self.tmp.name)
+        self.assertEqual(2, workers.processes)
+        self.assertDictEqual(profile.counts, workers.counts)
+        self.assertEqual(2, len([f for f in os.listdir(self.tmp.name) if f.endswith('.prof')]))
+
+    def test_worker_pool(self):
+        expected = [sn.process_name((name, 'lenient', self.searcher))[0] for name in NAMES]
+
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(2, initializer=sn.init_worker, initargs=(self.tmp.name, 80)) as pool:
+            results = pool.map(sn.process_worker, [(name, 'lenient') for name in NAMES])
+            self.assertListEqual(expected, [result[0] for result in results])
+
+            # Workers must not grow while searching the shared store
+            growth = pool.map(measure_worker, [20, 20])
+        for rss in growth:
+            self.assertLess(rss, 10)
+
 if __name__=="__main__": 
     unittest.main()
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+import tempfile
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import taxa_store, utils
+
+class TestTaxaStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = self.tmp.name
+        self.taxa = pd.read_csv('test/data/taxa_names_sorted.tsv', sep='\t', keep_default_na=False)
+        self.taxa['dup'] = self.taxa['name_txt'].duplicated(keep=False).astype(int)
+        taxa_store.write_store(self.folder, self.taxa)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        self.assertTrue(taxa_store.store_exists(self.folder))
+        store = taxa_store.TaxaStore(self.folder)
+
+        self.assertEqual(len(self.taxa), len(store))
+        self.assertListEqual(self.taxa['name_txt'].tolist(), store.names().tolist())
+        self.assertListEqual(self.taxa['tax_id'].tolist(), store.tax_id.tolist())
+        self.assertListEqual(self.taxa['dup'].tolist(), store.dup.tolist())
+
+        row = self.taxa.iloc[42]
+        self.assertEqual((row['tax_id'], row['name_txt'], row['name class']), store.row(42))
+
+        frame = store.to_frame()
+        self.assertListEqual(self.taxa['name class'].tolist(), frame['name class'].tolist())
+
+    def test_names_slice(self):
+        store = taxa_store.TaxaStore(self.folder)
+        subset = store.names(100, 150)
+
+        self.assertEqual(50, len(subset))
+        self.assertEqual(100, subset.index[0])
+        self.assertEqual(self.taxa.at[149, 'name_txt'], subset.at[149])
+        self.assertEqual(0, len(store.names(10, 10)))
+
+    def test_trigram_candidates(self):
+        store = taxa_store.TaxaStore(self.folder)
+        names = store.names()
+
+        for word in ['sp.', 'BIOUG', 'montana', 'Hybomitra mon', 'candida]', 'zzzz', 'ab']:
+            expected = names[names.str.upper().str.contains(word.upper(), regex=False)].index.tolist()
+            candidates = store.trigram_candidates(word, 0, len(store))
+            if len(word) < 3:
+                self.assertIsNone(candidates)
+                continue
+            # Candidates are a superset of the substring matches
+            self.assertTrue(set(expected).issubset(candidates.tolist()))
+            verified = [idx for idx in candidates.tolist() if word.upper() in names[idx].upper()]
+            self.assertListEqual(expected, verified)
+
+        candidates = store.trigram_candidates('sp.', 100, 150)
+        self.assertTrue(all(100 <= idx < 150 for idx in candidates))
+
+    def test_homonyms(self):
+        # Repeat some names to get groups of two and three rows
+        taxa = pd.concat([self.taxa, self.taxa.iloc[[5, 40, 40, 300]]]).sort_values('name_txt', kind='stable')
+        taxa = taxa.reset_index(drop=True)
+        taxa_store.write_store(self.folder, taxa)
+        store = taxa_store.TaxaStore(self.folder)
+
+        homonyms = defaultdict(list)
+        for idx, name in enumerate(taxa['name_txt']):
+            homonyms[name].append(idx)
+        expected = {name: rows for name, rows in homonyms.items() if len(rows) > 1}
+
+        self.assertListEqual([int(len(homonyms[name]) > 1) for name in taxa['name_txt']], store.dup.tolist())
+        self.assertEqual(3, len(store.homonym_groups()[0]) - 1)
+        for idx, name in enumerate(taxa['name_txt']):
+            self.assertListEqual(expected.get(name, []), store.homonyms(idx))
+
+    def test_exact_index(self):
+        taxa = pd.concat([self.taxa, self.taxa.iloc[[5, 40, 40]]]).sort_values('name_txt', kind='stable')
+        taxa = taxa.reset_index(drop=True)
+        taxa_store.write_store(self.folder, taxa)
+        store = taxa_store.TaxaStore(self.folder)
+        index = store.exact_index()
+        taxa_name_dict = dict(zip(store.names().values, range(len(store))))
+
+        for name in taxa['name_txt']:
+            self.assertEqual(taxa_name_dict[name], index[name])
+        for name in ['Homo', 'homo sapiens', '', 'zzzz']:
+            self.assertEqual(taxa_name_dict.get(name), index.get(name))
+            self.assertEqual(name in taxa_name_dict, name in index)
+        with self.assertRaises(KeyError):
+            index['zzzz']
+
+        # Hash collisions are resolved by comparing the names
+        colliding = taxa_store.ExactIndex(store, np.zeros(3, dtype=np.uint64), np.array([0, 1, 2]))
+        colliding.hashes[:] = utils.hash_name(store.name(0))
+        self.assertEqual(0, colliding[store.name(0)])
+        self.assertIsNone(colliding.get(store.name(1)))
+
+    def test_normalized_index(self):
+        taxa = pd.DataFrame({'tax_id': [1, 2, 3, 3, 4], 'name class': 'scientific name',
+                             'name_txt': ['Bacillus sp. A', 'bacillus SP A', 'Homo sapiens',
+                                          'homo sapiens', 'Mus musculus']})
+        taxa_store.write_store(self.folder, taxa)
+        index = taxa_store.TaxaStore(self.folder).normalized_index()
+
+        # All rows of a key are kept
+        self.assertListEqual([0, 1], index.get_all('Bacillus sp. A'))
+        self.assertListEqual([2, 3], index.get_all('HOMO_SAPIENS'))
+        self.assertListEqual([4], index.get_all('"Mus  musculus"'))
+        self.assertEqual(4, index.get('"Mus  musculus"'))
+        self.assertListEqual([], index.get_all('Mus'))
+        self.assertIsNone(index.get('Mus'))
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import taxonomy_db, taxa_store
+from test_get_lineage import NODES
+from test_search_name import NAMES
+
+class TestTaxonomyDB(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        taxa = pd.read_csv('test/data/taxa_names_sorted.tsv', sep='\t', keep_default_na=False)
+        taxa['dup'] = 0
+        taxa_store.write_store(cls.tmp.name, taxa)
+        shutil.copy('test/data/taxa_indeces.txt', cls.tmp.name)
+        nodes_df = pd.DataFrame(NODES, columns=['tax_id', 'parent_tax_id', 'rank', 'name_txt'])
+        taxa_store.write_nodes_store(cls.tmp.name, nodes_df)
+        cls.names = taxa['name_txt'].tolist()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_fast_import(self):
+        code = 'import sys, taxonomy_db; print(sorted({"pandas", "numpy", "rapidfuzz", "tqdm"} & set(sys.modules)))'
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                                cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        self.assertEqual('[]', output.stdout.strip())
+
+    def test_lookup(self):
+        db = taxonomy_db.TaxonomyDB(self.tmp.name)
+        self.assertIsNone(db._taxa)
+
+        match = db.lookup(self.names[200])[0]
+        self.assertEqual(self.names[200], match.name_txt)
+        self.assertEqual(100, match.strict_score)
+        self.assertIsNotNone(db._taxa)
+        # Nodes are not needed for lookups
+        self.assertIsNone(db._resolver)
+
+        strict = db.lookup(NAMES, 'strict')
+        lenient = db.lookup(NAMES, 'lenient', score=80)
+        self.assertEqual(len(NAMES), len(lenient))
+        for s, l in zip(strict, lenient):
+            if s.tax_id is not None:
+                self.assertEqual(s.tax_id, l.tax_id)
+        self.assertGreater(sum(m.tax_id is not None for m in lenient), sum(m.tax_id is not None for m in strict))
+
+    def test_lineage(self):
+        db = taxonomy_db.TaxonomyDB(self.tmp.name)
+        lineage = db.lineage([9606], 'minimal')[0]
+
+        self.assertEqual(9606, lineage.tax_id)
+        self.assertEqual(taxonomy_db.LineageNode(9606, 'Homo sapiens', 'species'), lineage.nodes[-1])
+        self.assertListEqual(db.resolver.resolve([9606], 'minimal')[0],
+                             [f'{node.name}:{node.tax_id}' for node in lineage.nodes])
+        self.assertListEqual([], db.lineage(42)[0].nodes)
+
+if __name__=="__main__":
+    unittest.main()
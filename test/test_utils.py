@@ -1,6 +1,11 @@
 import unittest
+import io
 import os 
 import sys
+import random
+import tempfile
+from unittest.mock import patch
+from rapidfuzz import fuzz
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import utils
@@ -23,6 +28,12 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(utils.tidy_name2('Homo-sapiens'), 'Homo sapiens')
         self.assertEqual(utils.tidy_name2('Virus_ex_Homo_sapiens'), 'Virus')
 
+    def test_normalize_name(self):
+        self.assertEqual(utils.normalize_name('Nocardia sp. Bt 12'), 'NOCARDIA SP. BT 12')
+        for name in ['nocardia_sp_Bt_12', ' "Nocardia  SP Bt 12" ', "Nocardia sp. 'Bt 12'"]:
+            self.assertEqual(utils.normalize_name(name), 'NOCARDIA SP. BT 12')
+        self.assertEqual(utils.normalize_name('Nocardia sp. Bt12'), 'NOCARDIA SP. BT12')
+
     def test_has_number(self): 
         self.assertEqual(utils.has_number('CMW10125'), True)
 
@@ -33,20 +44,154 @@ class TestUtils(unittest.TestCase):
     def test_read_name_file(self): 
         self.assertEqual(utils.read_name_file('test/data/names_list.txt'), (['Homo sapiens', 'Mus musculus']))
     
+    def test_unique_names(self):
+        names = ['Homo sapiens', 'Mus musculus', 'Homo sapiens', 'Danio rerio', 'Mus musculus',
+                 'Apis mellifera', 'Danio rerio', 'Apis mellifera', 'Bos taurus']
+        expected = ['Homo sapiens', 'Mus musculus', 'Danio rerio', 'Apis mellifera', 'Bos taurus']
+
+        unique = utils.UniqueNames(iter(names))
+        self.assertListEqual(expected, list(unique))
+        self.assertEqual((9, 5, False), (unique.total, unique.unique, unique.spilled))
+
+        # Tiny memory budget: spill to disk after the first name
+        unique = utils.UniqueNames(iter(names), exclude={'Danio rerio'}, max_memory=1e-6, partitions=3)
+        result = list(unique)
+        self.assertTrue(unique.spilled)
+        self.assertEqual('Homo sapiens', result[0])
+        self.assertListEqual(sorted(set(expected) - {'Danio rerio'}), sorted(result))
+        self.assertEqual((9, 5), (unique.total, unique.unique))
+
+    def test_name_spool(self):
+        spool = utils.NameSpool()
+        for name in ['Homo sapiens', 'Mus musculus']:
+            spool.append(name)
+        self.assertEqual(2, len(spool))
+        self.assertListEqual(['Homo sapiens', 'Mus musculus'], list(spool))
+        spool.append('Danio rerio')
+        self.assertListEqual(['Homo sapiens', 'Mus musculus', 'Danio rerio'], list(spool))
+        spool.clear()
+        self.assertEqual([], list(spool))
+
     def test_checkpoint(self): 
 
-        file_path = ['test/data/test_checkpoint_tax_ids.txt', 'test/data/test_checkpoint_tax_ids_failed.txt']        
-        results = ['Homo sapiens\t9606\tHomo sapiens\tscientific name\t100\t0\tNone\tNone\t0.00016', \
-        'Drosophila sp\t7242\tDrosophila sp.\tincludes\t96\t96\tNone\tNone\t0.03541', \
-            'Mus muskulus\t10090\tMus musculus\tscientific name\t92\t92\tMus muskulus\tMus\t0.09495']
-        failed = ['Homo sapiens', 'Drosophila sp', 'Mus muskulus']
-
-        self.assertEqual(utils.load_checkpoint(file_path, True), (set(), set()))
-        utils.write_checkpoint(file_path, results.copy(), failed.copy(), 3, mode = False)
-        self.assertEqual(utils.load_checkpoint(file_path, False), ({'Mus muskulus', 'Homo sapiens', 'Drosophila sp'}, set()))
-        utils.load_checkpoint(file_path, True)
-        utils.write_checkpoint(file_path, results.copy(), failed.copy(), 3, mode = True)
-        self.assertEqual(utils.load_checkpoint(file_path, False), ({'Mus muskulus', 'Homo sapiens', 'Drosophila sp'}, set(failed)))
+        records = [('Homo sapiens', 9606, 'Homo sapiens', 'scientific name', 100, 0, None, None, 0.00016),
+                   ('Drosophila sp', 7242, 'Drosophila sp.', 'includes', 96, 96, None, None, 0.03541),
+                   ('Mus muskulus', 10090, 'Mus musculus', 'scientific name', 92, 92, 'Mus muskulus', 'Mus', 0.09495)]
+        names = {record[0] for record in records}
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = [os.path.join(folder, 'tax_ids.txt'), os.path.join(folder, 'tax_ids_failed.txt')]
+            self.assertEqual(utils.load_checkpoint(file_path, True), (set(), set()))
+            writer = utils.ResultWriter(file_path, quiet=True)
+            for record in records:
+                writer.put(record)
+            writer.close(3)
+            self.assertEqual(utils.load_checkpoint(file_path, False), (names, set()))
+
+            utils.load_checkpoint(file_path, True)
+            writer = utils.ResultWriter(file_path, quiet=True)
+            for record in records:
+                writer.put(record, failed=True)
+            writer.close(3)
+            self.assertEqual(utils.load_checkpoint(file_path, False), (names, names))
+
+    def test_checkpoint_sidecar(self):
+        records = [('Homo sapiens', 9606, 'Homo sapiens', 'scientific name', 100.0, 0, None, None, None, 0.00016, None),
+                   ('Mus muskulus', None, None, None, 0, 0, 'Mus muskulus', 'Mus', None, 0.09495, None)]
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = [os.path.join(folder, 'tax_ids.tsv'), os.path.join(folder, 'tax_ids_failed.txt')]
+            utils.load_checkpoint(file_path, True)
+            writer = utils.ResultWriter(file_path, flush_interval=60, flush_size=10, quiet=True)
+            writer.put(records[0])
+            writer.put(records[1], failed=True)
+            writer.close()
+
+            sidecar = utils.CheckpointSidecar(file_path)
+            state = sidecar.read_state()
+            self.assertEqual([2, 1], state['counts'])
+            self.assertEqual([os.path.getsize(path) for path in file_path], state['offsets'])
+
+            # Lines written past the sidecar are picked up from the tail
+            for path, line in zip(file_path, ['Danio rerio\t7955\n', 'Danio rerio\n']):
+                with open(path, 'a', encoding='utf-8') as w:
+                    w.write(line)
+            processed, failed = utils.load_checkpoint(file_path, False)
+            self.assertEqual({'Homo sapiens', 'Mus muskulus', 'Danio rerio'}, processed)
+            self.assertEqual({'Mus muskulus', 'Danio rerio'}, failed)
+            self.assertNotIn('Mus musculus', processed)
+            self.assertEqual([3, 2], sidecar.read_state()['counts'])
+
+            # A writer started behind the sidecar leaves it untouched
+            with open(file_path[0], 'a', encoding='utf-8') as w:
+                w.write('Bos taurus\t9913\n')
+            writer = utils.ResultWriter(file_path, quiet=True)
+            writer.put(records[0])
+            writer.close()
+            self.assertEqual([3, 2], sidecar.read_state()['counts'])
+            processed, failed = utils.load_checkpoint(file_path, False)
+            self.assertIn('Bos taurus', processed)
+            self.assertEqual(4, len(processed))
+
+            utils.load_checkpoint(file_path, True)
+            self.assertEqual([0, 0], sidecar.read_state()['counts'])
+
+    def test_result_writer(self):
+        records = [('Homo sapiens', 9606, 'Homo sapiens', 'scientific name', 100.0, 0, None, None, None, 0.00016, None),
+                   ('Mus muskulus', None, None, None, 0, 0, 'Mus muskulus', 'Mus', None, 0.09495, None)]
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = [os.path.join(folder, 'tax_ids.tsv'), os.path.join(folder, 'tax_ids_failed.txt')]
+            writer = utils.ResultWriter(file_path, flush_interval=60, flush_size=10, quiet=True)
+            writer.put(records[0])
+            writer.put(records[1], failed=True)
+            writer.checkpoint(2)
+            writer.close(2)
+
+            with open(file_path[0], encoding='utf-8') as t:
+                self.assertListEqual([utils.format_record(r)+'\n' for r in records], t.readlines())
+            with open(file_path[1], encoding='utf-8') as t:
+                self.assertListEqual(['Mus muskulus\n'], t.readlines())
+
+        self.assertEqual('Mus muskulus\tNone\tNone\tNone\t0\t0\tMus muskulus\tMus\tNone\t0.09495\tNone',
+                         utils.format_record(records[1]))
+
+    def test_result_writer_echo(self):
+        records = [('Homo sapiens', 9606, 'Homo sapiens', 'scientific name', 100.0, 0, None, None, None, 0.00016, None),
+                   ('Mus muskulus', None, None, None, 0, 0, 'Mus muskulus', 'Mus', None, 0.09495, None)]
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = [os.path.join(folder, 'tax_ids.tsv'), os.path.join(folder, 'tax_ids_failed.txt')]
+            # Records are printed by the writer thread, echo() entries are only printed
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                writer = utils.ResultWriter(file_path, flush_interval=60, flush_size=10, echo=True)
+                writer.put(records[0])
+                writer.echo(records[1])
+                writer.echo('Danio rerio')
+                writer.close()
+            self.assertEqual(''.join([utils.format_record(records[0])+'\n', utils.format_record(records[1])+'\n',
+                                      'Danio rerio\n']), stdout.getvalue())
+            with open(file_path[0], encoding='utf-8') as t:
+                self.assertListEqual([utils.format_record(records[0])+'\n'], t.readlines())
+
+            # Without echo nothing is printed
+            with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                writer = utils.ResultWriter(file_path, quiet=True)
+                writer.put(records[0])
+                writer.echo(records[1])
+                writer.close()
+            self.assertEqual('', stdout.getvalue())
+
+    def test_ratio_window(self):
+        rng = random.Random(1)
+        for limit in [60, 80, 95, 100]:
+            for _ in range(2000):
+                word = ''.join(rng.choices('ABC', k=rng.randint(1, 12)))
+                other = ''.join(rng.choices('ABC', k=rng.randint(1, 30)))
+                lowest, highest = utils.ratio_window(len(word), limit)
+                if fuzz.ratio(word, other) >= limit:
+                    self.assertTrue(lowest <= len(other) <= highest)
+        self.assertEqual((0, float('inf')), utils.ratio_window(10, 0))
 
     def test_read_taxid_file(self): 
         self.assertEqual(utils.read_tax_id_file('test/data/tax_id_list.txt'), [9606, 10090])
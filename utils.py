@@ -1,4 +1,16 @@
 import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import queue
+import tempfile
+import threading
+import numpy as np
+
+# Abbreviations completed with a dot by find_trash_words, in upper case
+NORMALIZED_ABBREVIATIONS = {'SP', 'CF', 'PV', 'AFF', 'VAR'}
 
 def shave_name(word:str) -> str | None:
     '''removes last word from string. Returns reduced 
@@ -98,6 +110,16 @@ def find_trash_words(name_sep:list) -> list:
 
     return name_sep, rm1, rm2
 
+def normalize_name(name:str) -> str:
+    '''Returns the key of name used by the normalized exact search: upper
+    case, underscores as spaces (as tidy_name2), quotes removed (as
+    read_line does for the NCBI names), whitespace collapsed (as tidy_name)
+    and the abbreviations of find_trash_words (sp, cf, pv, aff, var)
+    ending with a dot.'''
+
+    words = name.replace('_', ' ').replace('"', '').replace('\'', '').upper().split()
+    return ' '.join(word+'.' if word in NORMALIZED_ABBREVIATIONS else word for word in words)
+
 def read_ali_file(file_name:str) -> list:
     '''To be implemented....'''
 
@@ -105,87 +127,421 @@ def read_ali_file(file_name:str) -> list:
 
     return names
 
-def read_name_file(file_name:str) -> list:
-    '''Reads in file file_name. Returns list containing the lines of the file.'''
+def iter_name_file(file_name:str):
+    '''Reads in file file_name line by line. Yields the stripped lines.'''
 
     with open(file_name, encoding='utf-8') as t:
-        names = t.readlines()
+        for line in t:
+            yield line.strip()
 
-    for i, value in enumerate(names):
-        names[i] = names[i].strip()
+def read_name_file(file_name:str) -> list:
+    '''Reads in file file_name. Returns list containing the lines of the file.'''
 
-    return names
+    return list(iter_name_file(file_name))
+
+class UniqueNames:
+    '''Iterable over the unique names of a stream of names, in order of their
+    first occurrence, using bounded memory. Names are kept in a set until the
+    memory budget is exceeded; all further names not in that set are spilled
+    into hash partitions on disk, which are deduplicated one after another
+    once the input is exhausted. Names in exclude are counted but not yielded.'''
+
+    def __init__(self, names, exclude=(), max_memory:float = 2048, partitions:int = 64):
+        self.names = names
+        self.exclude = exclude
+        self.max_memory = max_memory * 1024**2
+        self.partitions = partitions
+        self.total = 0
+        self.unique = 0
+        self.spilled = False
+
+    def __iter__(self):
+        seen = set()
+        used = 0
+        spill = None
+
+        for name in self.names:
+            self.total += 1
+            if name in seen:
+                continue
+            if spill is None:
+                seen.add(name)
+                # String size plus an estimate for the set entry
+                used += sys.getsizeof(name) + 64
+                self.unique += 1
+                if name not in self.exclude:
+                    yield name
+                if used > self.max_memory:
+                    self.spilled = True
+                    spill = [tempfile.TemporaryFile('w+', encoding='utf-8')
+                             for i in range(self.partitions)]
+            else:
+                spill[zlib.crc32(name.encode('utf-8')) % self.partitions].write(name + '\n')
+
+        if spill is None:
+            return
+
+        # Deduplicate each partition on its own
+        for part_file in spill:
+            part_file.seek(0)
+            part = set()
+            for line in part_file:
+                name = line[:-1]
+                if name in part:
+                    continue
+                part.add(name)
+                self.unique += 1
+                if name not in self.exclude:
+                    yield name
+            part_file.close()
+
+class NameSpool:
+    '''List-like container of names backed by an anonymous temporary file.
+    Supports append, len, clear and iteration, but keeps no names in memory.'''
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile('w+', encoding='utf-8')
+        self.count = 0
+
+    def append(self, name:str):
+        self.file.write(name + '\n')
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.file.flush()
+        self.file.seek(0)
+        for line in self.file:
+            yield line[:-1]
+        self.file.seek(0, os.SEEK_END)
+
+    def clear(self):
+        self.file.seek(0)
+        self.file.truncate()
+        self.count = 0
+
+def format_record(record:tuple) -> str:
+    '''Returns the tab seperated result line of a result record.'''
+    return '\t'.join([str(field) for field in record])
+
+class ResultWriter:
+    """Background writer for result records and failed names.
+
+    Records are passed through a bounded queue to a writer thread, which
+    appends them to the results and failed files in batches. A batch is
+    written once it holds flush_size entries or flush_interval seconds have
+    passed. checkpoint() makes the thread write and fsync both files and
+    update the CheckpointSidecar index. With echo, the thread also prints
+    the records to the screen, so the search loops never wait for stdout.
 
-def write_checkpoint(file_path: str, results: list, failed: list, processed_count: int,
-                     mode:bool = False, quiet:bool=False) -> None:
-    """Write progress to a checkpoint file.
-    
     Parameters
     ----------
-    file_path : str
-        Path to the file to write the ceckpoint to
-    results : list
-        list of sucessful queries
-    failed : list
-        list of failed queries
-    processed_count : int 
-        Number of queries processed
-    mode : bool
-        Mode declares whether to clear both results and 
-        failed lists after writing out the resuluts or 
-        just results. default=False
+    file_path : list
+        Paths to the results file and the failed names file.
+    flush_interval : float
+        Maximal number of seconds between two writes. Default=1.0
+    flush_size : int
+        Number of entries after which a batch is written. Default=500
+    queue_size : int
+        Maximal number of entries waiting in the queue. Default=10000
     quiet : bool
-        States whether to print process to the screen 
-        Default=False
+        States whether to print checkpoints to the screen. Default=False
+    echo : bool
+        States whether to print the records (and echo() entries) to the
+        screen. Default=False
     """
 
-    checkpoint_path = file_path[0]
-    failed_path = file_path[1]
-
-    with open(checkpoint_path, "a", encoding='utf-8') as w:
-        for result in results:
-            if result:
-                w.write(result + "\n")
+    def __init__(self, file_path, flush_interval:float = 1.0, flush_size:int = 500,
+                 queue_size:int = 10000, quiet:bool = False, echo:bool = False):
+        self.file_path = file_path
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.quiet = quiet
+        self.echo_records = echo
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.sidecar = CheckpointSidecar(file_path)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, entry:tuple) -> None:
+        '''Puts entry into the queue. Raises the error of the writer thread
+        instead of blocking forever if the thread has died.'''
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.queue.put(entry, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def put(self, record:tuple, failed:bool = False) -> None:
+        '''Queues a result record. If failed is True, the name (first field)
+        is also written into the failed names file.'''
+        self.enqueue(('record', record, failed))
+
+    def put_failed(self, name:str) -> None:
+        '''Queues a name to be written into the failed names file only.'''
+        self.enqueue(('failed', name, None))
+
+    def echo(self, entry:tuple|str) -> None:
+        '''Queues a record or line to be printed only (if echo is on).'''
+        if self.echo_records:
+            self.enqueue(('echo', entry, None))
+
+    def checkpoint(self, processed_count:int) -> None:
+        '''Queues a checkpoint: all queued entries are written and synced.'''
+        self.enqueue(('checkpoint', processed_count, None))
+
+    def close(self, processed_count:int|None = None) -> None:
+        '''Writes all queued entries, syncs the files and stops the thread.'''
+        self.enqueue(('close', processed_count, None))
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        try:
+            self.write_loop()
+        except Exception as x:
+            self.error = x
+
+    def write_loop(self):
+        results, failed, echoed = [], [], []
+        result_hashes, failed_hashes = [], []
+        last_flush = time.monotonic()
+        with open(self.file_path[0], 'a', encoding='utf-8') as w, \
+            open(self.file_path[1], 'a', encoding='utf-8') as f:
+            base_offsets = [w.tell(), f.tell()]
+            while True:
+                try:
+                    kind, item, is_failed = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    kind = None
+
+                if kind == 'record':
+                    results.append(format_record(item) + '\n')
+                    if self.echo_records:
+                        echoed.append(results[-1])
+                    result_hashes.append(hash_name(str(item[0])))
+                    if is_failed:
+                        failed.append(str(item[0]) + '\n')
+                        failed_hashes.append(hash_name(str(item[0])))
+                elif kind == 'failed':
+                    failed.append(item + '\n')
+                    failed_hashes.append(hash_name(item))
+                elif kind == 'echo':
+                    echoed.append((item if isinstance(item, str) else format_record(item)) + '\n')
+
+                if kind in ['checkpoint', 'close'] \
+                    or len(results) + len(failed) + len(echoed) >= self.flush_size \
+                    or time.monotonic() - last_flush >= self.flush_interval:
+                    w.writelines(results)
+                    f.writelines(failed)
+                    if echoed:
+                        sys.stdout.writelines(echoed)
+                        sys.stdout.flush()
+                    results.clear()
+                    failed.clear()
+                    echoed.clear()
+                    last_flush = time.monotonic()
+
+                if kind in ['checkpoint', 'close']:
+                    w.flush()
+                    f.flush()
+                    os.fsync(w.fileno())
+                    os.fsync(f.fileno())
+                    # The sidecar only ever points at synced data
+                    offsets = [w.tell(), f.tell()]
+                    if base_offsets is not None and self.sidecar.append(
+                        result_hashes, failed_hashes, offsets, base_offsets):
+                        base_offsets = offsets
+                    else:
+                        # Lines past the sidecar are parsed on the next load
+                        base_offsets = None
+                    result_hashes.clear()
+                    failed_hashes.clear()
+                    if item is not None and (self.quiet is False or kind == 'close'):
+                        print(f"Checkpoint saved: {item} names processed.")
+                if kind == 'close':
+                    break
+
+def ratio_window(length:int, limit:float) -> tuple:
+    '''Returns the range of lengths (lowest, highest) of strings that can
+    reach a fuzz.ratio of limit with a string of length length. At least
+    the difference of the lengths has to be inserted or deleted, hence the
+    ratio of lengths a and b is at most 200 * min(a, b) / (a + b). The
+    range is widened by a small tolerance against rounding.'''
+    if limit <= 0:
+        return 0, float('inf')
+    return length * limit / (200 - limit) - 1e-9, length * (200 - limit) / limit + 1e-9
+
+def hash_name(name:str) -> int:
+    '''Returns a stable 64-bit hash of name.'''
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'little')
+
+class CheckpointIndex:
+    '''Read-only set of names stored as a sorted array of 64-bit name
+    hashes. Supports len() and membership tests; comparing it to a set
+    checks that both hold the same names.'''
+
+    def __init__(self, hashes:np.ndarray):
+        hashes = np.sort(hashes)
+        keep = np.ones(len(hashes), dtype=bool)
+        keep[1:] = hashes[1:] != hashes[:-1]
+        self.hashes = hashes[keep]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, name):
+        key = np.uint64(hash_name(name))
+        idx = np.searchsorted(self.hashes, key)
+        return bool(idx < len(self.hashes) and self.hashes[idx] == key)
+
+    def __eq__(self, other):
+        if isinstance(other, CheckpointIndex):
+            return np.array_equal(self.hashes, other.hashes)
+        if isinstance(other, (set, frozenset)):
+            return len(self) == len(other) and all(name in self for name in other)
+        return NotImplemented
+
+    __hash__ = None
+
+class CheckpointSidecar:
+    """
+    Class maintaining the index files next to the checkpoint files.
 
-    if mode is True:
-        with open(failed_path, "a", encoding='utf-8') as f:
-            for name in failed:
-                f.write(name + "\n")
+    For the results and the failed names file the sidecar keeps a binary
+    file of 64-bit name hashes (<file>.idx) and records in a small state
+    file (<results file>.ckpt.json) up to which byte offset each file is
+    covered and how many hashes belong to it. Lines past the recorded
+    offset, e.g. written after the last checkpoint of an interrupted run,
+    are parsed on load and added to the sidecar.
 
-    if quiet is False:
-        print(f"Checkpoint saved: {processed_count} names processed.")
+    Parameters
+    ----------
+    file_path : list
+        Paths to the results file and the failed names file.
+    """
 
-    # Clear the lists to free memory
-    results.clear()
-    if mode:
-        failed.clear()
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.index_path = [path + '.idx' for path in file_path]
+        self.state_path = file_path[0] + '.ckpt.json'
+
+    def read_state(self) -> dict | None:
+        '''Returns the recorded offsets and hash counts of both files, None
+        if the state file is missing or does not match the files on disk.'''
+        try:
+            with open(self.state_path, encoding='utf-8') as t:
+                state = json.load(t)
+        except (OSError, ValueError):
+            return None
+
+        for i in range(2):
+            if not os.path.exists(self.file_path[i]) or not os.path.exists(self.index_path[i]) \
+                or os.path.getsize(self.file_path[i]) < state['offsets'][i] \
+                or os.path.getsize(self.index_path[i]) < state['counts'][i] * 8:
+                return None
+        return state
+
+    def write_state(self, state:dict) -> None:
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as w:
+            json.dump(state, w)
+            w.flush()
+            os.fsync(w.fileno())
+        os.replace(tmp_path, self.state_path)
+
+    def append(self, result_hashes:list, failed_hashes:list, offsets:list,
+               base_offsets:list|None = None, state:dict|None = None) -> bool:
+        '''
+        Appends hashes to the index files and records the new offsets.
+        If base_offsets is given, the sidecar is only updated if it covers
+        exactly the files up to base_offsets, otherwise the lines in
+        between would be missing from the index. Returns whether the
+        sidecar was updated.
+        '''
+        if state is None:
+            state = self.read_state()
+        if state is None or (base_offsets is not None and state['offsets'] != list(base_offsets)):
+            return False
+
+        for i, hashes in enumerate([result_hashes, failed_hashes]):
+            with open(self.index_path[i], 'r+b' if os.path.exists(self.index_path[i]) else 'wb') as w:
+                # Drop hashes written after the last recorded state
+                w.truncate(state['counts'][i] * 8)
+                w.seek(0, os.SEEK_END)
+                w.write(np.asarray(hashes, dtype=np.uint64).tobytes())
+                w.flush()
+                os.fsync(w.fileno())
+            state['counts'][i] += len(hashes)
+        state['offsets'] = list(offsets)
+        self.write_state(state)
+        return True
+
+    def load(self) -> tuple:
+        '''Returns a CheckpointIndex of the processed and of the failed names,
+        parsing only the lines not yet covered by the sidecar.'''
+        state = self.read_state()
+        if state is None:
+            state = {'offsets': [0, 0], 'counts': [0, 0]}
+        tails = []
+        indices = []
+        for i in range(2):
+            hashes = np.empty(0, dtype=np.uint64)
+            if state['counts'][i] > 0:
+                hashes = np.fromfile(self.index_path[i], dtype=np.uint64, count=state['counts'][i])
+            tail = []
+            with open(self.file_path[i], 'rb') as r:
+                r.seek(state['offsets'][i])
+                if state['offsets'][i] == 0 and i == 0:
+                    next(r, None) # header
+                for line in r:
+                    line = line.decode('utf-8')
+                    tail.append(hash_name(line.split("\t")[0] if i == 0 else line.strip()))
+            tails.append(tail)
+            indices.append(CheckpointIndex(np.concatenate([hashes, np.asarray(tail, dtype=np.uint64)])))
+
+        offsets = [os.path.getsize(path) for path in self.file_path]
+        if offsets != state['offsets']:
+            self.append(tails[0], tails[1], offsets, state=state)
+        return tuple(indices)
+
+    def remove(self) -> None:
+        '''Deletes all sidecar files.'''
+        for path in self.index_path + [self.state_path]:
+            if os.path.exists(path):
+                os.remove(path)
 
 def load_checkpoint(file_path, redo):
-    """Load processed names from checkpoint files."""
+    """Load processed names from checkpoint files.
 
-    processed_names = set()
-    failed_names = set()
+    The names are read from the sidecar index maintained by ResultWriter,
+    only lines written after its last update are parsed. Returns two
+    CheckpointIndex objects, for the processed and the failed names.
+    """
 
     checkpoint_path = file_path[0]
     failed_path = file_path[1]
+    sidecar = CheckpointSidecar(file_path)
 
-    if os.path.exists(checkpoint_path) and not redo:
-        with open(checkpoint_path, "r", encoding='utf-8') as r:
-            next(r)
-            for line in r:
-                processed_names.add(line.split("\t")[0])
-    else:
+    if redo or not os.path.exists(checkpoint_path):
+        sidecar.remove()
         with open(checkpoint_path, "w", encoding='utf-8') as w:
             w.write("name\ttax_id\tname_txt\tname_class\tstrict_score\t"
             "relaxed_score\treduced_name\ttmp_name\tmin_name\ttime(s)\n")
 
-    if os.path.exists(failed_path) and not redo:
-        with open(failed_path, "r", encoding='utf-8') as f:
-            for line in f:
-                failed_names.add(line.strip())
-
-    elif os.path.exists(failed_path):
+    if os.path.exists(failed_path) and redo:
         os.remove(failed_path)
+    if not os.path.exists(failed_path):
+        open(failed_path, "w", encoding='utf-8').close()
+
+    processed_names, failed_names = sidecar.load()
 
     if len(processed_names) > 0 or len(failed_names) > 0:
         print(f"\nLoaded {len(processed_names)} processed \
@@ -193,6 +549,18 @@ def load_checkpoint(file_path, redo):
 
     return processed_names, failed_names
 
+def get_rss(pid:int|str = 'self') -> float:
+    '''Returns the resident set size of the current process (or of the
+    process pid) in MB. Reads /proc/<pid>/statm, returns 0 where it is
+    not available.'''
+
+    try:
+        with open(f'/proc/{pid}/statm', encoding='utf-8') as t:
+            pages = int(t.read().split()[1])
+    except OSError:
+        return 0
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
 def read_tax_id_file(file_name:str) -> list:
     ''''Read in file containing tax_ids.
     Returns list of tax_ids (as integers).'''